@@ -0,0 +1,4 @@
+"""Benchmarks for the Model, search and reporting hot paths, run with:
+
+    $ python -m benchmarks --stores 10 --workers 200 --products 5000 --sales 20000
+"""
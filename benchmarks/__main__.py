@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from package.storage import JsonStorage, SegmentStorage
+
+from .cases import run_cases
+from .dataset import build_model
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else 1.0
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<22} {previous['median'] * 1000:>10.3f} ms -> "
+              f"{result['median'] * 1000:>10.3f} ms  x{ratio:.2f} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="TecnoPC benchmarks")
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--storage", choices=["json", "segment"], default="json")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown before a case counts as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    sizes = {"stores": args.stores, "workers": args.workers, "products": args.products,
+             "sales": args.sales, "seed": args.seed}
+    with tempfile.TemporaryDirectory() as directory:
+        if args.storage == "json":
+            def new_storage():
+                return JsonStorage(os.path.join(directory, "data.json"))
+        else:
+            def new_storage():
+                return SegmentStorage(os.path.join(directory, "data"))
+        model = build_model(new_storage(), **sizes)
+        results = run_cases(model, new_storage, args.repeat, args.seed)
+
+    report = {
+        "meta": {
+            **sizes, "storage": args.storage, "repeat": args.repeat, "createdAt": int(time.time()),
+            "python": platform.python_version(), "platform": platform.platform()
+        },
+        "results": results
+    }
+    for name, result in results.items():
+        print(f"{name:<22} median {result['median'] * 1000:>10.3f} ms   "
+              f"min {result['min'] * 1000:>10.3f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        print(f"\nComparing with {args.baseline} (threshold {args.threshold:.0%})")
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
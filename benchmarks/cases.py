@@ -0,0 +1,97 @@
+import itertools
+import random
+import statistics
+import time
+
+from package.model import Manager, Model, Product
+from package.viewmodel import ViewModel
+
+
+def measure(function, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "runs": repeat
+    }
+
+
+def run_cases(model: Model, new_storage, repeat: int, seed: int = 0) -> dict:
+    """Times every hot path against ``model``. ``new_storage`` returns a fresh
+    storage object over the same files, used to time loading."""
+    rng = random.Random(seed)
+    viewmodel = ViewModel(model)
+    stores = model.get_stores()
+    products = model.get_products()
+    store_uuid = stores[-1]["uuid"]
+    product_uuid = products[-1]["uuid"]
+    stocked = itertools.cycle(item["uuid"] for item in stores[-1]["products"])
+    extra = model.add_product(Product("Benchmark", "Extra", "RAM", "", 1))
+    seller = stores[-1]["workers"][0]["uuid"]
+    sold = stores[-1]["products"][0]["uuid"]
+    model.edit_product_stock(store_uuid, sold, 10 ** 6)
+    manager = model.add_manager("11111111-1", Manager("Benchmark", "", "", "", "clave"))
+    token = viewmodel.login("11111111-1", "clave")
+
+    # pylint: disable=W0212
+    results = {
+        "model_init": measure(lambda: Model(new_storage()), repeat),
+        "save_full": measure(lambda: _save_all(model), repeat),
+        "save_one_store": measure(lambda: _save_store(model, store_uuid), repeat),
+        "locate_entity": measure(lambda: model._locate_entity("products", product_uuid), repeat),
+        "add_product_to_store": measure(lambda: _add_and_remove(model, store_uuid, extra), repeat),
+        "edit_product_stock": measure(
+            lambda: model.edit_product_stock(store_uuid, next(stocked), rng.randrange(50)), repeat
+        ),
+        "search": measure(
+            lambda: viewmodel.search_products(category="RAM", max_price=500000), repeat
+        ),
+        "search_brand": measure(lambda: viewmodel.search_products(brand="king"), repeat),
+        "search_uncached": measure(lambda: _uncached(viewmodel.search_products, viewmodel,
+                                                     category="RAM", max_price=500000), repeat),
+        "find_by_specs": measure(
+            lambda: model.find_products("Placa Madre", max_price=150000, socket="AM5"), repeat
+        ),
+        "low_stock": measure(model.low_stock, repeat),
+        "reorder_report": measure(model.reorder_report, repeat),
+        "complete_build": measure(lambda: model.complete_build(store_uuid, 1500000), repeat),
+        "finalize_sale": measure(lambda: _sell(model, store_uuid, seller, sold), repeat),
+        "commissions": measure(viewmodel.get_commissions, repeat),
+        "login": measure(lambda: viewmodel.login("11111111-1", "clave"), repeat),
+        "session_check": measure(lambda: viewmodel.auth.manager_of(token), repeat)
+    }
+    model.delete_product(extra)
+    model.delete_manager(manager)
+    return results
+
+
+# pylint: disable=W0212
+def _save_all(model: Model):
+    model._dirty = {key: set() for key in model.snapshot().collections}
+    model._save()
+
+
+def _save_store(model: Model, store_uuid: str):
+    model._mark_dirty("stores", store_uuid)
+    model._save()
+
+
+def _uncached(method, viewmodel: ViewModel, **kwargs):
+    viewmodel.cache.clear()
+    method(**kwargs)
+
+
+def _sell(model: Model, store_uuid: str, worker_uuid: str, product_uuid: str):
+    cart = model.open_cart(store_uuid, worker_uuid, "Benchmark")
+    model.add_cart_line(cart, product_uuid, 1)
+    model.finalize_cart(cart)
+
+
+def _add_and_remove(model: Model, store_uuid: str, product_uuid: str):
+    model.add_product_to_store(store_uuid, product_uuid)
+    model.delete_product_in_store(store_uuid, product_uuid)
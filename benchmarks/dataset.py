@@ -0,0 +1,16 @@
+from package.model import Model
+
+from .generator import Generator
+
+
+def build_model(storage, stores: int, workers: int, products: int, sales: int,
+                seed: int = 0) -> Model:
+    """Streams a dataset into ``storage`` through its bulk path and opens it. Every
+    store stocks half of the catalog and about ``sales`` sales are spread over the
+    workers' saleCount and recorded in the stores' sales."""
+    # Hire dates are uniform over one year, so the average worker has half a year of sales
+    sales_per_year = round(2 * sales / workers) if workers else 0
+    generator = Generator(stores, workers, products, years=1, sales_per_year=sales_per_year,
+                          stock_share=0.5, seed=seed, ledger=True)
+    storage.bulk_write(generator.collections())
+    return Model(storage)
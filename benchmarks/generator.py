@@ -0,0 +1,372 @@
+"""Deterministic, streaming generator of production-like datasets.
+
+Every record is derived from (seed, kind, index) alone, so any part of the
+dataset can be produced without the rest and nothing is kept in memory between
+records. Spec rows are spooled to temporary files in the same pass that yields
+the products and the spec columns and store ledgers are written as they are
+read or generated (the storages stream iterator values). Example, roughly 10 GB
+with the segment storage:
+
+    $ python -m benchmarks.generator --storage segment --out big --stores 3000 \\
+        --workers 40000 --products 300000 --stock-share 0.11
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+from package.auth import hash_password
+from package.specs import SPEC_FIELDS
+from package.storage import JsonStorage, SegmentStorage
+
+CITIES = [
+    "Arica", "Iquique", "Antofagasta", "Calama", "Copiapó", "La Serena", "Coquimbo",
+    "Valparaíso", "Viña del Mar", "Santiago", "Rancagua", "Talca", "Chillán", "Concepción",
+    "Los Ángeles", "Temuco", "Valdivia", "Osorno", "Puerto Montt", "Coyhaique", "Punta Arenas"
+]
+STREETS = ["Av. Libertad", "Calle Prat", "Av. O'Higgins", "Calle Serrano", "Av. Alemania",
+           "Calle Colón", "Av. Balmaceda", "Calle Maipú", "Av. Costanera", "Calle Freire"]
+NAMES = ["Juan", "Maria", "Carlos", "Camila", "José", "Valentina", "Diego", "Javiera",
+         "Felipe", "Constanza", "Matías", "Catalina", "Benjamín", "Fernanda", "Tomás", "Isidora"]
+LAST_NAMES = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva",
+              "Martínez", "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Araya"]
+# Same categories as View.type, with plausible brands and CLP price ranges
+CATEGORIES = {
+    "RAM": (["Kingston", "Corsair", "G.Skill", "Crucial"], 20000, 300000),
+    "Procesador": (["Intel", "AMD"], 60000, 900000),
+    "Tarjeta Gráfica": (["ASUS", "MSI", "Gigabyte", "Zotac", "Sapphire"], 150000, 2500000),
+    "Placa Madre": (["ASUS", "MSI", "Gigabyte", "ASRock"], 60000, 700000),
+    "SSD": (["Samsung", "Kingston", "Western Digital", "Crucial"], 25000, 400000),
+    "Refrigeración": (["Corsair", "NZXT", "Cooler Master", "Arctic"], 30000, 300000),
+    "Disipador de Calor": (["Noctua", "be quiet!", "Cooler Master", "DeepCool"], 10000, 150000)
+}
+# Spec values per category, sockets and chipsets are kept consistent
+SOCKETS = {"AMD": ["AM4", "AM5"], "Intel": ["LGA1700", "LGA1851"]}
+CHIPSETS = {"AM4": ["B550", "X570"], "AM5": ["B650", "X670"], "LGA1700": ["B760", "Z790"],
+            "LGA1851": ["B860", "Z890"]}
+DAY = 86400
+YEAR = 365 * DAY
+# Receipt numbers reserved for the sales generated in each store
+RECEIPT_STRIDE = 10 ** 7
+
+
+def entity_uuid(seed: int, kind: str, index: int) -> str:
+    digest = hashlib.blake2b(f"{seed}:{kind}:{index}".encode(), digest_size=16).digest()
+    return str(uuid.UUID(bytes=digest, version=4))
+
+
+class Generator:
+    def __init__(self, stores: int, workers: int, products: int, managers: int = 0,
+                 years: int = 3, sales_per_year: int = 600, stock_share: float = 0.2,
+                 seed: int = 0, now: int | None = None, ledger: bool = False):
+        self.stores = stores
+        self.workers = workers
+        self.products = products
+        self.managers = managers
+        self.years = years
+        self.sales_per_year = sales_per_year
+        self.stock_share = stock_share
+        self.seed = seed
+        self.now = now if now is not None else int(time.time())
+        # Whether stores carry one sales record per sale counted in saleCount
+        self.ledger = ledger
+        # Directory of the spec columns written by iter_products, one file per
+        # category and field, and the number of products in them
+        self._spool: str | None = None
+        self._spooled = 0
+
+    def _rng(self, kind: str, index: int | str) -> random.Random:
+        return random.Random(f"{self.seed}:{kind}:{index}")
+
+    def _timestamp(self, rng: random.Random) -> str:
+        return f"{self.now - rng.randrange(self.years * YEAR or 1)}"
+
+    def collections(self) -> dict:
+        return {
+            "products": self.iter_products(),
+            "workers": self.iter_workers(),
+            "managers": self.iter_managers(),
+            "specs": self.iter_spec_tables(),
+            "stores": self.iter_stores(),
+            "receiptBlocks": self.iter_receipt_blocks()
+        }
+
+    def iter_products(self):
+        # Every pass also writes the spec rows, for iter_spec_tables
+        self._start_spool()
+        files = {}
+        try:
+            for i in range(self.products):
+                product = self._product(i)
+                category = product["category"]
+                if category in SPEC_FIELDS:
+                    row = {"uuid": product["uuid"], **self._specs(i, product)}
+                    for field in ("uuid", *SPEC_FIELDS[category]):
+                        file = files.get((category, field))
+                        if file is None:
+                            file = files[category, field] = open(  # pylint: disable=R1732
+                                self._column_path(category, field), "w", encoding="utf-8")
+                        file.write(json.dumps(row.get(field)) + "\n")
+                yield product
+                self._spooled = i + 1
+        finally:
+            for file in files.values():
+                file.close()
+
+    def _product(self, i: int) -> dict:
+        rng = self._rng("product", i)
+        category = rng.choice(list(CATEGORIES))
+        brands, low, high = CATEGORIES[category]
+        return {
+            "uuid": entity_uuid(self.seed, "product", i),
+            "brand": rng.choice(brands),
+            "model": f"{category[:3].upper()}-{i:06d}",
+            "category": category,
+            "description": f"{category} generado #{i}",
+            "price": rng.randrange(low, high, 10),
+            "createdAt": self._timestamp(rng),
+            "updatedAt": None
+        }
+
+    def iter_spec_tables(self):
+        # Columns are read back from the spool of the products pass, which only
+        # runs here when the products were not written first
+        if self._spool is None or self._spooled < self.products:
+            for _ in self.iter_products():
+                pass
+        try:
+            for category, fields in SPEC_FIELDS.items():
+                if os.path.exists(self._column_path(category, "uuid")):
+                    yield {"category": category,
+                           **{field: self._column(category, field)
+                              for field in ("uuid", *fields)}}
+        finally:
+            shutil.rmtree(self._spool, ignore_errors=True)
+            self._spool, self._spooled = None, 0
+
+    def _start_spool(self):
+        if self._spool is not None:
+            shutil.rmtree(self._spool, ignore_errors=True)
+        self._spool = tempfile.mkdtemp(prefix="specs-")
+        self._spooled = 0
+
+    def _column_path(self, category: str, field: str) -> str:
+        return os.path.join(self._spool, f"{list(SPEC_FIELDS).index(category)}-{field}.jsonl")
+
+    def _column(self, category: str, field: str):
+        with open(self._column_path(category, field), encoding="utf-8") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def _specs(self, i: int, product: dict) -> dict:
+        rng = self._rng("specs", i)
+        category = product["category"]
+        if category == "RAM":
+            speed = rng.choice([3200, 3600, 5600, 6000])
+            return {"capacity": rng.choice([8, 16, 32, 64]), "speed": speed,
+                    "memoryType": "DDR5" if speed >= 5600 else "DDR4"}
+        if category == "Procesador":
+            return {"cores": rng.choice([4, 6, 8, 12, 16]), "speed": rng.choice([3.2, 3.8, 4.4]),
+                    "socket": rng.choice(SOCKETS[product["brand"]]),
+                    "tdp": rng.choice([65, 105, 125, 170])}
+        if category == "Tarjeta Gráfica":
+            return {"vram": rng.choice([8, 12, 16, 24]),
+                    "memoryType": rng.choice(["GDDR6", "GDDR6X", "GDDR7"])}
+        if category == "Placa Madre":
+            socket = rng.choice(list(CHIPSETS))
+            return {"socket": socket, "formFactor": rng.choice(["ATX", "Micro-ATX", "Mini-ITX"]),
+                    "chipset": rng.choice(CHIPSETS[socket]),
+                    "memoryType": "DDR4" if socket == "AM4" else "DDR5"}
+        if category == "SSD":
+            return {"capacity": rng.choice([500, 1000, 2000, 4000]),
+                    "readSpeed": rng.choice([3500, 5000, 7000]),
+                    "writeSpeed": rng.choice([3000, 4500, 6500])}
+        if category == "Refrigeración":
+            return {"coolingType": rng.choice(["Aire", "Líquida"]),
+                    "tdp": rng.choice([100, 150, 200, 250])}
+        return {"material": rng.choice(["Cobre", "Aluminio"]),
+                "dimensions": rng.choice(["120x120x25", "140x140x30", "92x92x20"])}
+
+    def iter_workers(self):
+        for i in range(self.workers):
+            rng = self._rng("worker", i)
+            name, last_name = rng.choice(NAMES), rng.choice(LAST_NAMES)
+            yield {
+                "uuid": entity_uuid(self.seed, "worker", i),
+                "name": name,
+                "lastName": last_name,
+                "phone": f"9{rng.randrange(10 ** 7, 10 ** 8)}",
+                "mail": f"{name.lower()}.{last_name.lower()}{i}@tecnopc.cl",
+                "createdAt": self._timestamp(rng),
+                "updatedAt": None
+            }
+
+    def iter_managers(self):
+        for i in range(self.managers):
+            rng = self._rng("manager", i)
+            name, last_name = rng.choice(NAMES), rng.choice(LAST_NAMES)
+            yield {
+                "uuid": entity_uuid(self.seed, "manager", i),
+                "identification": _rut(rng.randrange(5 * 10 ** 6, 25 * 10 ** 6)),
+                "name": name,
+                "lastName": last_name,
+                "phone": f"9{rng.randrange(10 ** 7, 10 ** 8)}",
+                "mail": f"{name.lower()}.{last_name.lower()}{i}@it.tecnopc.cl",
+                "password": hash_password(f"clave{rng.randrange(10 ** 6)}", rng.randbytes(16)),
+                "createdAt": self._timestamp(rng),
+                "updatedAt": None
+            }
+
+    def iter_stores(self):
+        for i in range(self.stores):
+            rng = self._rng("store", i)
+            city = rng.choice(CITIES)
+            workers = list(self._store_workers(i, rng))
+            stocked = list(self._store_products(rng))
+            store = {
+                "uuid": entity_uuid(self.seed, "store", i),
+                "name": f"Tienda {city} {i}",
+                "address": f"{rng.choice(STREETS)} {rng.randrange(1, 9999)}",
+                "city": city,
+                "phone": f"2{rng.randrange(10 ** 7, 10 ** 8)}",
+                "mail": f"tienda{i}@tecnopc.cl",
+                "workers": workers,
+                "products": [item for _, item in stocked],
+                "createdAt": self._timestamp(rng),
+                "updatedAt": None
+            }
+            if self.ledger:
+                store["sales"] = self._store_sales(i, workers, [index for index, _ in stocked])
+            yield store
+
+    def iter_receipt_blocks(self):
+        if not self.ledger:
+            return
+        for i in range(self.stores):
+            yield {
+                "terminal": f"tienda{i}",
+                "start": i * RECEIPT_STRIDE + 1,
+                "end": (i + 1) * RECEIPT_STRIDE,
+                "createdAt": f"{self.now}"
+            }
+
+    def _store_workers(self, store: int, rng: random.Random):
+        # Worker n belongs to store n % stores
+        for index in range(store, self.workers, self.stores):
+            hired_at = self.now - rng.randrange(self.years * YEAR or 1)
+            yield {
+                "uuid": entity_uuid(self.seed, "worker", index),
+                "hiredAt": hired_at - hired_at % DAY,
+                "saleCount": max(0, round(rng.gauss(1, 0.3) * self.sales_per_year
+                                          * (self.now - hired_at) / YEAR)),
+                "createdAt": f"{hired_at}",
+                "updatedAt": None
+            }
+
+    def _store_products(self, rng: random.Random):
+        # Geometric skips pick each product with probability stock_share in
+        # O(stocked items) instead of O(catalog)
+        if self.stock_share <= 0:
+            return
+        index = -1
+        log_miss = math.log(1 - self.stock_share) if self.stock_share < 1 else None
+        while True:
+            index += 1 if log_miss is None else 1 + int(math.log(1 - rng.random()) / log_miss)
+            if index >= self.products:
+                return
+            yield index, {
+                "uuid": entity_uuid(self.seed, "product", index),
+                "inStock": rng.randrange(0, 60),
+                "reorderAt": rng.choice((None, 5, 10)),
+                "createdAt": self._timestamp(rng),
+                "updatedAt": None
+            }
+
+    def _store_sales(self, store: int, workers: list[dict], stocked: list[int]):
+        # One to three lines per sale from the store's catalog, numbered in date
+        # order from the store's receipt block. The dates of each worker come out
+        # in order, so merging them gives the ledger one sale at a time
+        rng = self._rng("sales", store)
+        if not stocked:
+            return
+        prices: dict[int, int] = {}
+        dated = heapq.merge(*(self._sale_dates(store, worker) for worker in workers))
+        for receipt, (created_at, worker_uuid) in enumerate(dated, store * RECEIPT_STRIDE + 1):
+            lines = []
+            for index in rng.sample(stocked, min(len(stocked), rng.randint(1, 3))):
+                if index not in prices:
+                    prices[index] = self._product(index)["price"]
+                lines.append({
+                    "productUuid": entity_uuid(self.seed, "product", index),
+                    "quantity": rng.randint(1, 2),
+                    "price": prices[index]
+                })
+            yield {
+                "uuid": entity_uuid(self.seed, f"sale-{store}", receipt),
+                "receipt": receipt,
+                "terminal": f"tienda{store}",
+                "workerUuid": worker_uuid,
+                "client": f"{rng.choice(NAMES)} {rng.choice(LAST_NAMES)}",
+                "lines": lines,
+                "total": sum(line["price"] * line["quantity"] for line in lines),
+                "createdAt": f"{created_at}"
+            }
+
+    def _sale_dates(self, store: int, worker: dict):
+        # saleCount uniform dates between the hire and now in ascending order: the
+        # smallest of n uniforms in [0, 1) is 1 - U ** (1 / n), the next one is the
+        # smallest of n - 1 in what is left, and so on
+        rng = self._rng(f"sales-{store}", worker["uuid"])
+        hired_at = int(worker["createdAt"])
+        span = self.now + 1 - hired_at
+        position = 0.0
+        for left in range(worker["saleCount"], 0, -1):
+            position += (1 - position) * (1 - rng.random() ** (1 / left))
+            yield hired_at + min(int(position * span), span - 1), worker["uuid"]
+
+
+def _rut(number: int) -> str:
+    total, factor = 0, 2
+    for digit in reversed(str(number)):
+        total += int(digit) * factor
+        factor = 2 if factor == 7 else factor + 1
+    check = 11 - total % 11
+    return f"{number}-{'0' if check == 11 else 'K' if check == 10 else check}"
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.generator",
+                                     description="Generates a synthetic TecnoPC dataset")
+    parser.add_argument("--out", required=True, help="data.json path or segment directory")
+    parser.add_argument("--storage", choices=["json", "segment"], default="segment")
+    parser.add_argument("--stores", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--managers", type=int, default=50)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--sales-per-year", type=int, default=600)
+    parser.add_argument("--stock-share", type=float, default=0.2,
+                        help="Share of the catalog each store stocks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ledger", action="store_true",
+                        help="Also generate one sales record per counted sale")
+    parser.add_argument("--now", type=int, help="Reference epoch, fix it for byte-identical output")
+    args = parser.parse_args()
+
+    generator = Generator(args.stores, args.workers, args.products, args.managers, args.years,
+                          args.sales_per_year, args.stock_share, args.seed, args.now, args.ledger)
+    storage = JsonStorage(args.out) if args.storage == "json" else SegmentStorage(args.out)
+    start = time.perf_counter()
+    storage.bulk_write(generator.collections())
+    print(f"Generated {args.out} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Scaling of the end of month report with the number of processes.
+
+    $ python -m benchmarks.reports --stores 16 --sales 400000 --processes 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from package.storage import SegmentStorage
+
+from .cases import measure
+from .dataset import build_model
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.reports",
+                                     description="Monthly report, serial against process pools")
+    parser.add_argument("--stores", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=320)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = build_model(SegmentStorage(os.path.join(directory, "data")), args.stores,
+                            args.workers, args.products, args.sales, args.seed)
+        # The whole year, so every sale of the dataset is counted
+        end = int(time.time()) + 1
+        start = end - 366 * 86400
+        # In this process over the loaded snapshot, no shard is parsed
+        serial = measure(lambda: model.summarize_sales(start, end, max_workers=0), args.repeat)
+        print(f"{'in process':<12} median {serial['median'] * 1000:>10.3f} ms")
+        for processes in args.processes:
+            # The first call starts the Model's pool, the timed ones reuse it like
+            # the reports after the first do
+            model.summarize_sales(start, end, processes)
+            result = measure(
+                lambda processes=processes: model.summarize_sales(start, end, processes),
+                args.repeat
+            )
+            print(f"{processes:>2} processes median {result['median'] * 1000:>10.3f} ms   "
+                  f"x{serial['median'] / result['median']:.2f} of in process")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,50 @@
-# pylint: disable=C0114,I1101
-import sys
-
-from package import Model, View, ViewModel
-
-if __name__ == "__main__":
-    from PySide6 import QtWidgets
-
-    app = QtWidgets.QApplication(sys.argv)
-    model = Model()
-    viewmodel = ViewModel(model)
-    view = View(viewmodel)
-
-    view.show()
-    # dudar de dejarlo -
-    #  Crear datos de ejemplo
-    # tiendas, vendedores = crear_datos_ejemplo()
-    # Crear controladores
-    # controlador_inventario = InventarioController(tiendas)
-    # controlador_ventas = VentaController()
-    # Crear y mostrar la interfaz
-    # ventana = InterfazTienda(controlador_inventario, controlador_ventas, tiendas, vendedores)
-    # ventana.show()
-    # ---
-
-    sys.exit(app.exec())
+# pylint: disable=C0114,I1101
+import argparse
+import sys
+
+from package import Model, ViewModel, metrics, migrate_json, profiling
+from package.view import View
+
+if __name__ == "__main__":
+    from PySide6 import QtWidgets
+
+    parser = argparse.ArgumentParser(description="TecnoPC")
+    parser.add_argument("--metrics", nargs="?", const="", metavar="ARCHIVO.prom",
+                        help="Mide las operaciones y al salir muestra el resumen "
+                             "(y lo exporta en formato Prometheus si se da un archivo)")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="CARPETA",
+                        help="Guarda un perfil (collapsed stacks, para flame graphs) de cada "
+                             "accion de la interfaz en CARPETA (por defecto profiles/)")
+    parser.add_argument("--slow-ms", type=float, default=200.0,
+                        help="Con --profile, avisa de las acciones que tarden mas que esto")
+    args, qt_args = parser.parse_known_args()
+    if args.metrics is not None:
+        metrics.enable()
+    if args.profile is not None:
+        profiling.enable(args.profile, slow_ms=args.slow_ms)
+
+    app = QtWidgets.QApplication([sys.argv[0], *qt_args])
+    if migrate_json():
+        print("data.json se paso a data/ (queda como data.json.migrated)")
+    model = Model()
+    viewmodel = ViewModel(model)
+    view = View(viewmodel)
+
+    view.show()
+    # dudar de dejarlo -
+    #  Crear datos de ejemplo
+    # tiendas, vendedores = crear_datos_ejemplo()
+    # Crear controladores
+    # controlador_inventario = InventarioController(tiendas)
+    # controlador_ventas = VentaController()
+    # Crear y mostrar la interfaz
+    # ventana = InterfazTienda(controlador_inventario, controlador_ventas, tiendas, vendedores)
+    # ventana.show()
+    # ---
+
+    exit_code = app.exec()
+    if args.metrics is not None:
+        print(metrics.dump())
+        if args.metrics:
+            metrics.export_prometheus(args.metrics)
+    sys.exit(exit_code)
@@ -1,3 +1,11 @@
 from .model import Model
-from .view import View
+from .storage import JsonStorage, SegmentStorage, default_storage, migrate_json
 from .viewmodel import ViewModel
+
+
+def __getattr__(name):
+    # The view needs PySide6, headless entry points (package.server) must not import it
+    if name == "View":
+        from .view import View  # pylint: disable=C0415
+        return View
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,145 @@
+"""Append-only log of who changed which field of which entity, and when.
+
+Entries go to one JSON-lines file per month (``audit/2025-06.jsonl``), so a
+time range only opens the months it covers. Each month has an index of the
+lines of every entity (and of every store, for changes to its nested workers
+and products) plus the first line of every day, so "changes to store X last
+month" parses only those lines. Months older than the retention are
+compressed with gzip and get their index written next to them; the open
+months are indexed incrementally as lines are appended, by this process or
+another.
+"""
+import gzip
+import json
+import os
+import time
+
+from . import metrics
+
+# Fields whose values are never written to the log
+REDACTED = frozenset({"password"})
+
+
+class AuditLog:
+    def __init__(self, directory: str, retention_days: int = 90):
+        self.directory = directory
+        self.retention_days = retention_days
+        # month -> {"offset", "lines", "entities", "days"} of the open months
+        self._indexes: dict[str, dict] = {}
+
+    def append(self, entries: list[dict]):
+        """Writes entries ``{at, actor, key, entity, parent, changes}``. Callers
+        that share the directory must hold the storage lock."""
+        by_month: dict[str, list[str]] = {}
+        for entry in entries:
+            line = json.dumps(entry, separators=(",", ":"), default=str)
+            by_month.setdefault(_month(entry["at"]), []).append(line)
+        os.makedirs(self.directory, exist_ok=True)
+        for month, lines in by_month.items():
+            data = "".join(f"{line}\n" for line in lines).encode()
+            with open(self._path(month), "ab") as file:
+                file.write(data)
+            metrics.count("audit.bytes_written", len(data))
+
+    def query(self, entity: str | None = None, start: int | None = None,
+              end: int | None = None) -> list[dict]:
+        """Entries of ``entity`` (or of a store's nested records) between start and
+        end inclusive, oldest first."""
+        end = end if end is not None else int(time.time())
+        months = sorted(
+            name.split(".")[0] for name in self._files()
+            if (start is None or name[:7] >= _month(start)) and name[:7] <= _month(end)
+        )
+        entries = []
+        for month in dict.fromkeys(months):
+            index, lines = self._open(month)
+            if entity is not None:
+                numbers = index["entities"].get(entity, [])
+            else:
+                first = 0
+                if start is not None:
+                    days = [day for day in index["days"] if day >= _day(start)]
+                    first = index["days"][min(days)] if days else len(lines)
+                numbers = range(first, len(lines))
+            for number in numbers:
+                entry = json.loads(lines[number])
+                if (start is None or entry["at"] >= start) and entry["at"] <= end:
+                    entries.append(entry)
+        return entries
+
+    def rotate(self, now: int | None = None):
+        """Compresses the months that ended more than retention_days ago."""
+        limit = _month((now if now is not None else int(time.time()))
+                       - self.retention_days * 86400)
+        for name in self._files():
+            month = name.split(".")[0]
+            if not name.endswith(".jsonl") or month >= limit:
+                continue
+            index, lines = self._open(month)
+            compressed = os.path.join(self.directory, f"{month}.jsonl.gz")
+            with gzip.open(f"{compressed}.tmp", "wb") as file:
+                file.writelines(lines)
+            with open(os.path.join(self.directory, f"{month}.index.json.tmp"), "w",
+                      encoding="utf-8") as file:
+                json.dump({"entities": index["entities"], "days": index["days"]}, file)
+            os.replace(os.path.join(self.directory, f"{month}.index.json.tmp"),
+                       os.path.join(self.directory, f"{month}.index.json"))
+            os.replace(f"{compressed}.tmp", compressed)
+            os.remove(self._path(month))
+            self._indexes.pop(month, None)
+
+    def _files(self) -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [name for name in names if name.endswith((".jsonl", ".jsonl.gz"))]
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.directory, f"{month}.jsonl")
+
+    def _open(self, month: str) -> tuple[dict, list[bytes]]:
+        path = self._path(month)
+        if not os.path.exists(path):
+            with gzip.open(f"{path}.gz", "rb") as file:
+                lines = file.readlines()
+            with open(os.path.join(self.directory, f"{month}.index.json"),
+                      encoding="utf-8") as file:
+                return json.load(file), lines
+        with open(path, "rb") as file:
+            data = file.read()
+        index = self._indexes.setdefault(
+            month, {"offset": 0, "lines": 0, "entities": {}, "days": {}}
+        )
+        # Only whole lines are indexed, a line still being written waits
+        complete = data.rfind(b"\n") + 1
+        for line in data[index["offset"]:complete].splitlines():
+            entry = json.loads(line)
+            for entity in (entry["entity"], entry.get("parent")):
+                if entity is not None:
+                    index["entities"].setdefault(entity, []).append(index["lines"])
+            index["days"].setdefault(_day(entry["at"]), index["lines"])
+            index["lines"] += 1
+        index["offset"] = complete
+        return index, data[:complete].splitlines()
+
+
+def diff(before: dict | None, after: dict | None, ignore=("uuid", "updatedAt")) -> dict:
+    """{field: [old, new]} of the scalar fields that differ."""
+    before, after = before or {}, after or {}
+    changes = {}
+    for field in dict.fromkeys([*before, *after]):
+        old, new = before.get(field), after.get(field)
+        nested = isinstance(old, (list, tuple)) or isinstance(new, (list, tuple))
+        if field in ignore or old == new or nested:
+            continue
+        changes[field] = ["***", "***"] if field in REDACTED else [old, new]
+    return changes
+
+
+def _month(timestamp: int) -> str:
+    return time.strftime("%Y-%m", time.gmtime(timestamp))
+
+
+def _day(timestamp: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
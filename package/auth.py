@@ -0,0 +1,103 @@
+"""Manager authentication.
+
+Passwords are stored as ``scrypt$n$r$p$salt$hash`` (base64 salt and hash) and
+checked in constant time. A login costs one scrypt (about 50 ms with the
+defaults), so it hands out a session token that later privileged actions check
+with a dictionary lookup until it expires.
+"""
+import base64
+import functools
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+# Cost parameters, scrypt uses 128 * SCRYPT_R * SCRYPT_N bytes (16 MB) per hash
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SESSION_TTL = 15 * 60
+
+
+def hash_password(password: str, salt: bytes | None = None, n: int = SCRYPT_N,
+                  r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    salt = salt if salt is not None else secrets.token_bytes(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                            maxmem=256 * r * n, dklen=32)
+    return (f"scrypt${n}${r}${p}${base64.b64encode(salt).decode()}$"
+            f"{base64.b64encode(digest).decode()}")
+
+
+def is_hashed(password: str | None) -> bool:
+    return bool(password) and password.startswith("scrypt$")
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        # Plain text from before hashing, Authenticator rehashes it on login
+        return hmac.compare_digest(password.encode(), (stored or "").encode())
+    _, n, r, p, salt, _ = stored.split("$")
+    expected = hash_password(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(expected.encode(), stored.encode())
+
+
+@functools.cache
+def _dummy_hash() -> str:
+    # Checked against unknown identifications so they take as long as wrong passwords
+    return hash_password("", b"\0" * 16)
+
+
+class Authenticator:
+    def __init__(self, model, ttl: float = SESSION_TTL):
+        self._model = model
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions: dict[str, tuple[str, float]] = {}
+        self._index_version = -1
+        self._index: dict[str, dict] = {}
+
+    def login(self, identification: str, password: str) -> str | None:
+        """Session token of the manager, None if the credentials are wrong."""
+        manager = self._find(identification)
+        if manager is None:
+            verify_password(password, _dummy_hash())
+            return None
+        if not verify_password(password, manager["password"]):
+            return None
+        if not is_hashed(manager["password"]):
+            self._model.set_manager_password(manager["uuid"], password)
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            for expired in [key for key, value in self._sessions.items() if value[1] < now]:
+                del self._sessions[expired]
+            self._sessions[token] = (manager["uuid"], now + self.ttl)
+        return token
+
+    def manager_of(self, token: str) -> str | None:
+        """Manager uuid of a live session. Each use extends it by ttl."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if session[1] < now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (session[0], now + self.ttl)
+        return session[0]
+
+    def logout(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def _find(self, identification: str) -> dict | None:
+        # identification -> manager, rebuilt only when the managers change
+        snapshot = self._model.snapshot()
+        version = snapshot.versions.get("managers", 0)
+        if version != self._index_version:
+            index = {manager["identification"]: manager for manager in snapshot["managers"]}
+            with self._lock:
+                self._index, self._index_version = index, version
+        return self._index.get(identification)
@@ -0,0 +1,273 @@
+"""Online incremental backups and verified restores.
+
+A backup is taken from a Snapshot: it never changes after being published, so
+it is a consistent point in time and writers go on publishing new ones while
+it is written. Each backup is a gzip of JSON lines with the changes since the
+previous one:
+
+    {"op": "put", "key": "products", "record": {...}}
+    {"op": "delete", "key": "products", "uuid": "..."}
+    {"op": "set", "key": "receiptBlocks", "records": [...]}  collections without ids
+    {"op": "put", "key": "stores.sales", "store": "...", "record": {...}}
+
+Stores are split in their own fields and their nested products, workers and
+sales, so a sale backs up the sale and the records it touched, not the store.
+Records that did not change are the same objects in both snapshots, so finding
+the changes costs a pointer comparison per record; only the first backup of a
+process, without a previous snapshot in memory, rebuilds it from the files.
+
+``index.json`` lists the backups with the sha256 and the record counts of each;
+restore checks both before and after writing the data back.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections.abc import Mapping
+
+from . import metrics
+from .locking import FileLock
+
+INDEX = "index.json"
+NESTED = ("products", "workers", "sales")
+
+
+class BackupSet:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = FileLock(os.path.join(directory, "lock"))
+        # (number, collections) of the last backup written or read by this process
+        self._base: tuple[int, Mapping[str, tuple]] | None = None
+
+    def backups(self) -> list[dict]:
+        return self._index()["backups"]
+
+    def backup(self, collections: Mapping[str, tuple], full: bool = False) -> dict:
+        """Writes the changes of ``collections`` since the last backup (every
+        record with ``full``, which starts a new chain). Returns its index entry."""
+        with self._lock:
+            index = self._index()
+            last = index["backups"][-1]["number"] if index["backups"] else 0
+            if full or not last:
+                base: Mapping[str, tuple] = {}
+            elif self._base is not None and self._base[0] == last:
+                base = self._base[1]
+            else:
+                base = self._replay(index, last)
+            number = last + 1
+            name = f"{number:06d}.jsonl.gz"
+            path = os.path.join(self.directory, name)
+            digest = hashlib.sha256()
+            changes = 0
+            with open(f"{path}.tmp", "wb") as raw:
+                with gzip.open(_Hashing(raw, digest), "wt", encoding="utf-8") as file:
+                    for operation in _changes(base, collections):
+                        file.write(json.dumps(operation, separators=(",", ":")))
+                        file.write("\n")
+                        changes += 1
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(f"{path}.tmp", path)
+            entry = {
+                "number": number,
+                "file": name,
+                "full": full or not last,
+                "createdAt": int(time.time()),
+                "changes": changes,
+                "bytes": os.path.getsize(path),
+                "sha256": digest.hexdigest(),
+                "counts": _counts(collections)
+            }
+            index["backups"].append(entry)
+            self._write_index(index)
+            metrics.count("backup.bytes_written", entry["bytes"])
+            self._base = (number, collections)
+            return entry
+
+    def restore(self, storage, number: int | None = None) -> dict:
+        """Writes the data as of backup ``number`` (the last by default) to
+        ``storage`` and checks it. Returns the record counts."""
+        with self._lock:
+            index = self._index()
+            if not index["backups"]:
+                raise ValueError("No backups")
+            number = number if number is not None else index["backups"][-1]["number"]
+            entry = next((item for item in index["backups"] if item["number"] == number), None)
+            if entry is None:
+                raise ValueError("Backup not found")
+            data = self._replay(index, number)
+        if _counts(data) != entry["counts"]:
+            raise ValueError("Restored data does not match the backup")
+        storage.bulk_write({key: list(records) for key, records in data.items()})
+        with storage.lock():
+            restored = storage.load()
+        if _counts({key: tuple(records) for key, records in restored.items()}) != entry["counts"]:
+            raise ValueError("Restored data does not match the backup")
+        return entry["counts"]
+
+    def _replay(self, index: dict, number: int) -> dict[str, tuple]:
+        # Applies the backups from the last full one up to ``number``, checking each file
+        chain = [entry for entry in index["backups"] if entry["number"] <= number]
+        start = max((i for i, entry in enumerate(chain) if entry["full"]), default=0)
+        state = _State()
+        for entry in chain[start:]:
+            path = os.path.join(self.directory, entry["file"])
+            with open(path, "rb") as raw:
+                content = raw.read()
+            if hashlib.sha256(content).hexdigest() != entry["sha256"]:
+                raise ValueError(f"Backup {entry['number']} is corrupt")
+            for line in gzip.decompress(content).splitlines():
+                state.apply(json.loads(line))
+        return state.collections()
+
+    def _index(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, INDEX), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"version": 1, "backups": []}
+
+    def _write_index(self, index: dict):
+        path = os.path.join(self.directory, INDEX)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(index, file, indent=1)
+        os.replace(f"{path}.tmp", path)
+
+
+class _Hashing:
+    # Binary file wrapper that hashes what is written through it
+    def __init__(self, file, digest):
+        self._file = file
+        self._digest = digest
+
+    def write(self, data) -> int:
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+
+class _State:
+    def __init__(self):
+        self._collections: dict[str, dict | list] = {}
+        self._nested: dict[str, dict[str, dict]] = {}
+
+    def apply(self, operation: dict):
+        op, key = operation["op"], operation["key"]
+        if op == "set":
+            self._collections[key] = list(operation["records"])
+        elif key.startswith("stores."):
+            records = self._nested[operation["store"]][key.split(".")[1]]
+            if op == "put":
+                records[_id(operation["record"])] = operation["record"]
+            else:
+                records.pop(operation["uuid"], None)
+        else:
+            records = self._collections.get(key)
+            if not isinstance(records, dict):
+                # Absent, or kept empty with a "set"
+                records = self._collections[key] = {}
+            if op == "put":
+                record = operation["record"]
+                records[_id(record)] = record
+                if key == "stores":
+                    self._nested.setdefault(record["uuid"], {name: {} for name in NESTED})
+            else:
+                records.pop(operation["uuid"], None)
+                if key == "stores":
+                    self._nested.pop(operation["uuid"], None)
+
+    def collections(self) -> dict[str, tuple]:
+        data = {}
+        for key, records in self._collections.items():
+            if isinstance(records, list):
+                data[key] = tuple(records)
+            elif key == "stores":
+                data[key] = tuple(
+                    {**store, **{name: tuple(self._nested[store["uuid"]][name].values())
+                                 for name in NESTED if name in store}}
+                    for store in records.values()
+                )
+            else:
+                data[key] = tuple(records.values())
+        return data
+
+
+def _changes(base: Mapping[str, tuple], collections: Mapping[str, tuple]):
+    for key, records in collections.items():
+        previous = base.get(key)
+        if previous is records:
+            continue
+        # Empty collections are kept too, so restore writes every key back
+        if previous is None and not records or any(_id(record) is None
+                                                  for record in records):
+            if previous is None or not _same(list(previous), list(records)):
+                yield {"op": "set", "key": key, "records": records}
+            continue
+        old = {_id(record): record for record in previous or ()}
+        for record in records:
+            before = old.pop(_id(record), None)
+            if key == "stores":
+                yield from _store_changes(before, record)
+            elif not _same(before, record):
+                yield {"op": "put", "key": key, "record": record}
+        for record_id in old:
+            yield {"op": "delete", "key": key, "uuid": record_id}
+    for key in base:
+        if key not in collections:
+            yield {"op": "set", "key": key, "records": ()}
+
+
+def _store_changes(before: dict | None, store: dict):
+    if before is store:
+        return
+    fields = {name: value for name, value in store.items() if name not in NESTED}
+    # Nested lists are marked as present with an empty value, their items follow
+    header = {**fields, **{name: () for name in NESTED if name in store}}
+    # A nested list added after the last header (the first sale of a store) needs a
+    # new header too, replay only keeps the lists the header marks as present
+    if before is None or [name in before for name in NESTED] != [
+            name in store for name in NESTED] or not _same(
+                {name: value for name, value in before.items() if name not in NESTED}, fields):
+        yield {"op": "put", "key": "stores", "record": header}
+    for name in NESTED:
+        old, new = (before or {}).get(name, ()), store.get(name, ())
+        if old is new:
+            continue
+        if name == "sales" and old and len(new) >= len(old) and (
+                _same(new[len(old) - 1], old[-1])):
+            # The ledger is append-only, only its tail can be new
+            old, new = (), new[len(old):]
+        previous = {record["uuid"]: record for record in old}
+        for record in new:
+            item = previous.pop(record["uuid"], None)
+            if not _same(item, record):
+                yield {"op": "put", "key": f"stores.{name}", "store": store["uuid"],
+                       "record": record}
+        for record_id in previous:
+            yield {"op": "delete", "key": f"stores.{name}", "store": store["uuid"],
+                   "uuid": record_id}
+
+
+def _same(before, after) -> bool:
+    # Records read back from a backup have lists where the snapshot has tuples
+    return before is after or before == after or before is not None and (
+        json.dumps(before, sort_keys=True) == json.dumps(after, sort_keys=True))
+
+
+def _id(record: dict) -> str | None:
+    # Spec tables are keyed by category, their "uuid" is a column
+    for field in ("uuid", "category"):
+        if isinstance(record.get(field), str):
+            return record[field]
+    return None
+
+
+def _counts(collections: Mapping[str, tuple]) -> dict[str, int]:
+    counts = {key: len(records) for key, records in collections.items()}
+    for name in NESTED:
+        counts[f"stores.{name}"] = sum(len(store.get(name, ()))
+                                       for store in collections.get("stores", ()))
+    return counts
@@ -0,0 +1,96 @@
+"""LRU memoization of views derived from a Model snapshot.
+
+Entries are keyed on the call and remember the versions of the collections they
+were computed from, so any change to those collections makes them miss and be
+replaced. The budget is the estimated size of the cached results in bytes.
+"""
+import collections
+import functools
+import sys
+import threading
+
+from . import metrics
+
+
+class LruCache:
+    def __init__(self, max_bytes: int = 32 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != versions:
+                self.misses += 1
+                metrics.count("cache.misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.count("cache.hits")
+            return entry[1]
+
+    def put(self, key, versions: tuple, value):
+        size = _size(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (versions, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+                metrics.count("cache.evictions")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+def memoized(*keys: str):
+    """Caches the result of a ViewModel method until one of the ``keys``
+    collections changes. Callers must not modify the returned rows."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            current = self.data_versions(*keys)
+            call = (function.__name__, args, tuple(sorted(kwargs.items())))
+            result = self.cache.get(call, current)
+            if result is None:
+                result = function(self, *args, **kwargs)
+                self.cache.put(call, current, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def _size(value) -> int:
+    # Rows are lists of flat dicts, so two levels cover nearly all of it
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            size += sys.getsizeof(item)
+            if isinstance(item, dict):
+                size += sum(sys.getsizeof(field) for field in item.values())
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(field) for field in value.values())
+    return size
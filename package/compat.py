@@ -0,0 +1,237 @@
+"""Compatibility between the parts of a PC build.
+
+Rules: a processor and a board share the socket, RAM and board share the
+memory type and a cooler dissipates at least the processor's TDP. The first two
+are equivalence classes, so the graph keeps, per class, the set of products in
+it instead of the edges between every pair (which would be quadratic); coolers
+are grouped by TDP. A spec change makes a new graph that shares every class
+but the ones the product leaves or joins, see CompatibilityGraph.updated.
+
+complete_build searches the in-stock parts of a store for the compatible build
+that spends the most without going over the budget, depth first in order of
+price with two bounds: the cheapest way to finish the build must fit in what is
+left of the budget, and the most expensive way must beat the best build found.
+"""
+import bisect
+
+CPU = "Procesador"
+BOARD = "Placa Madre"
+RAM = "RAM"
+COOLER = "Refrigeración"
+# Parts of a full build, in the order they are chosen
+BUILD = (CPU, BOARD, RAM, COOLER, "Tarjeta Gráfica", "SSD")
+# Changes a graph keeps apart from the nodes it shares with older ones
+COMPACT_AT = 256
+
+
+class CompatibilityGraph:
+    def __init__(self, tables: tuple = ()):
+        # uuid -> category and the spec values the rules use. The graphs made by
+        # ``updated`` share _base and keep their changes in _recent (None for a
+        # removed product) until there are COMPACT_AT of them
+        self._base: dict[str, tuple[str, dict]] = {}
+        self._recent: dict[str, tuple[str, dict] | None] = {}
+        self._sockets: dict[str, dict[str, set]] = {CPU: {}, BOARD: {}}
+        self._memory: dict[str, dict[str, set]] = {BOARD: {}, RAM: {}}
+        # TDP -> coolers, and the TDPs in order
+        self._coolers: dict[int, set] = {}
+        self._tdps: list[int] = []
+        for table in tables:
+            columns = {field: table.get(field) for field in ("socket", "memoryType", "tdp")}
+            for row, product_uuid in enumerate(table["uuid"]):
+                specs = _rule_specs({field: values[row] for field, values in columns.items()
+                                     if values})
+                self._base[product_uuid] = (table["category"], specs)
+                self._link(product_uuid, table["category"], specs, shared=False)
+
+    def node(self, product_uuid: str) -> tuple[str, dict] | None:
+        """(category, specs) of a product, None without specs."""
+        if product_uuid in self._recent:
+            return self._recent[product_uuid]
+        return self._base.get(product_uuid)
+
+    def updated(self, category: str, product_uuid: str,
+                specs: dict | None) -> "CompatibilityGraph":
+        """New graph with the specs of a product set, None removes it. This one is
+        not changed, readers may be using it: the new graph shares everything but
+        the classes the product leaves or joins."""
+        graph = CompatibilityGraph()
+        graph._base = self._base
+        graph._recent = dict(self._recent)
+        graph._sockets = {kind: dict(classes) for kind, classes in self._sockets.items()}
+        graph._memory = {kind: dict(classes) for kind, classes in self._memory.items()}
+        graph._coolers = dict(self._coolers)
+        graph._tdps = self._tdps
+        previous = self.node(product_uuid)
+        if previous is not None:
+            graph._unlink(product_uuid, *previous)
+        if specs is not None:
+            specs = _rule_specs(specs)
+            graph._link(product_uuid, category, specs, shared=True)
+        graph._recent[product_uuid] = (category, specs) if specs is not None else None
+        if len(graph._recent) >= COMPACT_AT:
+            base = {**graph._base, **graph._recent}
+            graph._base = {key: node for key, node in base.items() if node is not None}
+            graph._recent = {}
+        return graph
+
+    def compatible(self, product_uuid: str, category: str) -> set[str] | None:
+        """Products of ``category`` that work with the product, None when no rule
+        relates the two categories (anything goes)."""
+        node = self.node(product_uuid)
+        if node is None:
+            return set()
+        own, specs = node
+        if {own, category} == {CPU, BOARD}:
+            return set(self._sockets[category].get(specs["socket"], ()))
+        if {own, category} == {BOARD, RAM}:
+            return set(self._memory[category].get(specs["memoryType"], ()))
+        if own == CPU and category == COOLER:
+            start = 0 if specs["tdp"] is None else bisect.bisect_left(self._tdps, specs["tdp"])
+            return set().union(*(self._coolers[tdp] for tdp in self._tdps[start:]))
+        if own == COOLER and category == CPU:
+            return {
+                other for other, (kind, values) in self._items()
+                if kind == CPU and (values["tdp"] is None or values["tdp"] <= (specs["tdp"] or 0))
+            }
+        return None
+
+    def fits(self, first: tuple[str, str], second: tuple[str, str]) -> bool:
+        """Whether two (category, uuid) products can be in the same build."""
+        categories = {first[0], second[0]}
+        if categories not in ({CPU, BOARD}, {BOARD, RAM}, {CPU, COOLER}):
+            return True
+        one, other = self.node(first[1]), self.node(second[1])
+        if one is None or other is None:
+            # A related product without specs cannot be checked
+            return False
+        if categories == {CPU, BOARD}:
+            return one[1]["socket"] is not None and one[1]["socket"] == other[1]["socket"]
+        if categories == {BOARD, RAM}:
+            return (one[1]["memoryType"] is not None
+                    and one[1]["memoryType"] == other[1]["memoryType"])
+        cpu, cooler = (one, other) if one[0] == CPU else (other, one)
+        return cpu[1]["tdp"] is None or (cooler[1]["tdp"] or 0) >= cpu[1]["tdp"]
+
+    def key(self, product_uuid: str) -> tuple:
+        """Products with the same key are interchangeable for every rule."""
+        node = self.node(product_uuid)
+        return tuple(node[1].values()) if node is not None else ()
+
+    def _items(self):
+        for product_uuid, node in self._base.items():
+            if product_uuid not in self._recent:
+                yield product_uuid, node
+        for product_uuid, node in self._recent.items():
+            if node is not None:
+                yield product_uuid, node
+
+    def _link(self, product_uuid: str, category: str, specs: dict, shared: bool):
+        # ``shared`` sets may be read by an older graph, they are replaced instead
+        # of changed
+        for classes, field in ((self._sockets.get(category), "socket"),
+                               (self._memory.get(category), "memoryType")):
+            if classes is not None and specs[field]:
+                if shared:
+                    classes[specs[field]] = classes.get(specs[field], set()) | {product_uuid}
+                else:
+                    classes.setdefault(specs[field], set()).add(product_uuid)
+        if category == COOLER and specs["tdp"] is not None:
+            tdp = specs["tdp"]
+            if tdp not in self._coolers:
+                self._tdps = self._tdps if not shared else list(self._tdps)
+                bisect.insort(self._tdps, tdp)
+                self._coolers[tdp] = set()
+            if shared:
+                self._coolers[tdp] = self._coolers[tdp] | {product_uuid}
+            else:
+                self._coolers[tdp].add(product_uuid)
+
+    def _unlink(self, product_uuid: str, category: str, specs: dict):
+        # Only used on a new graph from ``updated``, so every set is replaced
+        for classes, field in ((self._sockets.get(category), "socket"),
+                               (self._memory.get(category), "memoryType")):
+            if classes is not None and specs[field] in classes:
+                remaining = classes[specs[field]] - {product_uuid}
+                if remaining:
+                    classes[specs[field]] = remaining
+                else:
+                    del classes[specs[field]]
+        if category == COOLER and specs["tdp"] in self._coolers:
+            remaining = self._coolers[specs["tdp"]] - {product_uuid}
+            if remaining:
+                self._coolers[specs["tdp"]] = remaining
+            else:
+                del self._coolers[specs["tdp"]]
+                self._tdps = [tdp for tdp in self._tdps if tdp != specs["tdp"]]
+
+
+def _rule_specs(specs: dict) -> dict:
+    return {field: specs.get(field) for field in ("socket", "memoryType", "tdp")}
+
+
+def build_options(graph: CompatibilityGraph,
+                  candidates: dict[str, list[tuple[int, str]]]) -> dict[str, list[tuple[int, str]]]:
+    """The (price, uuid) candidates of every category, most expensive first and
+    with one product per price and compatibility class: the objective is the
+    total, so the others could never make a better build."""
+    options = {}
+    for category, items in candidates.items():
+        unique = {}
+        for price, product_uuid in sorted(items, reverse=True):
+            unique.setdefault((price, graph.key(product_uuid)), product_uuid)
+        options[category] = [(price, product_uuid) for (price, _), product_uuid in unique.items()]
+    return options
+
+
+def complete_build(graph: CompatibilityGraph, options: dict[str, list[tuple[int, str]]],
+                   budget: int, chosen: dict[str, str] | None = None, spent: int = 0,
+                   categories: tuple = BUILD, max_nodes: int = 200000) -> dict | None:
+    """Best build as {category: uuid} from ``options`` (see build_options).
+    ``chosen`` are the parts already decided and ``spent`` their price. The
+    search stops after checking max_nodes options and returns the best found so
+    far, None if nothing fits."""
+    chosen = dict(chosen or {})
+    order = [category for category in categories if category not in chosen]
+    if any(not options.get(category) for category in order):
+        return None
+    cheapest = [options[category][-1][0] for category in order]
+    dearest = [options[category][0][0] for category in order]
+    low_rest = [sum(cheapest[i:]) for i in range(len(order) + 1)]
+    high_rest = [sum(dearest[i:]) for i in range(len(order) + 1)]
+    if spent + low_rest[0] > budget:
+        return None
+    # Negated prices ascend, so bisect finds the first option that is affordable
+    negated = {category: [-price for price, _ in options[category]] for category in order}
+    best = {"total": -1, "parts": None}
+    visited = 0
+
+    def search(depth: int, total: int, parts: dict):
+        nonlocal visited
+        if depth == len(order):
+            if total > best["total"]:
+                best["total"], best["parts"] = total, dict(parts)
+            return
+        category = order[depth]
+        start = bisect.bisect_left(negated[category], total + low_rest[depth + 1] - budget)
+        for price, product_uuid in options[category][start:]:
+            visited += 1
+            if visited > max_nodes:
+                return
+            if total + price + high_rest[depth + 1] <= best["total"]:
+                # Options are sorted by price, the rest can only be worse
+                return
+            if not all(graph.fits((category, product_uuid), part) for part in parts.items()):
+                continue
+            parts[category] = product_uuid
+            search(depth + 1, total + price, parts)
+            del parts[category]
+            if best["total"] == budget:
+                return
+
+    decided = list(chosen.items())
+    if not all(graph.fits(first, second) for i, first in enumerate(decided)
+               for second in decided[i + 1:]):
+        return None
+    search(0, spent, chosen)
+    return best["parts"]
@@ -0,0 +1,96 @@
+"""Change notifications from the Model to the ViewModel and the View.
+
+The Model publishes a Change for every record a write adds, edits or removes,
+once the write is saved. Subscribers do not get them one at a time: the bus
+keeps the pending changes merged per record (added then edited is added, added
+then removed is nothing) and delivers them as one batch when ``schedule`` runs
+the flush. The View schedules it with a queued Qt signal, so every change made
+before the event loop turns is one batch and one repaint, an import of 50k
+products included. Without a scheduler every publish is delivered right away.
+"""
+import dataclasses
+import threading
+from collections.abc import Callable, Iterable
+
+from . import metrics
+
+KINDS = ("added", "changed", "removed", "reloaded")
+
+
+@dataclasses.dataclass(frozen=True)
+class Change:
+    # Collection key, "stores.products", "stores.workers" or "stores.sales" for
+    # the records nested in a store (whose uuid is ``parent``)
+    entity: str
+    # None for "reloaded": another process replaced the whole collection
+    uuid: str | None
+    kind: str
+    fields: frozenset[str] = frozenset()
+    parent: str | None = None
+
+
+class EventBus:
+    def __init__(self, schedule: Callable[[Callable[[], None]], None] | None = None):
+        # Called with the flush function when the first change of a batch arrives
+        self.schedule = schedule
+        self._subscribers: list[Callable[[list[Change]], None]] = []
+        self._pending: dict[tuple, Change] = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[list[Change]], None]) -> Callable[[], None]:
+        """Calls ``callback`` with every batch of changes. Returns the function
+        that unsubscribes it."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def publish(self, changes: Iterable[Change]):
+        with self._lock:
+            for change in changes:
+                _merge(self._pending, change)
+            if self._scheduled or not self._pending:
+                return
+            self._scheduled = True
+            schedule = self.schedule
+        if schedule is None:
+            self.flush()
+        else:
+            schedule(self.flush)
+
+    def flush(self):
+        """Delivers the pending changes as one batch."""
+        with self._lock:
+            batch = list(self._pending.values())
+            self._pending = {}
+            self._scheduled = False
+        if not batch:
+            return
+        metrics.count("events.changes", len(batch))
+        metrics.count("events.batches")
+        for callback in list(self._subscribers):
+            callback(batch)
+
+
+def _merge(pending: dict[tuple, Change], change: Change):
+    root = change.entity.split(".")[0]
+    if change.kind == "reloaded":
+        # Replaces every pending change of the collection and its nested records
+        for key in [key for key in pending if key[0].split(".")[0] == root]:
+            del pending[key]
+        pending[(change.entity, None, None)] = change
+        return
+    if (root, None, None) in pending:
+        return
+    key = (change.entity, change.parent, change.uuid)
+    old = pending.pop(key, None)
+    if old is None:
+        pending[key] = change
+    elif old.kind == "added" and change.kind == "removed":
+        return
+    elif old.kind == "added" or change.kind == "removed":
+        kind = "removed" if change.kind == "removed" else old.kind
+        pending[key] = dataclasses.replace(change, kind=kind, fields=old.fields | change.fields)
+    else:
+        # Edited after being edited, or removed and added again
+        pending[key] = dataclasses.replace(change, kind="changed",
+                                           fields=old.fields | change.fields)
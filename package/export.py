@@ -0,0 +1,195 @@
+"""Columnar export of the data for analytics.
+
+Every table is split in partitions and every partition is a ``.npz`` file (a zip
+of one ``.npy`` per column, deflated) that ``numpy.load`` opens directly; the
+files are written with the standard library, numpy is not needed here.
+
+    export/manifest.json                tables, columns, dtypes and partitions
+    export/products.npz                 the catalog
+    export/stock/<store>.npz            products of each store
+    export/workers/<store>.npz          workers of each store
+    export/sales/<store>/<YYYY-MM>.npz  sales of each store and month (UTC)
+    export/saleLines/<store>/<YYYY-MM>.npz
+
+Strings are ``<U`` as wide as the longest value of the partition and missing
+integers are INT_NULL. The manifest keeps a fingerprint of every partition, so
+a later export only rewrites the partitions that changed and removes the ones
+that no longer exist. Stores are consumed one at a time and only one partition
+is in memory as columns.
+"""
+import array
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+from collections.abc import Iterable
+
+from . import metrics
+
+INT_NULL = -2 ** 63
+MANIFEST = "manifest.json"
+
+# Columns of every table: name -> (record field, kind), kind "str", "int" or "float"
+TABLES: dict[str, dict[str, tuple[str, str]]] = {
+    "products": {
+        "uuid": ("uuid", "str"), "brand": ("brand", "str"), "model": ("model", "str"),
+        "category": ("category", "str"), "description": ("description", "str"),
+        "price": ("price", "int"), "createdAt": ("createdAt", "int")
+    },
+    "stock": {
+        "productUuid": ("uuid", "str"), "inStock": ("inStock", "int"),
+        "reorderAt": ("reorderAt", "int"), "updatedAt": ("updatedAt", "int")
+    },
+    "workers": {
+        "uuid": ("uuid", "str"), "name": ("name", "str"), "lastName": ("lastName", "str"),
+        "mail": ("mail", "str"), "phone": ("phone", "str"), "hiredAt": ("hiredAt", "int"),
+        "saleCount": ("saleCount", "int")
+    },
+    "sales": {
+        "uuid": ("uuid", "str"), "receipt": ("receipt", "int"), "terminal": ("terminal", "str"),
+        "workerUuid": ("workerUuid", "str"), "client": ("client", "str"),
+        "total": ("total", "int"), "createdAt": ("createdAt", "int")
+    },
+    "saleLines": {
+        "saleUuid": ("saleUuid", "str"), "productUuid": ("productUuid", "str"),
+        "quantity": ("quantity", "int"), "price": ("price", "int")
+    }
+}
+
+
+def export(directory: str, products: Iterable[dict], workers: Iterable[dict],
+           stores: Iterable[dict]) -> dict:
+    """Writes the partitions that changed since the last export to ``directory``.
+    Returns {"written", "skipped", "removed"} partition counts."""
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as file:
+            previous = json.load(file)
+    except FileNotFoundError:
+        previous = {"tables": {}}
+    exporter = _Exporter(directory, previous)
+    exporter.write("products", "all", "products.npz", list(products), _digest)
+
+    people = {worker["uuid"]: worker for worker in workers}
+    for store in stores:
+        store_uuid = store["uuid"]
+        exporter.write("stock", store_uuid, f"stock/{store_uuid}.npz", store["products"],
+                       _digest)
+        exporter.write("workers", store_uuid, f"workers/{store_uuid}.npz", [
+            {**people.get(item["uuid"], {}), **item} for item in store["workers"]
+        ], _digest)
+        months: dict[str, list[dict]] = {}
+        for sale in store.get("sales", ()):
+            month = time.strftime("%Y-%m", time.gmtime(int(sale["createdAt"])))
+            months.setdefault(month, []).append(sale)
+        for month, sales in months.items():
+            key = f"{store_uuid}/{month}"
+            if exporter.write("sales", key, f"sales/{key}.npz", sales, _ledger_digest):
+                exporter.write("saleLines", key, f"saleLines/{key}.npz", [
+                    {**line, "saleUuid": sale["uuid"]} for sale in sales for line in sale["lines"]
+                ], None)
+            else:
+                exporter.keep("saleLines", key)
+    return exporter.finish()
+
+
+class _Exporter:
+    def __init__(self, directory: str, previous: dict):
+        self.directory = directory
+        self.previous = previous["tables"]
+        self.tables = {
+            name: {"columns": {column: kind for column, (_, kind) in columns.items()},
+                   "partitions": {}}
+            for name, columns in TABLES.items()
+        }
+        self.stats = {"written": 0, "skipped": 0, "removed": 0}
+
+    def write(self, table: str, key: str, name: str, records: list[dict], digest) -> bool:
+        """Writes the partition unless its fingerprint did not change, returns
+        whether it was written. Without ``digest`` it is always written."""
+        fingerprint = digest(records) if digest is not None else None
+        old = self.previous.get(table, {}).get("partitions", {}).get(key)
+        if (fingerprint is not None and old is not None and old["fingerprint"] == fingerprint
+                and os.path.exists(os.path.join(self.directory, old["file"]))):
+            self.tables[table]["partitions"][key] = old
+            self.stats["skipped"] += 1
+            return False
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with zipfile.ZipFile(f"{path}.tmp", "w", zipfile.ZIP_DEFLATED) as file:
+            for column, (field, kind) in TABLES[table].items():
+                with file.open(f"{column}.npy", "w") as member:
+                    _write_npy(member, [record.get(field) for record in records], kind)
+        os.replace(f"{path}.tmp", path)
+        metrics.count("export.bytes_written", os.path.getsize(path))
+        self.tables[table]["partitions"][key] = {
+            "file": name, "rows": len(records), "fingerprint": fingerprint
+        }
+        self.stats["written"] += 1
+        return True
+
+    def keep(self, table: str, key: str):
+        old = self.previous.get(table, {}).get("partitions", {}).get(key)
+        if old is not None:
+            self.tables[table]["partitions"][key] = old
+            self.stats["skipped"] += 1
+
+    def finish(self) -> dict:
+        manifest = {"version": 1, "createdAt": int(time.time()), "intNull": INT_NULL,
+                    "tables": self.tables}
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=1)
+        os.replace(f"{path}.tmp", path)
+        # Partitions of stores or months that are gone
+        for table, content in self.previous.items():
+            current = self.tables.get(table, {}).get("partitions", {})
+            for key, partition in content["partitions"].items():
+                if key not in current:
+                    try:
+                        os.remove(os.path.join(self.directory, partition["file"]))
+                    except FileNotFoundError:
+                        pass
+                    self.stats["removed"] += 1
+        return self.stats
+
+
+def _digest(records: list[dict]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        digest.update(json.dumps(record, sort_keys=True, separators=(",", ":")).encode())
+    return digest.hexdigest()
+
+
+def _ledger_digest(sales: list[dict]) -> str:
+    # Sales are never edited, only appended, so the count and the last one tell
+    # whether a month changed
+    return f"{len(sales)}:{sales[-1]['uuid']}"
+
+
+def _write_npy(file, values: list, kind: str):
+    if kind == "str":
+        strings = ["" if value is None else str(value) for value in values]
+        width = max(map(len, strings), default=0) or 1
+        descr = f"<U{width}"
+    else:
+        typecode = "q" if kind == "int" else "d"
+        null = INT_NULL if kind == "int" else float("nan")
+        data = array.array(typecode, (null if value is None else
+                                      (int(value) if kind == "int" else float(value))
+                                      for value in values))
+        if sys.byteorder == "big":
+            data.byteswap()
+        descr = "<i8" if kind == "int" else "<f8"
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    # Magic, version 1.0, header length, then the header padded to 64 bytes
+    padding = -(10 + len(header) + 1) % 64
+    file.write(b"\x93NUMPY\x01\x00" + (len(header) + padding + 1).to_bytes(2, "little")
+               + header.encode("latin1") + b" " * padding + b"\n")
+    if kind == "str":
+        file.write(b"".join(string.encode("utf-32-le").ljust(width * 4, b"\0")
+                            for string in strings))
+    else:
+        file.write(data.tobytes())
@@ -0,0 +1,139 @@
+"""Sales history served a page at a time, partitioned by month.
+
+Each store appends its sales in date order, so the sales of a month are one
+slice of every store's ledger, found with a binary search: a month is opened
+(its slices sorted by date and by total) only when a page reaches it. Pages use
+keyset pagination, the cursor is the (date or total, uuid) of the last row, so
+the next page starts with a binary search instead of skipping rows.
+
+Months that were opened stay open while the slices of every store keep their
+bounds; since sales are only appended, only the current month is reopened after
+a sale. Sorting by date walks the months in order and stops when the page is
+full, sorting by total has to open every month of the requested range.
+"""
+import bisect
+import heapq
+import threading
+import time
+
+SORTS = ("date", "total")
+
+
+class SalesHistory:
+    def __init__(self, model, total=lambda sale: sale.get("total", 0)):
+        self._model = model
+        self._total = total
+        self._lock = threading.Lock()
+        # (year, month) -> (bounds {store uuid: (start, end)}, {sort: sorted rows})
+        self._months: dict[tuple[int, int], tuple[dict, dict]] = {}
+        self._checked: dict[tuple[int, int], int] = {}
+
+    def page(self, sort: str = "date", after: tuple | None = None, limit: int = 200,
+             first: tuple[int, int] | None = None, last: tuple[int, int] | None = None,
+             descending: bool = True) -> tuple[list[tuple[str, dict]], tuple | None]:
+        """Up to ``limit`` (store uuid, sale) of the months first..last (year,
+        month) inclusive, after the cursor ``after``. Returns them with the
+        cursor of the next page, None on the last one."""
+        if sort not in SORTS:
+            raise ValueError("Invalid sort")
+        data = self._model.snapshot()
+        months = _months(data["stores"], first, last)
+        if descending:
+            months.reverse()
+        if sort == "date":
+            if after is not None:
+                # Months the cursor already left behind are not opened
+                date = time.localtime(after[0])
+                current = (date.tm_year, date.tm_mon)
+                months = [month for month in months
+                          if (month <= current if descending else month >= current)]
+            rows = []
+            for month in months:
+                partition = self._open(data, month)["date"]
+                rows += _slice(partition, after, limit - len(rows), descending)
+                if len(rows) == limit:
+                    break
+        else:
+            merged = heapq.merge(*(
+                _slice(self._open(data, month)["total"], after, limit, descending)
+                for month in months
+            ), key=_key, reverse=descending)
+            rows = [row for row, _ in zip(merged, range(limit))]
+        cursor = rows[-1][:2] if len(rows) == limit else None
+        return [(row[2], row[3]) for row in rows], cursor
+
+    def _open(self, data, month: tuple[int, int]) -> dict:
+        version = data.versions.get("stores", 0)
+        with self._lock:
+            cached = self._months.get(month)
+            if cached is not None and self._checked.get(month) == version:
+                return cached[1]
+        start, end = _bounds(month)
+        bounds = {}
+        for store in data["stores"]:
+            sales = store.get("sales", ())
+            bounds[store["uuid"]] = (
+                bisect.bisect_left(sales, start, key=_created_at),
+                bisect.bisect_left(sales, end, key=_created_at)
+            )
+        if cached is None or cached[0] != bounds:
+            rows = [
+                (int(sale["createdAt"]), sale["uuid"], store["uuid"], sale)
+                for store in data["stores"]
+                for sale in store.get("sales", ())[slice(*bounds[store["uuid"]])]
+            ]
+            rows.sort(key=lambda row: row[:2])
+            cached = (bounds, {
+                "date": rows,
+                "total": sorted(((self._total(sale), uuid, store_uuid, sale)
+                                 for _, uuid, store_uuid, sale in rows),
+                                key=lambda row: row[:2])
+            })
+        with self._lock:
+            self._months[month] = cached
+            self._checked[month] = version
+        return cached[1]
+
+
+def _slice(partition: list[tuple], after: tuple | None, limit: int,
+           descending: bool) -> list[tuple]:
+    # The rows of a sorted partition that come after the cursor, in page order
+    if descending:
+        end = len(partition) if after is None else bisect.bisect_left(partition, after,
+                                                                     key=_key)
+        return partition[max(0, end - limit):end][::-1]
+    start = 0 if after is None else bisect.bisect_right(partition, after, key=_key)
+    return partition[start:start + limit]
+
+
+def _key(row: tuple) -> tuple:
+    return row[:2]
+
+
+def _created_at(sale: dict) -> int:
+    return int(sale["createdAt"])
+
+
+def _bounds(month: tuple[int, int]) -> tuple[int, int]:
+    # Local time, like the dates shown in the table
+    year, number = month
+    start = time.mktime((year, number, 1, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((year + number // 12, number % 12 + 1, 1, 0, 0, 0, 0, 0, -1))
+    return int(start), int(end)
+
+
+def _months(stores: tuple, first: tuple[int, int] | None,
+            last: tuple[int, int] | None) -> list[tuple[int, int]]:
+    # Months from the oldest to the newest sale of any store, within first..last
+    dates = [int(store["sales"][i]["createdAt"]) for store in stores
+             if store.get("sales") for i in (0, -1)]
+    if not dates:
+        return []
+    oldest, newest = time.localtime(min(dates)), time.localtime(max(dates))
+    month = max((oldest.tm_year, oldest.tm_mon), first or (0, 0))
+    end = min((newest.tm_year, newest.tm_mon), last or (9999, 12))
+    months = []
+    while month <= end:
+        months.append(month)
+        month = (month[0] + month[1] // 12, month[1] % 12 + 1)
+    return months
@@ -0,0 +1,58 @@
+import os
+import time
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Advisory, reentrant, exclusive lock on ``path`` shared between processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._depth = 0
+
+    def __enter__(self):
+        if self._depth == 0:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a+b")  # pylint: disable=R1732
+            try:
+                self._acquire()
+            except BaseException:
+                self._file.close()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._release()
+            finally:
+                self._file.close()
+                self._file = None
+
+    def _acquire(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after ~10 seconds
+                time.sleep(0.05)
+
+    def _release(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,187 @@
+"""Opt-in latency and throughput metrics.
+
+Disabled by default: a decorated call then costs one global lookup. Enable with
+``metrics.enable()``, ``python main.py --metrics`` or TECNOPC_METRICS=1.
+"""
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+# Upper bounds in seconds, from 50 µs to 10 s
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")
+)
+
+_enabled = os.environ.get("TECNOPC_METRICS") == "1"
+_lock = threading.Lock()
+_histograms: dict[str, "Histogram"] = {}
+_counters: dict[str, int] = {}
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        target = q * self.count
+        seen = 0
+        for bound, observations in zip(BUCKETS, self.buckets):
+            seen += observations
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+def enable():
+    global _enabled  # pylint: disable=W0603
+    _enabled = True
+
+
+def disable():
+    global _enabled  # pylint: disable=W0603
+    _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def observe(name: str, seconds: float):
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(name: str, amount: int = 1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def timed(name: str | None = None):
+    """Records the latency of every call of the decorated function."""
+    def decorator(function):
+        metric = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(metric, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def measure(name: str):
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def dump() -> str:
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+    lines = [f"{'metric':<40} {'calls':>8} {'mean ms':>10} {'p50 ms':>10} "
+             f"{'p99 ms':>10} {'max ms':>10}"]
+    for name, histogram in sorted(histograms.items()):
+        lines.append(
+            # A histogram loaded from a file can have no observations
+            f"{name:<40} {histogram.count:>8} "
+            f"{histogram.total / histogram.count * 1000 if histogram.count else 0:>10.3f} "
+            f"{histogram.quantile(0.5) * 1000:>10.3f} {histogram.quantile(0.99) * 1000:>10.3f} "
+            f"{histogram.max * 1000:>10.3f}"
+        )
+    for name, value in sorted(counters.items()):
+        lines.append(f"{name:<40} {value:>8}")
+    return "\n".join(lines)
+
+
+def prometheus() -> str:
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+    lines = ["# TYPE tecnopc_latency_seconds histogram"]
+    for name, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, value in zip(BUCKETS, histogram.buckets):
+            cumulative += value
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'tecnopc_latency_seconds_bucket{{name="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'tecnopc_latency_seconds_sum{{name="{name}"}} {histogram.total}')
+        lines.append(f'tecnopc_latency_seconds_count{{name="{name}"}} {histogram.count}')
+    lines.append("# TYPE tecnopc_total counter")
+    for name, value in sorted(counters.items()):
+        lines.append(f'tecnopc_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path: str):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(prometheus())
+    os.replace(temp_path, path)
+
+
+def load_prometheus(path: str):
+    """Rebuilds the registry from an exported file. The maximum is only known up
+    to its bucket bound."""
+    reset()
+    bucket_index: dict[str, int] = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("#") or not line.strip():
+                continue
+            series, value = line.rsplit(" ", 1)
+            metric, _, labels = series.partition("{")
+            fields = dict(part.split("=", 1) for part in labels.rstrip("}").split(","))
+            name = fields["name"].strip('"')
+            if metric == "tecnopc_total":
+                _counters[name] = int(value)
+                continue
+            histogram = _histograms.setdefault(name, Histogram())
+            if metric.endswith("_bucket"):
+                index = bucket_index.get(name, 0)
+                bucket_index[name] = index + 1
+                histogram.buckets[index] = int(value) - sum(histogram.buckets[:index])
+                if histogram.buckets[index]:
+                    histogram.max = BUCKETS[min(index, len(BUCKETS) - 2)]
+            elif metric.endswith("_sum"):
+                histogram.total = float(value)
+            elif metric.endswith("_count"):
+                histogram.count = int(value)
@@ -0,0 +1,378 @@
+"""Versioned migrations of the data files to the current format.
+
+Schema versions:
+
+    1  legacy: "Tiendas", "Componentes" and "Vendedores" with int ids, float
+       prices and workers linked to their store by its name (json/data.json)
+    2  current: "stores", "products" and "workers" with uuids and int prices,
+       the workers of a store nested in it
+
+``detect`` tells the version of a file from its first key and ``migrate``
+converts it with the migration registered for that version. The legacy file
+is read with a streaming parser, one record at a time, and converted records
+go to spool files in a work directory; the data is only written to the target
+storage at the end, as a stream, so memory is bounded by the number of stores
+and the workers of one store, not by the size of the file.
+
+Every ``checkpoint_every`` records the byte offset in the source and the size
+of each spool file are saved, so running it again after a crash truncates the
+spools to the checkpoint and goes on from there. Ids become uuid5 of the
+legacy id, the same on every run, so nothing but those offsets has to be kept.
+"""
+import calendar
+import codecs
+import functools
+import json
+import os
+import re
+import shutil
+import time
+import unicodedata
+import uuid
+
+from . import metrics
+
+SCHEMA_VERSION = 2
+LEGACY_KEYS = ("Tiendas", "Componentes", "Vendedores")
+CHUNK_SIZE = 1 << 16
+STATE = "state.json"
+
+# Namespace of the uuids given to legacy ids
+LEGACY_NAMESPACE = uuid.UUID("5b0e8f3c-6a57-4d0e-9a0c-2f1d3c7e4b61")
+
+_SPACE = re.compile(r"\s*")
+_DECODER = json.JSONDecoder()
+
+
+def detect(path: str) -> int:
+    """Schema version of the data file at ``path``."""
+    with open(path, "rb") as file:
+        reader = _Reader(file)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return SCHEMA_VERSION
+        return 1 if reader.value() in LEGACY_KEYS else SCHEMA_VERSION
+
+
+def migrate(source: str, storage, work: str | None = None, checkpoint_every: int = 10000,
+            price_scale: int = 1000) -> dict:
+    """Writes the data of the file ``source`` to ``storage`` in the current format,
+    resuming the migration left in ``work`` (storage.sidecar("migration") by
+    default) if there is one. Legacy prices, in thousands of pesos, are multiplied
+    by ``price_scale``.
+    Returns the record counts."""
+    version = detect(source)
+    if version == SCHEMA_VERSION:
+        raise ValueError("The data is already in the current format")
+    if version not in MIGRATIONS:
+        raise ValueError(f"No migration from version {version}")
+    return MIGRATIONS[version](source, storage, work or storage.sidecar("migration"),
+                               checkpoint_every, price_scale)
+
+
+@metrics.timed()
+def _from_legacy(source: str, storage, work: str, checkpoint_every: int,
+                 price_scale: int) -> dict:
+    stat = os.stat(source)
+    origin = [os.path.abspath(source), stat.st_size, stat.st_mtime_ns]
+    state = _read_state(work)
+    if state is not None and state["source"] != origin:
+        raise ValueError(f"The source changed since the migration started, remove {work}")
+    if state is None:
+        state = {"version": 1, "source": origin, "createdAt": f"{int(time.time())}",
+                 "position": None, "spools": {}, "converted": False,
+                 "counts": {"stores": 0, "products": 0, "workers": 0, "unlinked": 0}}
+    created_at = state["createdAt"]
+
+    # Stores are few and every worker needs them, so they are read first on every run
+    stores, names = {}, {}
+    with open(source, "rb") as file:
+        for key, _, record in _records(_Reader(file)):
+            if key != "Tiendas":
+                if stores:
+                    break
+                continue
+            store = _store(record, created_at)
+            stores[store["uuid"]] = store
+            names[_normalized(record.get("nombre", ""))] = store["uuid"]
+    state["counts"]["stores"] = len(stores)
+
+    spools = _Spools(work, state["spools"])
+    if not state["converted"]:
+        counts = state["counts"]
+        position = state["position"]
+        with open(source, "rb") as file:
+            reader = _Reader(file, position["offset"] if position else 0)
+            resume = (position["key"], position["index"]) if position else None
+            for done, (key, index, record) in enumerate(_records(reader, resume), 1):
+                if key == "Componentes":
+                    spools.write("products.jsonl", _product(record, created_at, price_scale))
+                    counts["products"] += 1
+                elif key == "Vendedores":
+                    worker, link = _worker(record, created_at)
+                    spools.write("workers.jsonl", worker)
+                    counts["workers"] += 1
+                    store_uuid = names.get(_normalized(record.get("tienda") or ""))
+                    if store_uuid is None:
+                        counts["unlinked"] += 1
+                    else:
+                        spools.write(f"stores/{store_uuid}.jsonl", link)
+                if done % checkpoint_every == 0:
+                    state["position"] = {"key": key, "index": index + 1, "offset": reader.offset}
+                    state["spools"] = spools.checkpoint()
+                    _write_state(work, state)
+        state["spools"] = spools.checkpoint()
+        state["converted"] = True
+        _write_state(work, state)
+    spools.close()
+
+    # Writing the target again after a crash here gives the same data
+    storage.bulk_write({
+        "stores": ({**store, "workers": list(_lines(work, f"stores/{store_uuid}.jsonl"))}
+                   for store_uuid, store in stores.items()),
+        "workers": _lines(work, "workers.jsonl"),
+        "products": _lines(work, "products.jsonl"),
+        "managers": ()
+    })
+    shutil.rmtree(work)
+    return state["counts"]
+
+
+# Source version -> migration of a file of that version to the current one
+MIGRATIONS = {1: _from_legacy}
+
+
+def _legacy_uuid(kind: str, legacy_id) -> str:
+    return str(uuid.uuid5(LEGACY_NAMESPACE, f"{kind}:{legacy_id}"))
+
+
+def _normalized(name: str) -> str:
+    # "Tienda ValleVolcanes" and "tienda valle volcanes" are the same store
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    return "".join(char for char in decomposed.casefold() if char.isalnum())
+
+
+def _store(record: dict, created_at: str) -> dict:
+    # Legacy stores list their workers in "vendedor" as empty objects, the link
+    # is the "tienda" of each Vendedor
+    return {
+        "uuid": _legacy_uuid("tienda", record["id"]),
+        "name": record.get("nombre", ""),
+        "address": record.get("direccion", ""),
+        "city": record.get("ciudad", ""),
+        "phone": record.get("telefono", ""),
+        "mail": record.get("email", ""),
+        "workers": [],
+        "products": [],
+        "createdAt": created_at,
+        "updatedAt": None
+    }
+
+
+def _product(record: dict, created_at: str, price_scale: int) -> dict:
+    return {
+        "uuid": _legacy_uuid("componente", record["id"]),
+        "brand": record.get("marca", ""),
+        "model": _model_name(record.get("nombre", ""), record.get("marca", "")),
+        "category": record.get("tipo", ""),
+        "description": record.get("descripcion", ""),
+        "price": round(float(record.get("precio") or 0) * price_scale),
+        "createdAt": created_at,
+        "updatedAt": None
+    }
+
+
+def _model_name(name: str, brand: str) -> str:
+    # Legacy names start with the brand ("Kingston Fury 16GB"), the label is brand + model
+    if brand and name[:len(brand)].casefold() == brand.casefold() and (
+            name[len(brand):len(brand) + 1] in ("", " ")):
+        return name[len(brand):].strip() or name
+    return name
+
+
+def _worker(record: dict, created_at: str) -> tuple[dict, dict]:
+    # The worker and its entry in the workers of its store. Legacy sales have no
+    # lines or totals, only their count is kept
+    worker_uuid = _legacy_uuid("vendedor", record["id"])
+    hired = record.get("fecha_contratacion")
+    return {
+        "uuid": worker_uuid,
+        "name": record.get("nombre", ""),
+        "lastName": record.get("apellido", ""),
+        "phone": record.get("telefono", ""),
+        "mail": record.get("email", ""),
+        "createdAt": created_at,
+        "updatedAt": None
+    }, {
+        "uuid": worker_uuid,
+        "hiredAt": _day(hired) if hired else None,
+        "saleCount": len(record.get("ventas") or ()),
+        "createdAt": created_at,
+        "updatedAt": None
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def _day(date: str) -> int:
+    # Workers were hired on few different days
+    return calendar.timegm(time.strptime(date, "%Y-%m-%d"))
+
+
+class _Reader:
+    # JSON values of a binary file read a chunk at a time. ``offset`` is the byte
+    # position of the next unread character, a new reader can start there
+    def __init__(self, file, offset: int = 0):
+        file.seek(offset)
+        self._file = file
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._position = 0
+        self._eof = False
+        self.offset = offset
+
+    def peek(self) -> str:
+        """Next character that is not whitespace, "" at the end of the file."""
+        while True:
+            if self._position < len(self._text) and not self._text[self._position].isspace():
+                return self._text[self._position]
+            self._advance(_SPACE.match(self._text, self._position).end())
+            if self._position < len(self._text):
+                return self._text[self._position]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at byte {self.offset}")
+        self._advance(self._position + 1)
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._text, self._position)
+                # A number at the end of the buffer could go on in the next chunk
+                if end < len(self._text) or self._eof:
+                    self._advance(end)
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f"Invalid JSON at byte {self.offset}: {e.msg}") from e
+            self._fill()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        data = self._file.read(CHUNK_SIZE)
+        self._eof = not data
+        # Consumed text is dropped, only the value being read stays in memory
+        self._text = self._text[self._position:] + self._decoder.decode(data, self._eof)
+        self._position = 0
+        return True
+
+    def _advance(self, end: int):
+        self.offset += len(self._text[self._position:end].encode("utf-8"))
+        self._position = end
+
+
+def _records(reader: _Reader, resume: tuple[str, int] | None = None):
+    # (key, index, record) of the items of every array of the top level object,
+    # other values are skipped. ``resume`` is the (key, index) of the next item
+    # when the reader starts right after the previous one
+    if resume is None:
+        reader.expect("{")
+        state, key, index = "key", None, 0
+    else:
+        state, (key, index) = "separator", resume
+    while True:
+        char = reader.peek()
+        if state == "key":
+            if char == "}":
+                return
+            key = reader.value()
+            reader.expect(":")
+            if reader.peek() == "[":
+                reader.expect("[")
+                state, index = "item", 0
+            else:
+                reader.value()
+                state = "end"
+        elif state == "item":
+            if char == "]":
+                reader.expect("]")
+                state = "end"
+            else:
+                yield key, index, reader.value()
+                index += 1
+                state = "separator"
+        elif state == "separator":
+            reader.expect(char if char in ",]" else ",")
+            state = "item" if char == "," else "end"
+        else:
+            reader.expect(char if char in ",}" else ",")
+            if char == "}":
+                return
+            state = "key"
+
+
+class _Spools:
+    # JSON lines files of the converted records, truncated on resume to the
+    # sizes of the last checkpoint
+    def __init__(self, directory: str, sizes: dict[str, int]):
+        self.directory = directory
+        self._files = {}
+        os.makedirs(os.path.join(directory, "stores"), exist_ok=True)
+        for name in self._names():
+            with open(os.path.join(directory, name), "r+b") as file:
+                file.truncate(sizes.get(name, 0))
+
+    def write(self, name: str, record: dict):
+        file = self._files.get(name)
+        if file is None:
+            file = self._files[name] = open(  # pylint: disable=R1732
+                os.path.join(self.directory, name), "ab")
+        file.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def checkpoint(self) -> dict[str, int]:
+        for file in self._files.values():
+            file.flush()
+            os.fsync(file.fileno())
+        return {name: os.path.getsize(os.path.join(self.directory, name))
+                for name in self._names()}
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+
+    def _names(self) -> list[str]:
+        stores = [f"stores/{name}" for name in os.listdir(os.path.join(self.directory, "stores"))]
+        return [name for name in ("products.jsonl", "workers.jsonl", *stores)
+                if os.path.exists(os.path.join(self.directory, name))]
+
+
+def _lines(directory: str, name: str):
+    # Stores without linked workers have no spool file
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def _read_state(directory: str) -> dict | None:
+    try:
+        with open(os.path.join(directory, STATE), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_state(directory: str, state: dict):
+    path = os.path.join(directory, STATE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(f"{path}.tmp", path)
@@ -1,7 +1,24 @@
+import collections
 import dataclasses
+import functools
 import json
+import platform
+import threading
 import time
+import types
 import uuid
+import weakref
+from collections.abc import Mapping
+
+from . import auth, compat, metrics, query, reports, specs, stock
+from .events import Change, EventBus
+from .audit import AuditLog, diff
+from .backup import BackupSet
+from .prices import PriceHistory
+from .storage import SegmentStorage, default_storage
+
+# Receipt numbers handed to a terminal at a time, see Model._next_receipt
+RECEIPT_BLOCK_SIZE = 100
 
 
 @dataclasses.dataclass
@@ -35,20 +52,115 @@ class Manager(Worker):
     password: str
 
 
-class Model:
-    def __init__(self):
-        try:
-            with open("data.json", encoding="utf-8") as file:
-                self._data: dict = json.load(file)
-        except FileNotFoundError:
-            self._data = json.loads('{"stores": [], "workers": [], "products": [], "managers": []}')
-            self._save()
-        except json.decoder.JSONDecodeError as e:
-            raise RuntimeError(f"JSON decoding error, manual intervention needed: {e}") from e
+@dataclasses.dataclass
+class Cart:
+    store_uuid: str
+    worker_uuid: str
+    client: str
+    lines: list[dict] = dataclasses.field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(line["price"] * line["quantity"] for line in self.lines)
+
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """Immutable view of the data at one version. Collections are tuples and are
+    never modified after being published, a write publishes a new Snapshot that
+    shares every collection it did not change."""
+    version: int
+    versions: Mapping[str, int]
+    collections: Mapping[str, tuple]
+
+    def __getitem__(self, key: str) -> tuple:
+        return self.collections[key]
+
 
+def _freeze(records) -> tuple:
+    return tuple(
+        {key: tuple(value) if isinstance(value, list) else value for key, value in record.items()}
+        if any(isinstance(value, list) for value in record.values()) else record
+        for record in records
+    )
+
+
+def _synchronized(method):
+    # Writers are serialized with an in-process lock plus the storage lock (shared
+    # storages) and external changes are reloaded first, so no write is lost
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock, self._storage.lock():
+            self._refresh()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Model:
+    def __init__(self, storage=None, terminal: str | None = None):
+        self._storage = storage if storage is not None else default_storage()
+        self._terminal = terminal or platform.node()
+        # Worker or manager uuid written to the audit log as the author of changes
+        self.actor: str | None = None
+        self.audit = AuditLog(self._storage.sidecar("audit"))
+        self.backups = BackupSet(self._storage.sidecar("backups"))
+        self._audit_entries: list[dict] = []
+        # Typed changes of every saved write, batched for the ViewModel, see events.py
+        self.events = EventBus()
+        self._changes: list[Change] = []
+        # Called with each low stock alert {storeUuid, productUuid, inStock, reorderAt}
+        # once the change that started it is saved
+        self.low_stock_listeners: list = []
+        self._stock_alerts: list[dict] = []
+        self._low_stock: tuple[int, stock.LowStockIndex] | None = None
+        self._spec_catalog: tuple[int, specs.SpecCatalog] | None = None
+        self._product_index: tuple[int, dict[str, dict]] | None = None
+        self._compat: tuple[int, compat.CompatibilityGraph] | None = None
+        self._build_options: dict[str, tuple[tuple, dict]] = {}
+        self._tables: dict[str, tuple[tuple, object]] = {}
+        # Kept between monthly reports, its processes stop with the Model
+        self._summary_pool = reports.SummaryPool()
+        weakref.finalize(self, self._summary_pool.close)
+        self._receipts = iter(())
+        self._dirty: dict[str, set[str]] = {}
+        self._lock = threading.RLock()
+        self._prices = PriceHistory(self._storage.sidecar("prices.bin"))
+        with self._storage.lock():
+            self._prices.refresh()
+            self.audit.rotate()
+            try:
+                with metrics.measure("Model.load"):
+                    data = self._storage.load()
+            except FileNotFoundError:
+                data = json.loads('{"stores": [], "workers": [], "products": [], "managers": []}')
+                self._dirty = {key: set() for key in data}
+            except json.decoder.JSONDecodeError as e:
+                raise RuntimeError(f"JSON decoding error, manual intervention needed: {e}") from e
+            self._snapshot = Snapshot(
+                0,
+                types.MappingProxyType(dict.fromkeys(data, 0)),
+                types.MappingProxyType({key: _freeze(value) for key, value in data.items()})
+            )
+            if self._dirty:
+                self._save()
+
+    def snapshot(self) -> Snapshot:
+        if self._storage.shared:
+            with self._lock, self._storage.lock():
+                self._refresh()
+        return self._snapshot
+
+    @metrics.timed()
+    def backup(self, full: bool = False) -> dict:
+        """Backs up the changes since the last backup while writers go on, see
+        package/backup.py."""
+        return self.backups.backup(self.snapshot().collections, full)
+
+    @metrics.timed()
+    @_synchronized
     def add_store(self, store: Store):
         store_uuid = str(uuid.uuid4())
-        self._data["stores"].append({
+        self._append("stores", {
             "uuid": store_uuid,
             "name": store.name,
             "address": store.address,
@@ -60,12 +172,15 @@ class Model:
             "createdAt": f"{int(time.time())}",
             "updatedAt": None
         })
+        self._mark_dirty("stores", store_uuid)
         self._save()
         return store_uuid
 
+    @metrics.timed()
+    @_synchronized
     def add_worker(self, worker: Worker):
         worker_uuid = str(uuid.uuid4())
-        self._data["workers"].append({
+        self._append("workers", {
             "uuid": worker_uuid,
             "name": worker.name,
             "lastName": worker.last_name,
@@ -74,33 +189,44 @@ class Model:
             "createdAt": f"{int(time.time())}",
             "updatedAt": None
         })
+        self._mark_dirty("workers", worker_uuid)
         self._save()
         return worker_uuid
 
+    @metrics.timed()
+    @_synchronized
     def add_product(self, product: Product):
         product_uuid = str(uuid.uuid4())
-        self._data["products"].append({
+        now = int(time.time())
+        self._append("products", {
             "uuid": product_uuid,
             "brand": product.brand,
             "model": product.model,
             "category": product.category,
             "description": product.description,
             "price": product.price,
-            "createdAt": f"{int(time.time())}",
+            "createdAt": f"{now}",
             "updatedAt": None
         })
+        self._mark_dirty("products", product_uuid)
         self._save()
+        self._prices.record(product_uuid, now, product.price)
         return product_uuid
 
-    def get_stores(self) -> list:
-        return self._data["stores"]
+    @metrics.timed()
+    def get_stores(self) -> tuple:
+        return self.snapshot()["stores"]
 
-    def get_workers(self) -> list:
-        return self._data["workers"]
+    @metrics.timed()
+    def get_workers(self) -> tuple:
+        return self.snapshot()["workers"]
 
-    def get_products(self) -> list:
-        return self._data["products"]
+    @metrics.timed()
+    def get_products(self) -> tuple:
+        return self.snapshot()["products"]
 
+    @metrics.timed()
+    @_synchronized
     def edit_store(self, store_uuid: str, store: Store):
         self._edit_entity("stores", store_uuid, {
             "name": store.name,
@@ -111,6 +237,8 @@ class Model:
             "updatedAt": f"{int(time.time())}"
         })
 
+    @metrics.timed()
+    @_synchronized
     def edit_worker(self, worker_uuid: str, worker: Worker):
         self._edit_entity("workers", worker_uuid, {
             "name": worker.name,
@@ -120,127 +248,644 @@ class Model:
             "updatedAt": f"{int(time.time())}"
         })
 
+    @metrics.timed()
+    @_synchronized
     def edit_product(self, product_uuid: str, product: Product):
+        now = int(time.time())
+        previous = self._snapshot["products"][self._locate_entity("products", product_uuid)]
+        if previous["category"] != product.category:
+            self._set_specs(previous["category"], product_uuid, None)
         self._edit_entity("products", product_uuid, {
             "brand": product.brand,
             "model": product.model,
             "category": product.category,
             "description": product.description,
             "price": product.price,
-            "updatedAt": f"{int(time.time())}"
+            "updatedAt": f"{now}"
         })
-
+        if previous["price"] != product.price:
+            # Products from before the history get their old price as first entry
+            if not self._prices.between(product_uuid):
+                self._prices.record(product_uuid, int(previous["createdAt"]), previous["price"])
+            self._prices.record(product_uuid, now, product.price)
+
+    def price_at(self, product_uuid: str, timestamp: int) -> int | None:
+        """Price of a product at ``timestamp``. A product that never changed price
+        reports its current one, any time before the first entry gets the first and
+        an unknown product None."""
+        data = self.snapshot()
+        if self._storage.shared:
+            with self._lock, self._storage.lock():
+                self._prices.refresh()
+        price = self._prices.price_at(product_uuid, timestamp)
+        if price is None:
+            first = self._prices.between(product_uuid)
+            if first:
+                return first[0][1]
+            product = next((item for item in data["products"] if item["uuid"] == product_uuid),
+                           None)
+            return product["price"] if product is not None else None
+        return price
+
+    def get_changes(self, entity_uuid: str | None = None, start: int | None = None,
+                    end: int | None = None) -> list[dict]:
+        """Audit entries of an entity (a store includes its stock and workers)."""
+        return self.audit.query(entity_uuid, start, end)
+
+    def price_history(self, product_uuid: str, start: int | None = None,
+                      end: int | None = None) -> list[tuple[int, int]]:
+        if self._storage.shared:
+            with self._lock, self._storage.lock():
+                self._prices.refresh()
+        return self._prices.between(product_uuid, start, end)
+
+    @metrics.timed()
+    @_synchronized
     def delete_store(self, store_uuid: str):
         self._delete_entity("stores", store_uuid)
 
+    @metrics.timed()
+    @_synchronized
     def delete_worker(self, worker_uuid: str):
         self._delete_entity("workers", worker_uuid)
 
+    @metrics.timed()
+    @_synchronized
     def delete_product(self, product_uuid: str):
+        index = self._locate_entity("products", product_uuid)
+        self._set_specs(self._snapshot["products"][index]["category"], product_uuid, None)
         self._delete_entity("products", product_uuid)
 
+    @metrics.timed()
+    @_synchronized
+    def set_product_specs(self, product_uuid: str, product_specs: dict):
+        """Replaces the specs of a product, see specs.SPEC_FIELDS for the fields of
+        each category."""
+        product = self._snapshot["products"][self._locate_entity("products", product_uuid)]
+        category = product["category"]
+        self._set_specs(category, product_uuid, specs.validate(category, product_specs))
+        self._save()
+
+    def get_product_specs(self, product_uuid: str) -> dict | None:
+        data = self.snapshot()
+        product = data["products"][self._locate_entity("products", product_uuid, data)]
+        return self._specs(data).specs(product["category"], product_uuid)
+
+    @metrics.timed()
+    def find_products(self, category: str, min_price: int | None = None,
+                      max_price: int | None = None, **criteria) -> list[dict]:
+        """Products of a category whose specs match ``criteria``, e.g.
+        ``find_products("Placa Madre", max_price=150000, socket="AM5")`` or
+        ``capacity=(16, None)`` for a range."""
+        data = self.snapshot()
+        products = self._products_by_uuid(data)
+        matches = []
+        for product_uuid in self._specs(data).find(category, criteria):
+            product = products.get(product_uuid)
+            if product is None:
+                continue
+            if min_price is not None and product["price"] < min_price:
+                continue
+            if max_price is not None and product["price"] > max_price:
+                continue
+            matches.append(product)
+        return matches
+
+    @metrics.timed()
+    @_synchronized
     def add_product_to_store(self, store_uuid: str, product_uuid: str):
         index = self._locate_entity("stores", store_uuid)
-        self._data["stores"][index]["products"].append({
+        self._append_nested(index, "products", {
             "uuid": product_uuid,
             "inStock": None,
             "createdAt": f"{int(time.time())}",
             "updatedAt": None
         })
+        self._mark_dirty("stores", store_uuid)
         self._save()
 
-    def get_products_in_store(self, store_uuid: str):
-        index = self._locate_entity("stores", store_uuid)
-        return self._data["stores"][index]["products"]
+    @metrics.timed()
+    def get_products_in_store(self, store_uuid: str) -> tuple:
+        data = self.snapshot()
+        return data["stores"][self._locate_entity("stores", store_uuid, data)]["products"]
 
-    def edit_product_stock(self, store_uuid: str, product_uuid: str, stock: int):
+    @metrics.timed()
+    @_synchronized
+    def edit_product_stock(self, store_uuid: str, product_uuid: str, in_stock: int):
         i, j = self._locate_nested_entity(["stores", "products"], [store_uuid, product_uuid])
-        self._data["stores"][i]["products"][j].update({
-            "inStock": stock,
+        self._update_nested(i, j, "products", {
+            "inStock": in_stock,
             "updatedAt": f"{int(time.time())}"
         })
+        self._mark_dirty("stores", store_uuid)
         self._save()
 
+    @metrics.timed()
+    @_synchronized
+    def set_stock_threshold(self, store_uuid: str, product_uuid: str, threshold: int | None):
+        """Alerts when the stock of the product in the store drops below threshold,
+        None disables them."""
+        if threshold is not None and threshold < 0:
+            raise ValueError("Invalid threshold")
+        i, j = self._locate_nested_entity(["stores", "products"], [store_uuid, product_uuid])
+        self._update_nested(i, j, "products", {
+            "reorderAt": threshold,
+            "updatedAt": f"{int(time.time())}"
+        })
+        self._mark_dirty("stores", store_uuid)
+        self._save()
+
+    @metrics.timed()
+    def low_stock(self, store_uuid: str | None = None) -> list[dict]:
+        """(store, product) pairs below their threshold, the furthest below first."""
+        data = self.snapshot()
+        version = data.versions.get("stores", 0)
+        cached = self._low_stock
+        if cached is None or cached[0] != version:
+            cached = self._low_stock = (version, stock.LowStockIndex(data["stores"]))
+        return cached[1].alerts(store_uuid)
+
+    @metrics.timed()
+    def reorder_report(self, window_days: int = 30, lead_days: int = 7,
+                       cover_days: int = 30) -> list[dict]:
+        return stock.reorder_report(self.snapshot()["stores"], window_days=window_days,
+                                    lead_days=lead_days, cover_days=cover_days)
+
+    @metrics.timed()
+    @_synchronized
     def delete_product_in_store(self, store_uuid: str, product_uuid: str):
         i, j = self._locate_nested_entity(["stores", "products"], [store_uuid, product_uuid])
-        del self._data["stores"][i]["products"][j]
+        self._delete_nested(i, j, "products")
+        self._mark_dirty("stores", store_uuid)
         self._save()
 
+    @metrics.timed()
+    @_synchronized
     def add_worker_to_store(self, store_uuid: str, worker_uuid: str):
         index = self._locate_entity("stores", store_uuid)
         hired_at = int(time.time())
-        self._data["stores"][index]["workers"].append({
+        self._append_nested(index, "workers", {
             "uuid": worker_uuid,
             "hiredAt": hired_at - hired_at % 86400,
             "saleCount": 0,
             "createdAt": f"{int(time.time())}",
             "updatedAt": None
         })
+        self._mark_dirty("stores", store_uuid)
         self._save()
 
-    def get_workers_in_store(self, store_uuid: str):
-        index = self._locate_entity("stores", store_uuid)
-        return self._data["stores"][index]["workers"]
+    @metrics.timed()
+    def get_workers_in_store(self, store_uuid: str) -> tuple:
+        data = self.snapshot()
+        return data["stores"][self._locate_entity("stores", store_uuid, data)]["workers"]
 
+    @metrics.timed()
+    @_synchronized
     def edit_worker_sales(self, store_uuid: str, worker_uuid: str, sales: int):
         i, j = self._locate_nested_entity(["stores", "workers"], [store_uuid, worker_uuid])
-        self._data["stores"][i]["workers"][j].update({
+        self._update_nested(i, j, "workers", {
             "saleCount": sales,
             "updatedAt": f"{int(time.time())}"
         })
+        self._mark_dirty("stores", store_uuid)
         self._save()
 
+    @metrics.timed()
+    @_synchronized
     def delete_worker_in_store(self, store_uuid: str, worker_uuid: str):
         i, j = self._locate_nested_entity(["stores", "workers"], [store_uuid, worker_uuid])
-        del self._data["stores"][i]["workers"][j]
+        self._delete_nested(i, j, "workers")
+        self._mark_dirty("stores", store_uuid)
         self._save()
 
-    def add_manager(self, identification: str, manager: Manager):
+    @metrics.timed()
+    def add_manager(self, identification: str, manager: Manager, hashed: bool = False):
+        """``hashed`` is only for imports of a password already hashed in stored
+        data, a password from the view or the API is always hashed."""
+        # Hashing is slow on purpose, it runs before taking the locks
+        return self._add_manager(identification, manager,
+                                 manager.password if hashed else auth.hash_password(
+                                     manager.password))
+
+    @_synchronized
+    def _add_manager(self, identification: str, manager: Manager, password: str):
+        if any(item["identification"] == identification for item in self._snapshot["managers"]):
+            raise ValueError("Identification already registered")
         manager_uuid = str(uuid.uuid4())
-        self._data["managers"].append({
+        self._append("managers", {
             "uuid": manager_uuid,
             "identification": identification,
             "name": manager.name,
             "lastName": manager.last_name,
             "phone": manager.phone,
             "mail": manager.mail,
-            "password": manager.password,
+            "password": password,
             "createdAt": f"{int(time.time())}",
             "updatedAt": None
         })
+        self._mark_dirty("managers", manager_uuid)
         self._save()
         return manager_uuid
 
-    def get_managers(self) -> list:
-        return self._data["managers"]
+    @metrics.timed()
+    def get_managers(self) -> tuple:
+        return self.snapshot()["managers"]
 
-    def edit_manager(self, manager_uuid: str, manager: Manager):
-        self._edit_entity("managers", manager_uuid, {
+    @metrics.timed()
+    def edit_manager(self, manager_uuid: str, manager: Manager, hashed: bool = False):
+        self._edit_manager(manager_uuid, {
             "name": manager.name,
             "lastName": manager.last_name,
             "phone": manager.phone,
             "mail": manager.mail,
-            "password": manager.password,
+            "password": manager.password if hashed else auth.hash_password(manager.password),
+            "updatedAt": f"{int(time.time())}"
+        })
+
+    @metrics.timed()
+    def set_manager_password(self, manager_uuid: str, password: str, hashed: bool = False):
+        self._edit_manager(manager_uuid, {
+            "password": password if hashed else auth.hash_password(password),
             "updatedAt": f"{int(time.time())}"
         })
 
+    @_synchronized
+    def _edit_manager(self, manager_uuid: str, payload: dict):
+        self._edit_entity("managers", manager_uuid, payload)
+
+    @metrics.timed()
+    @_synchronized
     def delete_manager(self, manager_uuid: str):
         self._delete_entity("managers", manager_uuid)
 
+    def open_cart(self, store_uuid: str, worker_uuid: str, client: str) -> Cart:
+        data = self.snapshot()
+        store = data["stores"][self._locate_entity("stores", store_uuid, data)]
+        if not any(worker["uuid"] == worker_uuid for worker in store["workers"]):
+            raise ValueError("Worker not in store")
+        return Cart(store_uuid, worker_uuid, client)
+
+    def add_cart_line(self, cart: Cart, product_uuid: str, quantity: int):
+        if quantity <= 0:
+            raise ValueError("Invalid quantity")
+        data = self.snapshot()
+        product = data["products"][self._locate_entity("products", product_uuid, data)]
+        store = data["stores"][self._locate_entity("stores", cart.store_uuid, data)]
+        line_stock = next((item["inStock"] for item in store["products"]
+                           if item["uuid"] == product_uuid), None)
+        in_cart = sum(line["quantity"] for line in cart.lines
+                      if line["productUuid"] == product_uuid)
+        if (line_stock or 0) < in_cart + quantity:
+            raise ValueError("Insufficient stock")
+        # The price is kept as it was when the line was added
+        cart.lines.append({
+            "productUuid": product_uuid,
+            "name": f"{product['brand']} {product['model']}",
+            "quantity": quantity,
+            "price": product["price"]
+        })
+
+    @metrics.timed()
+    @_synchronized
+    def finalize_cart(self, cart: Cart) -> dict:
+        """Commits the stock decrements, the ledger row and the worker's sale count
+        as a single write of the store."""
+        if not cart.lines:
+            raise ValueError("Empty cart")
+        i = self._locate_entity("stores", cart.store_uuid)
+        store = self._snapshot["stores"][i]
+        now = f"{int(time.time())}"
+
+        quantities = collections.Counter()
+        for line in cart.lines:
+            quantities[line["productUuid"]] += line["quantity"]
+        products = list(store["products"])
+        for j, item in enumerate(products):
+            if item["uuid"] in quantities:
+                if (item["inStock"] or 0) < quantities[item["uuid"]]:
+                    raise ValueError("Insufficient stock")
+                products[j] = {**item, "inStock": item["inStock"] - quantities.pop(item["uuid"]),
+                               "updatedAt": now}
+        if quantities:
+            raise ValueError("Product not in store")
+        workers = list(store["workers"])
+        j = next((j for j, worker in enumerate(workers)
+                  if worker["uuid"] == cart.worker_uuid), None)
+        if j is None:
+            raise ValueError("Worker not in store")
+        workers[j] = {**workers[j], "saleCount": workers[j]["saleCount"] + 1, "updatedAt": now}
+
+        sale = {
+            "uuid": str(uuid.uuid4()),
+            "receipt": self._next_receipt(),
+            "terminal": self._terminal,
+            "workerUuid": cart.worker_uuid,
+            "client": cart.client,
+            "lines": tuple({
+                "productUuid": line["productUuid"],
+                "quantity": line["quantity"],
+                "price": line["price"]
+            } for line in cart.lines),
+            "total": cart.total,
+            "createdAt": now
+        }
+        for key, records in (("products", products), ("workers", workers)):
+            for before, after in zip(store[key], records):
+                if before is not after:
+                    self._audit(f"stores.{key}", after["uuid"], before, after,
+                                parent=cart.store_uuid, actor=cart.worker_uuid)
+        self._track_stock(cart.store_uuid, [
+            (before, after) for before, after in zip(store["products"], products)
+            if before is not after
+        ])
+        # The ledger is not audited, the sale is its own record
+        self._changes.append(Change("stores.sales", sale["uuid"], "added", frozenset(sale),
+                                    cart.store_uuid))
+        self._replace("stores", i, {
+            **store,
+            "products": tuple(products),
+            "workers": tuple(workers),
+            "sales": store.get("sales", ()) + (sale,)
+        })
+        self._mark_dirty("stores", cart.store_uuid)
+        self._save()
+        return sale
+
+    def sale_total(self, sale: dict) -> int:
+        """Total of a sale. Lines without a captured price (imported sales) are
+        valued at the price in effect when the sale was made."""
+        if "total" in sale:
+            return sale["total"]
+        created_at = int(sale["createdAt"])
+        total = 0
+        for line in sale["lines"]:
+            price = line["price"] if "price" in line else self.price_at(
+                line["productUuid"], created_at
+            )
+            total += line["quantity"] * (price or 0)
+        return total
+
+    @metrics.timed()
+    def query(self, table: str) -> query.Query:
+        """Declarative query over "products", "workers", "stock" or "sales", see
+        package/query.py."""
+        return query.Query(self._query_table(self.snapshot(), table))
+
+    def _query_table(self, data: Snapshot, name: str):
+        # Tables and their indexes last until one of their collections changes
+        if name not in query.TABLES:
+            raise ValueError("Invalid table")
+        versions = tuple(data.versions.get(key, 0) for key in query.TABLES[name])
+        cached = self._tables.get(name)
+        if cached is None or cached[0] != versions:
+            if name == "stock":
+                table = query.Stock(data["stores"], self._query_table(data, "products"))
+            elif name == "sales":
+                table = query.Sales(data["stores"], self.sale_total)
+            else:
+                table = query.Records(name, data[name], query.INDEXES[name])
+            cached = self._tables[name] = (versions, table)
+        return cached[1]
+
+    def get_sales_in_store(self, store_uuid: str) -> tuple:
+        data = self.snapshot()
+        return data["stores"][self._locate_entity("stores", store_uuid, data)].get("sales", ())
+
+    @metrics.timed()
+    def summarize_sales(self, start: int, end: int, max_workers: int | None = None) -> list[dict]:
+        """Per store revenue, units and worker totals of the sales made in
+        [start, end). With a SegmentStorage the stores are read and summarized
+        in parallel processes when ``max_workers`` is given or there are at least
+        reports.POOL_MIN_CPUS processors, max_workers=0 keeps it in this one."""
+        data = self.snapshot()
+        shard_paths = self._storage.shard_paths() if isinstance(
+            self._storage, SegmentStorage) else None
+        return reports.summarize_stores(
+            data["stores"], data["products"], start, end, shard_paths,
+            self._storage.sidecar("prices.bin"), max_workers, self._summary_pool
+        )
+
+    def _next_receipt(self) -> int:
+        # Each terminal reserves a block of receipt numbers and uses it without
+        # asking anyone else; numbers left in a block when the program closes
+        # are skipped
+        receipt = next(self._receipts, None)
+        if receipt is None:
+            blocks = self._snapshot.collections.get("receiptBlocks", ())
+            start = max((block["end"] for block in blocks), default=0) + 1
+            block = {
+                "terminal": self._terminal,
+                "start": start,
+                "end": start + RECEIPT_BLOCK_SIZE - 1,
+                "createdAt": f"{int(time.time())}"
+            }
+            self._publish({"receiptBlocks": blocks + (block,)})
+            self._mark_dirty("receiptBlocks", self._terminal)
+            self._receipts = iter(range(start, block["end"] + 1))
+            receipt = next(self._receipts)
+        return receipt
+
     def _edit_entity(self, key: str, entity_uuid: str, payload: dict[str, int | str]):
         index = self._locate_entity(key, entity_uuid)
-        self._data[key][index].update(payload)
+        record = {**self._snapshot[key][index], **payload}
+        self._audit(key, entity_uuid, self._snapshot[key][index], record)
+        self._replace(key, index, record)
+        self._mark_dirty(key, entity_uuid)
         self._save()
 
     def _delete_entity(self, key: str, entity_uuid: str):
         index = self._locate_entity(key, entity_uuid)
-        del self._data[key][index]
+        collection = self._snapshot[key]
+        self._audit(key, entity_uuid, collection[index], None)
+        self._publish({key: collection[:index] + collection[index + 1:]})
+        self._mark_dirty(key, entity_uuid)
         self._save()
 
-    def _locate_entity(self, key: str, entity_uuid: str):
+    def _append(self, key: str, record: dict):
+        self._audit(key, record["uuid"], None, record)
+        self._publish({key: self._snapshot[key] + _freeze((record,))})
+
+    def _replace(self, key: str, index: int, record: dict):
+        collection = self._snapshot[key]
+        self._publish({key: collection[:index] + (record,) + collection[index + 1:]})
+
+    def _append_nested(self, index: int, key: str, record: dict):
+        store = self._snapshot["stores"][index]
+        self._audit(f"stores.{key}", record["uuid"], None, record, parent=store["uuid"])
+        if key == "products":
+            self._track_stock(store["uuid"], [(None, record)])
+        self._replace("stores", index, {**store, key: store[key] + (record,)})
+
+    def _update_nested(self, i: int, j: int, key: str, payload: dict[str, int | str | None]):
+        store = self._snapshot["stores"][i]
+        records = store[key]
+        record = {**records[j], **payload}
+        self._audit(f"stores.{key}", record["uuid"], records[j], record, parent=store["uuid"])
+        if key == "products":
+            self._track_stock(store["uuid"], [(records[j], record)])
+        self._replace("stores", i, {**store, key: records[:j] + (record,) + records[j + 1:]})
+
+    def _delete_nested(self, i: int, j: int, key: str):
+        store = self._snapshot["stores"][i]
+        self._audit(f"stores.{key}", store[key][j]["uuid"], store[key][j], None,
+                    parent=store["uuid"])
+        if key == "products":
+            self._track_stock(store["uuid"], [(store[key][j], None)])
+        self._replace("stores", i, {**store, key: store[key][:j] + store[key][j + 1:]})
+
+    def _specs(self, data: Snapshot) -> specs.SpecCatalog:
+        # Indexes are rebuilt on the first query after the specs change
+        version = data.versions.get("specs", 0)
+        cached = self._spec_catalog
+        if cached is None or cached[0] != version:
+            catalog = specs.SpecCatalog(data.collections.get("specs", ()))
+            cached = self._spec_catalog = (version, catalog)
+        return cached[1]
+
+    @metrics.timed()
+    def compatible_products(self, product_uuid: str, category: str) -> list[dict]:
+        """Products of ``category`` that work with the product, e.g. the boards
+        for a processor. Categories without a rule between them are all compatible."""
+        data = self.snapshot()
+        products = self._products_by_uuid(data)
+        related = self._compat_graph(data).compatible(product_uuid, category)
+        if related is None:
+            return [product for product in data["products"] if product["category"] == category]
+        return [products[item] for item in related if item in products]
+
+    @metrics.timed()
+    def complete_build(self, store_uuid: str, budget: int, chosen: dict[str, str] | None = None,
+                       categories: tuple = compat.BUILD) -> dict | None:
+        """The compatible build from the store's stock that spends the most within
+        ``budget``, keeping the parts in ``chosen`` ({category: uuid}). Returns
+        {"parts": {category: product}, "total": price} or None."""
+        data = self.snapshot()
+        products = self._products_by_uuid(data)
+        if any(part not in products for part in (chosen or {}).values()):
+            raise ValueError("Product not found")
+        graph = self._compat_graph(data)
+        # The options of a store only change with its stock, prices or specs
+        key = tuple(data.versions.get(name, 0) for name in ("stores", "products", "specs"))
+        cached = self._build_options.get(store_uuid)
+        if cached is None or cached[0] != key:
+            store = data["stores"][self._locate_entity("stores", store_uuid, data)]
+            candidates: dict[str, list[tuple[int, str]]] = {}
+            for item in store["products"]:
+                product = products.get(item["uuid"])
+                if product is not None and (item["inStock"] or 0) > 0:
+                    candidates.setdefault(product["category"], []).append(
+                        (product["price"], product["uuid"])
+                    )
+            cached = (key, compat.build_options(graph, candidates))
+            self._build_options[store_uuid] = cached
+        spent = sum(products[part]["price"] for part in (chosen or {}).values())
+        parts = compat.complete_build(graph, cached[1], budget, chosen, spent, categories)
+        if parts is None:
+            return None
+        return {
+            "parts": {category: products[part] for category, part in parts.items()},
+            "total": sum(products[part]["price"] for part in parts.values())
+        }
+
+    def _compat_graph(self, data: Snapshot) -> compat.CompatibilityGraph:
+        # Built once, then kept current by _set_specs
+        version = data.versions.get("specs", 0)
+        cached = self._compat
+        if cached is None or cached[0] != version:
+            graph = compat.CompatibilityGraph(data.collections.get("specs", ()))
+            cached = self._compat = (version, graph)
+        return cached[1]
+
+    def _products_by_uuid(self, data: Snapshot) -> dict[str, dict]:
+        version = data.versions.get("products", 0)
+        cached = self._product_index
+        if cached is None or cached[0] != version:
+            cached = self._product_index = (
+                version, {product["uuid"]: product for product in data["products"]}
+            )
+        return cached[1]
+
+    def _set_specs(self, category: str, product_uuid: str, product_specs: dict | None):
+        tables = list(self._snapshot.collections.get("specs", ()))
+        i = next((i for i, table in enumerate(tables) if table["category"] == category), None)
+        if i is None:
+            if product_specs is None or category not in specs.SPEC_FIELDS:
+                return
+            tables.append(specs.empty_table(category))
+            i = len(tables) - 1
+        table = specs.set_row(tables[i], product_uuid, product_specs)
+        if table is tables[i]:
+            return
+        self._audit("specs", product_uuid, specs.get_row(tables[i], product_uuid), product_specs)
+        tables[i] = table
+        version = self._snapshot.versions.get("specs", 0)
+        self._publish({"specs": tuple(tables)})
+        self._mark_dirty("specs", product_uuid)
+        cached = self._compat
+        if cached is not None and cached[0] == version:
+            # Readers take no lock and may be using the cached graph, it is never changed
+            self._compat = (self._snapshot.versions["specs"],
+                            cached[1].updated(category, product_uuid, product_specs))
+
+    def _audit(self, key: str, entity_uuid: str, before: dict | None, after: dict | None,
+               parent: str | None = None, actor: str | None = None):
+        # Kept until the change is saved, so the log never has changes that were lost
+        changes = diff(before, after)
+        if changes:
+            self._changes.append(Change(
+                key, entity_uuid, "added" if before is None else "removed" if after is None
+                else "changed", frozenset(changes), parent
+            ))
+            self._audit_entries.append({
+                "at": int(time.time()),
+                "actor": actor or self.actor,
+                "key": key,
+                "entity": entity_uuid,
+                "parent": parent,
+                "changes": changes
+            })
+
+    def _track_stock(self, store_uuid: str, changes: list[tuple[dict | None, dict | None]]):
+        # Called before the stores are published: the cached index is moved to the
+        # next version only if it was current, otherwise low_stock rebuilds it
+        for before, after in changes:
+            if stock.fires(before, after):
+                self._stock_alerts.append({
+                    "storeUuid": store_uuid,
+                    "productUuid": after["uuid"],
+                    "inStock": after["inStock"],
+                    "reorderAt": after["reorderAt"]
+                })
+        cached = self._low_stock
+        version = self._snapshot.versions.get("stores", 0)
+        if cached is not None and cached[0] == version:
+            # Same as the compatibility graph: low_stock may be reading the cached index
+            index = cached[1].copy()
+            for before, after in changes:
+                index.update(store_uuid, (after or before)["uuid"], after)
+            self._low_stock = (version + 1, index)
+
+    def _publish(self, changes: dict[str, tuple]):
+        current = self._snapshot
+        versions = {key: current.versions.get(key, 0) + 1 for key in changes}
+        self._snapshot = Snapshot(
+            current.version + 1,
+            types.MappingProxyType({**current.versions, **versions}),
+            types.MappingProxyType({**current.collections, **changes})
+        )
+
+    def _refresh(self):
+        data = dict(self._snapshot.collections)
+        changed = self._storage.refresh(data)
+        if changed:
+            self._publish({key: _freeze(data[key]) for key in changed})
+            self.events.publish(Change(key, None, "reloaded") for key in changed)
+
+    def _locate_entity(self, key: str, entity_uuid: str, data: Snapshot | None = None):
         if key not in ["stores", "workers", "products", "managers"]:
             raise ValueError("Invalid key")
-        for index, value in enumerate(self._data[key]):  # type: int, dict
+        data = data if data is not None else self._snapshot
+        for index, value in enumerate(data[key]):  # type: int, dict
             if value["uuid"] == entity_uuid:
                 return index
         raise ValueError("Entity not found")
@@ -249,12 +894,24 @@ class Model:
         if keys[1] not in ["workers", "products"]:
             raise ValueError("Invalid nested key")
         i = self._locate_entity(keys[0], entity_uuids[0])
-        for j, value in enumerate(self._data[keys[1]]):  # type: int, dict
+        for j, value in enumerate(self._snapshot[keys[0]][i][keys[1]]):  # type: int, dict
             if value["uuid"] == entity_uuids[1]:
                 return i, j
         raise ValueError("Nested entity not found")
 
+    def _mark_dirty(self, key: str, entity_uuid: str):
+        self._dirty.setdefault(key, set()).add(entity_uuid)
+
+    @metrics.timed()
     def _save(self):
-        with open("data.json", "w", encoding="utf-8") as file:
-            # TODO: Remove indent for prod
-            json.dump(self._data, file, indent=4)
+        self._storage.save(self._snapshot.collections, self._dirty)
+        self._dirty = {}
+        if self._audit_entries:
+            self.audit.append(self._audit_entries)
+            self._audit_entries = []
+        changes, self._changes = self._changes, []
+        self.events.publish(changes)
+        alerts, self._stock_alerts = self._stock_alerts, []
+        for alert in alerts:
+            for listener in self.low_stock_listeners:
+                listener(alert)
@@ -0,0 +1,116 @@
+"""Append-only price history of every product.
+
+The file is a sequence of records ``uuid (16 bytes) | timestamp delta | price``
+with both numbers as zigzag varints and the delta taken from the previous
+record, so a change costs about 22 bytes. In memory each product keeps two
+``array('q')`` (timestamps and prices) sorted by time, which answers "price at
+T" with a binary search and a range with two.
+"""
+import array
+import bisect
+import os
+import uuid
+
+from . import metrics
+
+
+class PriceHistory:
+    def __init__(self, path: str):
+        self.path = path
+        self._offset = 0
+        self._last_timestamp = 0
+        self._series: dict[str, tuple[array.array, array.array]] = {}
+
+    def record(self, product_uuid: str, timestamp: int, price: int):
+        """Appends a price. Callers that share the file must hold the storage lock."""
+        self.refresh()
+        data = (uuid.UUID(product_uuid).bytes + _varint(_zigzag(timestamp - self._last_timestamp))
+                + _varint(_zigzag(price)))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as file:
+            # A torn record from a crash is cut off before appending after it
+            if file.tell() != self._offset:
+                file.truncate(self._offset)
+            file.write(data)
+        metrics.count("prices.bytes_written", len(data))
+        self._offset += len(data)
+        self._add(product_uuid, timestamp, price)
+
+    def refresh(self):
+        """Reads the records appended since the last call, by this or another process."""
+        try:
+            with open(self.path, "rb") as file:
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+        position = 0
+        while True:
+            try:
+                product_uuid = str(uuid.UUID(bytes=data[position:position + 16]))
+                delta, cursor = _read_varint(data, position + 16)
+                price, cursor = _read_varint(data, cursor)
+            except (ValueError, IndexError):
+                break
+            self._add(product_uuid, self._last_timestamp + _unzigzag(delta), _unzigzag(price))
+            position = cursor
+        self._offset += position
+
+    def price_at(self, product_uuid: str, timestamp: int) -> int | None:
+        """Price in effect at ``timestamp``, None if it was not known yet."""
+        series = self._series.get(product_uuid)
+        if series is None:
+            return None
+        index = bisect.bisect_right(series[0], timestamp) - 1
+        return series[1][index] if index >= 0 else None
+
+    def between(self, product_uuid: str, start: int | None = None,
+                end: int | None = None) -> list[tuple[int, int]]:
+        """(timestamp, price) changes with start <= timestamp <= end."""
+        series = self._series.get(product_uuid)
+        if series is None:
+            return []
+        timestamps, prices = series
+        low = 0 if start is None else bisect.bisect_left(timestamps, start)
+        high = len(timestamps) if end is None else bisect.bisect_right(timestamps, end)
+        return list(zip(timestamps[low:high], prices[low:high]))
+
+    def _add(self, product_uuid: str, timestamp: int, price: int):
+        self._last_timestamp = timestamp
+        timestamps, prices = self._series.setdefault(
+            product_uuid, (array.array("q"), array.array("q"))
+        )
+        # Clocks of different terminals can disagree by a little, keep the order
+        index = len(timestamps)
+        if index and timestamps[-1] > timestamp:
+            index = bisect.bisect_right(timestamps, timestamp)
+        timestamps.insert(index, timestamp)
+        prices.insert(index, price)
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+def _varint(value: int) -> bytes:
+    data = bytearray()
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def _read_varint(data: bytes, position: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
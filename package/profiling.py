@@ -0,0 +1,121 @@
+"""Sampling profiler for UI actions, enabled with ``python main.py --profile``.
+
+While an action runs, a background thread samples the stack of the thread
+running it. Each action's samples are written as collapsed stacks
+(``frame;frame;frame count``), the input format of flamegraph.pl, speedscope and
+inferno. Actions slower than the threshold are logged.
+"""
+import collections
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_profiler: "Profiler | None" = None
+
+
+class Profiler:
+    def __init__(self, directory: str = "profiles", interval: float = 0.002,
+                 slow_ms: float = 200.0):
+        self.directory = directory
+        self.interval = interval
+        self.slow_ms = slow_ms
+        self._active = threading.Event()
+        self._target: int | None = None
+        self._samples: collections.Counter = collections.Counter()
+        self._depth = 0
+        self._sequence = 0
+        self._stopped = False
+        # The sampler needs the GIL to look at the other thread, so let it run
+        # at least as often as it wants to sample
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, interval / 2))
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def run(self, name: str, function, *args, **kwargs):
+        # Nested actions are part of the outermost one
+        if self._depth:
+            return function(*args, **kwargs)
+        self._depth += 1
+        self._samples = collections.Counter()
+        self._target = threading.get_ident()
+        self._active.set()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._active.clear()
+            self._depth -= 1
+            self._finish(name, elapsed_ms)
+
+    def stop(self):
+        self._stopped = True
+        self._active.set()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _sample(self):
+        while True:
+            self._active.wait()
+            if self._stopped:
+                return
+            frame = sys._current_frames().get(self._target)  # pylint: disable=W0212
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                 f"{code.co_firstlineno})")
+                    frame = frame.f_back
+                # The sampled thread may have left the action since the wait
+                if self._active.is_set():
+                    self._samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def _finish(self, name: str, elapsed_ms: float):
+        samples = self._samples
+        if elapsed_ms >= self.slow_ms:
+            logger.warning("Slow action %s: %.1f ms (%d samples)", name, elapsed_ms,
+                           sum(samples.values()))
+        if not samples:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        file_name = (f"{time.strftime('%Y%m%d-%H%M%S')}-{self._sequence:04d}-{safe_name}-"
+                     f"{int(elapsed_ms)}ms.folded")
+        with open(os.path.join(self.directory, file_name), "w", encoding="utf-8") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def enable(directory: str = "profiles", interval: float = 0.002, slow_ms: float = 200.0):
+    global _profiler  # pylint: disable=W0603
+    _profiler = Profiler(directory, interval, slow_ms)
+
+
+def disable():
+    global _profiler  # pylint: disable=W0603
+    if _profiler is not None:
+        _profiler.stop()
+    _profiler = None
+
+
+def action(name: str | None = None):
+    """Profiles every call of the decorated function as one UI action."""
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            return _profiler.run(label, function, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,545 @@
+"""Declarative queries over the Model collections, with a small planner.
+
+    model.query("stock").where(category="RAM", price=(None, 60000))
+        .order_by("-inStock").limit(20).run()
+    model.query("sales").where(createdAt=(start, end - 1))
+        .group_by("storeUuid", "workerUuid", total=("sum", "total"), saleCount=("count",))
+
+A criterion is a value for equality or an inclusive (low, high) range where
+either end can be None, as in SpecCatalog.find; ``filter`` adds any other
+predicate. Tables and their indexes:
+
+    products  the catalog                          uuid, category, brand, price, createdAt
+    workers   the workers                          uuid
+    stock     the products of every store joined   storeUuid, and through the catalog
+              to the catalog                       uuid, category, brand, price
+    sales     the ledgers of every store           storeUuid, createdAt, workerUuid, uuid
+
+The planner asks every index that can answer a criterion how many rows it
+would return, exact counts from bucket sizes and binary searches, reads the
+rows of the one returning fewest and checks the other criteria on them. With
+no usable index it scans. With an order on an indexed field and a limit, it
+may instead read that index in order and stop at the limit. Indexes are built
+on first use and live as long as the snapshot collections they cover.
+``explain`` shows the plan with the estimated rows after each step.
+"""
+import bisect
+import heapq
+import itertools
+import threading
+from collections.abc import Callable, Iterable, Iterator
+
+from .specs import _matches
+
+# Collections each table is made of, and the indexes of the plain ones
+TABLES = {"products": ("products",), "workers": ("workers",), "stock": ("stores", "products"),
+          "sales": ("stores",)}
+INDEXES = {"products": {"uuid": "hash", "category": "hash", "brand": "hash", "price": "sorted"},
+           "workers": {"uuid": "hash"}}
+# Share of the rows assumed to pass a check no index answers
+SELECTIVITY = {"equal": 0.1, "range": 1 / 3, "filter": 0.5}
+AGGREGATES = ("count", "sum", "min", "max", "avg")
+
+
+class Query:
+    """A query is immutable, every method returns a new one."""
+
+    def __init__(self, table, criteria: dict | None = None,
+                 predicates: tuple[tuple[str, Callable[[dict], bool]], ...] = (),
+                 group: tuple[tuple[str, ...], dict[str, tuple]] | None = None,
+                 order: tuple[str, ...] = (), count: int | None = None,
+                 fields: tuple[str, ...] | None = None):
+        self._table = table
+        self._criteria = criteria or {}
+        self._predicates = predicates
+        self._group = group
+        self._order = order
+        self._count = count
+        self._fields = fields
+
+    def select(self, *fields: str) -> "Query":
+        """Only these fields in the rows (not with group_by). Tables that build
+        their rows, stock and sales, then build only what the query reads."""
+        return self._with(fields=fields)
+
+    def where(self, **criteria) -> "Query":
+        return self._with(criteria={**self._criteria, **criteria})
+
+    def filter(self, predicate: Callable[[dict], bool], name: str | None = None) -> "Query":
+        name = name or getattr(predicate, "__name__", "predicate")
+        return self._with(predicates=self._predicates + ((name, predicate),))
+
+    def group_by(self, *fields: str, **aggregates: tuple) -> "Query":
+        """One row per distinct value of ``fields`` with the aggregates, given as
+        name=(function, field): ("count",), ("sum", "total"), ("avg", "price")..."""
+        for name, aggregate in aggregates.items():
+            if not aggregate or aggregate[0] not in AGGREGATES or (
+                    aggregate[0] != "count" and len(aggregate) < 2):
+                raise ValueError(f"Invalid aggregate: {name}")
+        return self._with(group=(fields, aggregates))
+
+    def order_by(self, *fields: str) -> "Query":
+        """Fields to sort by, "-price" for descending. Missing values go last."""
+        return self._with(order=fields)
+
+    def limit(self, count: int) -> "Query":
+        return self._with(count=count)
+
+    def explain(self) -> str:
+        return "\n".join(f"{'  ' * min(i, 1)}{step['step']:<12} {step['detail']}"
+                         f"  rows={step['rows']}" for i, step in enumerate(self.plan()))
+
+    def plan(self) -> list[dict]:
+        """Steps of the plan: {"step", "detail", "rows" (estimated)}."""
+        return self._plan()[0]
+
+    def run(self) -> list[dict]:
+        _, rows = self._plan()
+        return list(rows())
+
+    def _with(self, **changes) -> "Query":
+        values = {"criteria": self._criteria, "predicates": self._predicates,
+                  "group": self._group, "order": self._order, "count": self._count,
+                  "fields": self._fields}
+        values.update(changes)
+        return Query(self._table, **values)
+
+    def _plan(self) -> tuple[list[dict], Callable[[], Iterable[dict]]]:
+        table = self._table
+        # Access path: the index returning fewest rows, or a scan
+        paths = [(*path, field) for field, wanted in self._criteria.items()
+                 if (path := table.access(field, wanted)) is not None]
+        best = min(paths, key=lambda path: path[0], default=None)
+        if best is not None:
+            estimate, detail, source, used = best
+            steps = [{"step": "IndexScan", "detail": detail, "rows": estimate}]
+        else:
+            estimate, source, used = table.count(), table.scan, None
+            steps = [{"step": "Scan", "detail": table.name, "rows": estimate}]
+        checks = [(field, wanted) for field, wanted in self._criteria.items() if field != used]
+
+        # Reading an index in order stops at the limit instead of sorting every row
+        ordered = None
+        if self._group is None and len(self._order) == 1 and self._count is not None:
+            ordered = table.ordered(self._order[0].lstrip("-"), self._order[0].startswith("-"))
+        if ordered is not None:
+            every = list(self._criteria.items())
+            read = min(table.count(), round(self._count / self._selectivity(every)))
+            if read < estimate:
+                detail, source = ordered
+                checks, estimate = every, read
+                steps = [{"step": "IndexOrder", "detail": detail, "rows": read}]
+            else:
+                ordered = None
+
+        if checks or self._predicates:
+            estimate = max(1, round(estimate * self._selectivity(checks))) if estimate else 0
+            names = [_describe(field, wanted) for field, wanted in checks]
+            names += [name for name, _ in self._predicates]
+            steps.append({"step": "Filter", "detail": " and ".join(names), "rows": estimate})
+        if self._group is not None:
+            fields, aggregates = self._group
+            distinct = table.distinct(fields[0]) if len(fields) == 1 else None
+            estimate = min(estimate, distinct) if distinct is not None else estimate
+            steps.append({"step": "Group", "detail": f"by {', '.join(fields) or '()'}: "
+                          f"{', '.join(aggregates)}", "rows": estimate})
+        if self._order and ordered is None:
+            top = self._count is not None and len({f.startswith("-") for f in self._order}) == 1
+            steps.append({"step": "TopN" if top else "Sort",
+                          "detail": ", ".join(self._order), "rows": estimate})
+        if self._count is not None:
+            estimate = min(estimate, self._count)
+            steps.append({"step": "Limit", "detail": str(self._count), "rows": estimate})
+        return steps, lambda: self._execute(source, checks, ordered is not None)
+
+    def _needed(self, checks: list[tuple]) -> set[str] | None:
+        # Fields the query reads, None for every field (predicates see whole rows)
+        if self._predicates or (self._fields is None and self._group is None):
+            return None
+        needed = {field for field, _ in checks}
+        if self._group is not None:
+            fields, aggregates = self._group
+            needed.update(fields)
+            needed.update(aggregate[1] for aggregate in aggregates.values() if len(aggregate) > 1)
+        else:
+            needed.update(self._fields)
+            needed.update(field.lstrip("-") for field in self._order)
+        return needed
+
+    def _selectivity(self, checks: list[tuple]) -> float:
+        # Share of the rows expected to pass the checks and the predicates
+        selectivity = SELECTIVITY["filter"] ** len(self._predicates)
+        for _, wanted in checks:
+            selectivity *= SELECTIVITY["range" if isinstance(wanted, tuple) else "equal"]
+        return selectivity
+
+    def _execute(self, source: Callable[..., Iterable[dict]], checks: list[tuple],
+                 ordered: bool) -> Iterable[dict]:
+        rows: Iterable[dict] = source(self._needed(checks))
+        if checks or self._predicates:
+            rows = (row for row in rows
+                    if all(_matches(row.get(field), wanted) for field, wanted in checks)
+                    and all(predicate(row) for _, predicate in self._predicates))
+        if self._group is not None:
+            rows = _group(rows, *self._group)
+        if ordered:
+            rows = itertools.islice(rows, self._count)
+        elif self._order:
+            rows = _sort(rows, self._order, self._count)
+        elif self._count is not None:
+            rows = itertools.islice(rows, self._count)
+        if self._fields is not None and self._group is None:
+            return ({field: row.get(field) for field in self._fields} for row in rows)
+        return rows
+
+
+class Records:
+    """A collection of records with hash and sorted indexes on some fields."""
+
+    def __init__(self, name: str, records: tuple, indexed: dict[str, str]):
+        self.name = name
+        self.records = records
+        self.indexed = indexed
+        self._indexes: dict = {}
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return len(self.records)
+
+    def scan(self, fields=None) -> Iterable[dict]:  # pylint: disable=W0613
+        # Records are returned as they are, whatever the fields
+        return self.records
+
+    def index(self, field: str):
+        with self._lock:
+            index = self._indexes.get(field)
+            if index is None:
+                kind = _HashIndex if self.indexed[field] == "hash" else _SortedIndex
+                index = self._indexes[field] = kind([record.get(field)
+                                                     for record in self.records])
+            return index
+
+    def access(self, field: str, wanted) -> tuple[int, str, Callable] | None:
+        if field not in self.indexed or not self.index(field).usable(wanted):
+            return None
+        positions = self.index(field).positions(wanted)
+        return (len(positions), f"{self.name}.{field} {_describe(field, wanted)}",
+                lambda fields: (self.records[position] for position in positions))
+
+    def ordered(self, field: str, descending: bool) -> tuple[str, Callable] | None:
+        if self.indexed.get(field) != "sorted":
+            return None
+        return (f"{self.name}.{field} {'desc' if descending else 'asc'}",
+                lambda fields: (self.records[position]
+                                for position in self.index(field).ordered(descending)))
+
+    def distinct(self, field: str) -> int | None:
+        return len(self.index(field).buckets) if self.indexed.get(field) == "hash" else None
+
+
+class Stock:
+    """Products of every store joined to the catalog: storeUuid, store, the
+    product fields, inStock and reorderAt."""
+    name = "stock"
+
+    def __init__(self, stores: tuple, products: Records):
+        self._stores = stores
+        self._products = products
+        self._count = sum(len(store["products"]) for store in stores)
+        self._positions: list[dict[str, int]] | None = None
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return self._count
+
+    def scan(self, fields=None) -> Iterator[dict]:
+        catalog = self._products.index("uuid")
+        for store in self._stores:
+            for item in store["products"]:
+                positions = catalog.positions(item["uuid"])
+                if positions:
+                    yield _stock_row(store, item, self._products.records[positions[0]], fields)
+
+    def access(self, field: str, wanted) -> tuple[int, str, Callable] | None:
+        if field == "storeUuid" and not isinstance(wanted, tuple):
+            stores = [store for store in self._stores if store["uuid"] == wanted]
+            return (sum(len(store["products"]) for store in stores), f"stores.uuid = {wanted!r}",
+                    Stock(tuple(stores), self._products).scan)
+        path = self._products.access(field, wanted)
+        if path is None:
+            return None
+        matched, detail, products = path
+        # Each store is probed for the matching products through its uuid map
+        fanout = self._count / max(1, self._products.count())
+        return (round(matched * fanout), f"{detail}, probing each store",
+                lambda fields: self._join(list(products(None)), fields))
+
+    def ordered(self, field: str, descending: bool) -> None:  # pylint: disable=W0613
+        return None
+
+    def distinct(self, field: str) -> int | None:
+        if field == "storeUuid":
+            return len(self._stores)
+        return self._products.distinct(field) if field != "uuid" else None
+
+    def _join(self, products: list[dict], fields) -> Iterator[dict]:
+        with self._lock:
+            if self._positions is None:
+                self._positions = [{item["uuid"]: j for j, item in enumerate(store["products"])}
+                                   for store in self._stores]
+        for store, positions in zip(self._stores, self._positions):
+            # In the order of the store, as a scan returns them
+            found = sorted((positions[product["uuid"]], product) for product in products
+                           if product["uuid"] in positions)
+            for j, product in found:
+                yield _stock_row(store, store["products"][j], product, fields)
+
+
+class Sales:
+    """Sales of every store: storeUuid, store, uuid, receipt, terminal,
+    workerUuid, client, total, createdAt (int) and items."""
+    name = "sales"
+
+    def __init__(self, stores: tuple, total: Callable[[dict], int]):
+        self._stores = stores
+        self._total = total
+        self._count = sum(len(store.get("sales", ())) for store in stores)
+        self._indexes: dict[str, _HashIndex] = {}
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return self._count
+
+    def scan(self, fields=None) -> Iterator[dict]:
+        for store in self._stores:
+            for sale in store.get("sales", ()):
+                yield self._row(store, sale, fields)
+
+    def access(self, field: str, wanted) -> tuple[int, str, Callable] | None:
+        if field == "storeUuid" and not isinstance(wanted, tuple):
+            stores = [store for store in self._stores if store["uuid"] == wanted]
+            return (sum(len(store.get("sales", ())) for store in stores),
+                    f"stores.uuid = {wanted!r}", Sales(tuple(stores), self._total).scan)
+        if field == "createdAt":
+            # Ledgers are appended in date order, each one is binary searched
+            slices = [(store, _date_slice(store.get("sales", ()), wanted))
+                      for store in self._stores]
+            return (sum(end - start for _, (start, end) in slices),
+                    f"ledgers by createdAt {_describe(field, wanted)}",
+                    lambda fields: (self._row(store, sale, fields) for store, bounds in slices
+                                    for sale in store["sales"][slice(*bounds)]))
+        if field in ("workerUuid", "uuid") and not isinstance(wanted, tuple):
+            positions = self._index(field).positions(wanted)
+            return (len(positions), f"sales.{field} = {wanted!r}",
+                    lambda fields: (self._row(self._stores[i], self._stores[i]["sales"][j], fields)
+                                    for i, j in positions))
+        return None
+
+    def ordered(self, field: str, descending: bool) -> tuple[str, Callable] | None:
+        if field != "createdAt":
+            return None
+        return (f"ledgers merged by createdAt {'desc' if descending else 'asc'}",
+                lambda fields: heapq.merge(
+                    *(self._ledger(store, descending, fields) for store in self._stores),
+                    key=lambda row: row["createdAt"], reverse=descending
+                ))
+
+    def distinct(self, field: str) -> int | None:
+        if field == "storeUuid":
+            return len(self._stores)
+        return len(self._index(field).buckets) if field in ("workerUuid", "uuid") else None
+
+    def _index(self, field: str) -> "_HashIndex":
+        with self._lock:
+            index = self._indexes.get(field)
+            if index is None:
+                index = self._indexes[field] = _HashIndex(())
+                for i, store in enumerate(self._stores):
+                    for j, sale in enumerate(store.get("sales", ())):
+                        index.buckets.setdefault(sale[field], []).append((i, j))
+            return index
+
+    def _ledger(self, store: dict, descending: bool, fields) -> Iterator[dict]:
+        # createdAt is always there, the ledgers are merged on it
+        fields = None if fields is None else {*fields, "createdAt"}
+        sales = store.get("sales", ())
+        for sale in reversed(sales) if descending else sales:
+            yield self._row(store, sale, fields)
+
+    def _row(self, store: dict, sale: dict, fields) -> dict:
+        if fields is not None:
+            return {field: _SALE_FIELDS[field](store, sale, self._total) for field in fields
+                    if field in _SALE_FIELDS}
+        return {
+            "storeUuid": store["uuid"],
+            "store": store["name"],
+            "uuid": sale["uuid"],
+            "receipt": sale.get("receipt"),
+            "terminal": sale.get("terminal"),
+            "workerUuid": sale["workerUuid"],
+            "client": sale.get("client"),
+            "total": self._total(sale),
+            "createdAt": int(sale["createdAt"]),
+            "items": sum(line["quantity"] for line in sale["lines"])
+        }
+
+
+class _HashIndex:
+    def __init__(self, values: Iterable):
+        self.buckets: dict = {}
+        for position, value in enumerate(values):
+            self.buckets.setdefault(value, []).append(position)
+
+    def usable(self, wanted) -> bool:
+        return not isinstance(wanted, tuple)
+
+    def positions(self, wanted) -> list:
+        return self.buckets.get(wanted, [])
+
+
+class _SortedIndex:
+    def __init__(self, values: list):
+        pairs = sorted((value, position) for position, value in enumerate(values)
+                       if value is not None)
+        self.values = [value for value, _ in pairs]
+        self.order = [position for _, position in pairs]
+        self.missing = [position for position, value in enumerate(values) if value is None]
+
+    def usable(self, wanted) -> bool:  # pylint: disable=W0613
+        return True
+
+    def positions(self, wanted) -> list[int]:
+        low, high = wanted if isinstance(wanted, tuple) else (wanted, wanted)
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        return self.order[start:end]
+
+    def ordered(self, descending: bool) -> Iterator[int]:
+        if not descending:
+            yield from self.order
+        else:
+            # Equal values keep their order, as a stable sort leaves them
+            pairs = zip(reversed(self.values), reversed(self.order))
+            for _, group in itertools.groupby(pairs, key=lambda pair: pair[0]):
+                yield from reversed([position for _, position in group])
+        yield from self.missing
+
+
+def _stock_row(store: dict, item: dict, product: dict, fields) -> dict:
+    if fields is not None:
+        return {field: _STOCK_FIELDS[field](store, item, product) for field in fields
+                if field in _STOCK_FIELDS}
+    return {
+        "storeUuid": store["uuid"],
+        "store": store["name"],
+        "uuid": product["uuid"],
+        "brand": product["brand"],
+        "model": product["model"],
+        "category": product["category"],
+        "description": product["description"],
+        "price": product["price"],
+        "inStock": item["inStock"],
+        "reorderAt": item.get("reorderAt")
+    }
+
+
+# Field -> value, for rows built with only some fields
+_STOCK_FIELDS = {
+    "storeUuid": lambda store, item, product: store["uuid"],
+    "store": lambda store, item, product: store["name"],
+    **{field: lambda store, item, product, field=field: product[field]
+       for field in ("uuid", "brand", "model", "category", "description", "price")},
+    "inStock": lambda store, item, product: item["inStock"],
+    "reorderAt": lambda store, item, product: item.get("reorderAt")
+}
+_SALE_FIELDS = {
+    "storeUuid": lambda store, sale, total: store["uuid"],
+    "store": lambda store, sale, total: store["name"],
+    **{field: lambda store, sale, total, field=field: sale.get(field)
+       for field in ("uuid", "receipt", "terminal", "workerUuid", "client")},
+    "total": lambda store, sale, total: total(sale),
+    "createdAt": lambda store, sale, total: int(sale["createdAt"]),
+    "items": lambda store, sale, total: sum(line["quantity"] for line in sale["lines"])
+}
+
+
+def _date_slice(sales: tuple, wanted) -> tuple[int, int]:
+    low, high = wanted if isinstance(wanted, tuple) else (wanted, wanted)
+    start = 0 if low is None else bisect.bisect_left(sales, low, key=_created_at)
+    end = len(sales) if high is None else bisect.bisect_right(sales, high, key=_created_at)
+    return start, end
+
+
+def _created_at(sale: dict) -> int:
+    return int(sale["createdAt"])
+
+
+def _describe(field: str, wanted) -> str:
+    if isinstance(wanted, tuple):
+        return f"{field} in [{wanted[0]}, {wanted[1]}]"
+    return f"{field} = {wanted!r}"
+
+
+def _group(rows: Iterable[dict], fields: tuple[str, ...], aggregates: dict[str, tuple]):
+    specs = [(aggregate[0], aggregate[1] if len(aggregate) > 1 else None)
+             for aggregate in aggregates.values()]
+    # Key -> one [sum, count, min or max] per aggregate
+    groups: dict[tuple, list[list]] = {}
+    for row in rows:
+        key = tuple(map(row.get, fields))
+        state = groups.get(key)
+        if state is None:
+            state = groups[key] = [[0, 0, None] for _ in specs]
+        for (function, field), slot in zip(specs, state):
+            if field is None:
+                slot[1] += 1
+                continue
+            value = row.get(field)
+            if value is None:
+                continue
+            slot[1] += 1
+            if function in ("sum", "avg"):
+                slot[0] += value
+            elif function == "min" and (slot[2] is None or value < slot[2]) or (
+                    function == "max" and (slot[2] is None or value > slot[2])):
+                slot[2] = value
+    result = []
+    for key, state in groups.items():
+        row = dict(zip(fields, key))
+        for name, (function, _), (total, count, extreme) in zip(aggregates, specs, state):
+            if function == "count":
+                row[name] = count
+            elif function == "sum":
+                row[name] = total
+            elif function == "avg":
+                row[name] = total / count if count else None
+            else:
+                row[name] = extreme
+        result.append(row)
+    return result
+
+
+def _sort(rows: list[dict], order: tuple[str, ...], count: int | None) -> list[dict]:
+    directions = {field.startswith("-") for field in order}
+    fields = [field.lstrip("-") for field in order]
+    if count is not None and len(directions) == 1:
+        # Same direction on every field: only the first ``count`` are kept
+        def key(row):
+            return tuple(_key(row.get(field)) for field in fields)
+        if directions == {False}:
+            return heapq.nsmallest(count, rows, key=key)
+        return heapq.nlargest(count, rows, key=lambda row: tuple(
+            _key(row.get(field), True) for field in fields))
+    # Stable sorts from the last field to the first
+    rows = list(rows)
+    for field, descending in reversed([(field.lstrip("-"), field.startswith("-"))
+                                       for field in order]):
+        rows.sort(key=lambda row, field=field, descending=descending: _key(
+            row.get(field), descending),
+                  reverse=descending)
+    return rows if count is None else rows[:count]
+
+
+def _key(value, descending: bool = False) -> tuple:
+    # Missing values last in both directions
+    return (value is not None, value) if descending else (value is None, value)
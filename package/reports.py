@@ -0,0 +1,201 @@
+"""Sales summary of every store over a period, for the end of month report.
+
+Stores are independent, so with a SegmentStorage each one is summarized by a
+process of a pool straight from its shard file and only a few totals per store
+come back. The catalog every process needs, the category and price of each
+product, is written once to a shared memory block that the processes map
+instead of receiving it pickled with every task. Parsing a shard costs about
+twice summarizing it, so the pool beats summarizing the loaded data in this
+process from about four processors on (POOL_MIN_CPUS); below that it is only
+used when asked for with ``max_workers``. Starting the processes costs more than
+a report of a few stores, so each Model keeps one SummaryPool between reports.
+
+Block layout: ``n`` prices and ``n`` category indexes as int64, then the ``n``
+product uuids as 36 ASCII bytes each.
+"""
+import concurrent.futures
+import itertools
+import json
+import os
+import threading
+from multiprocessing import shared_memory
+
+from . import metrics
+from .prices import PriceHistory
+
+UUID_SIZE = 36
+# Processors from which the pool is used by default, measured with benchmarks.reports
+POOL_MIN_CPUS = 4
+
+# Catalog of the pool process, set by _attach from the block named in _attached
+_catalog: dict[str, tuple[str, int]] = {}
+_prices: PriceHistory | None = None
+_attached: tuple | None = None
+
+
+def summarize_stores(stores: tuple, products: tuple, start: int, end: int,
+                     shard_paths: dict[str, str] | None = None, prices_path: str | None = None,
+                     max_workers: int | None = None,
+                     pool: "SummaryPool | None" = None) -> list[dict]:
+    """Summary of the sales of every store made in [start, end), see _summarize.
+    Runs in this process over ``stores`` without ``shard_paths`` or ``pool``, with
+    max_workers=0, and by default below POOL_MIN_CPUS processors."""
+    if max_workers is None and (os.cpu_count() or 1) < POOL_MIN_CPUS:
+        max_workers = 0
+    if not shard_paths or pool is None or max_workers == 0:
+        catalog = {product["uuid"]: (product["category"], product["price"])
+                   for product in products}
+        history = PriceHistory(prices_path) if prices_path else None
+        return [_summarize(store, catalog, start, end, history) for store in stores]
+
+    paths = [shard_paths.get(store["uuid"]) for store in stores]
+    with metrics.measure("reports.pool"):
+        summaries = pool.map(max_workers, products, prices_path, paths, start, end)
+    # Stores without a shard (not saved yet, or replaced by a save while the pool
+    # ran) are done here from ``stores``
+    missing = [store for store, summary in zip(stores, summaries) if summary is None]
+    done = iter(summarize_stores(missing, products, start, end, None, prices_path))
+    return [summary if summary is not None else next(done) for summary in summaries]
+
+
+class SummaryPool:
+    """Processes that summarize shards, started by the first report and kept for
+    the next ones. The catalog block is shared again only when the products change."""
+
+    def __init__(self):
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+        self._max_workers: int | None = None
+        # (products, block, categories) of the shared catalog
+        self._catalog: tuple[tuple, shared_memory.SharedMemory, list[str]] | None = None
+        self._lock = threading.Lock()
+
+    def map(self, max_workers: int | None, products: tuple, prices_path: str | None,
+            paths: list[str | None], start: int, end: int) -> list[dict | None]:
+        with self._lock:
+            if self._executor is None or self._max_workers != max_workers:
+                self._shutdown()
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+                self._max_workers = max_workers
+            # Snapshots replace the products tuple when the catalog changes
+            if self._catalog is None or self._catalog[0] is not products:
+                self._unlink()
+                categories = sorted({product["category"] for product in products})
+                self._catalog = (products, _share_catalog(products, categories), categories)
+            _, block, categories = self._catalog
+            catalog = (block.name, len(products), categories, prices_path)
+            return list(self._executor.map(_summarize_shard, paths, itertools.repeat(start),
+                                           itertools.repeat(end), itertools.repeat(catalog)))
+
+    def close(self):
+        with self._lock:
+            self._shutdown()
+            self._unlink()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _unlink(self):
+        # The processes copied the catalog out of the block when they attached
+        if self._catalog is not None:
+            self._catalog[1].close()
+            self._catalog[1].unlink()
+            self._catalog = None
+
+
+def merge(summaries: list[dict]) -> dict:
+    """Totals of all the stores: revenue, saleCount, units per category and per product."""
+    merged = {"revenue": 0, "saleCount": 0, "units": {}, "products": {}}
+    for summary in summaries:
+        merged["revenue"] += summary["revenue"]
+        merged["saleCount"] += summary["saleCount"]
+        for key in ("units", "products"):
+            for name, units in summary[key].items():
+                merged[key][name] = merged[key].get(name, 0) + units
+    return merged
+
+
+def _summarize(store: dict, catalog: dict[str, tuple[str, int]], start: int, end: int,
+               history: PriceHistory | None) -> dict:
+    # {storeUuid, revenue, saleCount, units: {category: n}, products: {uuid: n},
+    # workers: {uuid: [total, saleCount]}}
+    units: dict[str, int] = {}
+    products: dict[str, int] = {}
+    workers: dict[str, list[int]] = {}
+    revenue = sale_count = 0
+    history_read = False
+    for sale in store.get("sales", ()):
+        created_at = int(sale["createdAt"])
+        if not start <= created_at < end:
+            continue
+        total = 0
+        for line in sale["lines"]:
+            category, price = catalog.get(line["productUuid"], ("", 0))
+            if "price" in line:
+                price = line["price"]
+            elif history is not None:
+                # Imported sales, valued at the price in effect when they were made
+                if not history_read:
+                    history.refresh()
+                    history_read = True
+                price = history.price_at(line["productUuid"], created_at) or 0
+            total += price * line["quantity"]
+            units[category] = units.get(category, 0) + line["quantity"]
+            products[line["productUuid"]] = products.get(line["productUuid"], 0) + line["quantity"]
+        total = sale.get("total", total)
+        worker = workers.setdefault(sale["workerUuid"], [0, 0])
+        worker[0] += total
+        worker[1] += 1
+        revenue += total
+        sale_count += 1
+    return {
+        "storeUuid": store["uuid"],
+        "revenue": revenue,
+        "saleCount": sale_count,
+        "units": units,
+        "products": products,
+        "workers": workers
+    }
+
+
+def _share_catalog(products: tuple, categories: list[str]) -> shared_memory.SharedMemory:
+    count = len(products)
+    block = shared_memory.SharedMemory(create=True, size=max(1, count * (16 + UUID_SIZE)))
+    numbers = block.buf[:count * 16].cast("q")
+    index = {category: i for i, category in enumerate(categories)}
+    for i, product in enumerate(products):
+        numbers[i] = product["price"]
+        numbers[count + i] = index[product["category"]]
+    numbers.release()
+    uuids = "".join(product["uuid"] for product in products).encode("ascii")
+    block.buf[count * 16:count * 16 + len(uuids)] = uuids
+    return block
+
+
+def _attach(name: str, count: int, categories: list[str], prices_path: str | None):
+    global _prices, _attached  # pylint: disable=W0603
+    block = shared_memory.SharedMemory(name)
+    numbers = block.buf[:count * 16].cast("q")
+    uuids = bytes(block.buf[count * 16:count * (16 + UUID_SIZE)]).decode("ascii")
+    _catalog.clear()
+    for i in range(count):
+        _catalog[uuids[i * UUID_SIZE:(i + 1) * UUID_SIZE]] = (categories[numbers[count + i]],
+                                                              numbers[i])
+    numbers.release()
+    block.close()
+    _prices = PriceHistory(prices_path) if prices_path else None
+    _attached = (name, count, categories, prices_path)
+
+
+def _summarize_shard(path: str | None, start: int, end: int, catalog: tuple) -> dict | None:
+    if path is None:
+        return None
+    if catalog != _attached:
+        _attach(*catalog)
+    try:
+        with open(path, encoding="utf-8") as file:
+            store = json.load(file)
+    except FileNotFoundError:
+        return None
+    return _summarize(store, _catalog, start, end, _prices)
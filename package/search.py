@@ -0,0 +1,60 @@
+"""Search-as-you-type over the inventory rows.
+
+Typing usually narrows the previous query ("king" -> "kings", a higher minimum
+price), so the rows of the last search are filtered again instead of the whole
+catalog. Anything else, or a change to the data, starts from the rows of the
+category.
+"""
+import threading
+from typing import Callable
+
+# Rows filtered between two checks of the cancellation callback
+CHECK_EVERY = 1024
+
+
+class IncrementalSearch:
+    def __init__(self, viewmodel):
+        self._viewmodel = viewmodel
+        self._lock = threading.Lock()
+        self._last: tuple | None = None
+
+    def run(self, category: str | None = None, brand: str | None = None,
+            min_price: int | None = None, max_price: int | None = None,
+            cancelled: Callable[[], bool] | None = None) -> list[dict] | None:
+        """Rows matching the filters, or None if ``cancelled`` returned True."""
+        versions = self._viewmodel.data_versions("products", "stores")
+        query = (category, (brand or "").lower(), min_price, max_price)
+        with self._lock:
+            last = self._last
+        if last is not None and last[0] == versions and _refines(last[1], query):
+            rows = last[2]
+        else:
+            rows = self._viewmodel.search_products(category=category)
+
+        matches = []
+        _, brand, min_price, max_price = query
+        for i, row in enumerate(rows):
+            if cancelled is not None and i % CHECK_EVERY == 0 and cancelled():
+                return None
+            if brand and brand not in row["brand"].lower():
+                continue
+            if min_price is not None and row["price"] < min_price:
+                continue
+            if max_price is not None and row["price"] > max_price:
+                continue
+            matches.append(row)
+        with self._lock:
+            self._last = (versions, query, matches)
+        return matches
+
+
+def _refines(previous: tuple, query: tuple) -> bool:
+    """Whether every row matching ``query`` also matched ``previous``."""
+    category, brand, min_price, max_price = query
+    last_category, last_brand, last_min, last_max = previous
+    return (
+        category == last_category
+        and last_brand in brand
+        and (last_min is None or (min_price is not None and min_price >= last_min))
+        and (last_max is None or (max_price is not None and max_price <= last_max))
+    )
@@ -0,0 +1,278 @@
+"""HTTP/JSON API over Model for headless terminals.
+
+    $ python -m package.server --port 8080 --data data --shared
+"""
+import argparse
+import asyncio
+import dataclasses
+import gzip
+import json
+import traceback
+
+from . import metrics
+from .model import Model, Store, Worker, Product, Manager
+from .storage import default_storage
+
+ENTITIES = {"stores": Store, "workers": Worker, "products": Product, "managers": Manager}
+COMPRESS_MIN_SIZE = 1024
+CACHE_SIZE = 1024
+# Larger request bodies are answered 413 without reading them
+MAX_BODY_SIZE = 1 << 20
+# Seconds between snapshot refreshes when other processes share the data
+SHARED_POLL_INTERVAL = 1.0
+
+REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 411: "Length Required",
+    413: "Payload Too Large", 500: "Internal Server Error"
+}
+# Model errors that are not about the request itself, the other ValueErrors are 400
+# ("... not found" 404)
+CONFLICTS = ("Identification already registered", "Insufficient stock")
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Server:
+    """Reads are answered from an immutable snapshot on the event loop, writes go
+    through a queue to a single writer task which runs them in a worker thread."""
+
+    def __init__(self, model: Model, shared: bool = False):
+        self._model = model
+        self._shared = shared
+        self._snapshot = model.snapshot()
+        self._cache: dict[tuple[str, bool], tuple[bytes, bytes]] = {}
+        self._writes: asyncio.Queue | None = None
+
+    async def serve(self, host: str, port: int):
+        self._writes = asyncio.Queue()
+        tasks = [asyncio.create_task(self._writer())]
+        if self._shared:
+            tasks.append(asyncio.create_task(self._poll()))
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _poll(self):
+        # An empty write makes the writer refresh the snapshot, picking up
+        # whatever the other processes saved
+        while True:
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+            await self._write(lambda: None)
+
+    async def _writer(self):
+        while True:
+            call, future = await self._writes.get()
+            try:
+                result = await asyncio.to_thread(call)
+                snapshot = await asyncio.to_thread(self._model.snapshot)
+            except Exception as e:  # pylint: disable=W0718
+                future.set_exception(e)
+            else:
+                if snapshot.version != self._snapshot.version:
+                    self._snapshot = snapshot
+                    self._cache.clear()
+                future.set_result(result)
+
+    async def _write(self, call):
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((call, future))
+        try:
+            return await future
+        except ValueError as e:
+            message = str(e)
+            status = 409 if message in CONFLICTS else 404 if message.lower().endswith(
+                "not found") else 400
+            raise HttpError(status, message) from e
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                    raise HttpError(400, "Malformed request line")
+                method, path, version = parts
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0")
+                if not length.isdigit():
+                    raise HttpError(400, "Invalid Content-Length")
+                if int(length) > MAX_BODY_SIZE:
+                    raise HttpError(413, f"Request body over {MAX_BODY_SIZE} bytes")
+                body = await reader.readexactly(int(length)) if int(length) else b""
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if version == "HTTP/1.0":
+                    keep_alive = headers.get("connection", "").lower() == "keep-alive"
+                gzip_ok = "gzip" in headers.get("accept-encoding", "")
+                writer.write(await self._respond(method, path, body, keep_alive, gzip_ok))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            # The rest of the stream can not be trusted, the connection is closed
+            # once the error is sent
+            writer.write(self._error(e.status, str(e)))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, path: str, body: bytes,
+                       keep_alive: bool, gzip_ok: bool) -> bytes:
+        if method == "GET" and (path, gzip_ok) in self._cache:
+            head, content = self._cache[path, gzip_ok]
+            return head + self._connection(keep_alive) + content
+        if method == "GET" and path == "/metrics":
+            content = metrics.prometheus().encode()
+            return (b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(content)}\r\n".encode()
+                    + self._connection(keep_alive) + content)
+        try:
+            if method == "GET":
+                status, payload = 200, self._read(path.strip("/").split("/"))
+            else:
+                parts = path.strip("/").split("/")
+                body = json.loads(body or b"{}")
+                status, payload = await self._dispatch_write(method, parts, body)
+        except HttpError as e:
+            status, payload = e.status, {"error": str(e)}
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            status, payload = 400, {"error": f"Invalid request body: {e}"}
+        except Exception:  # pylint: disable=W0718
+            # Answered so the connection is not dropped without a response
+            traceback.print_exc()
+            status, payload = 500, {"error": REASONS[500]}
+
+        headers = [f"HTTP/1.1 {status} {REASONS[status]}"]
+        content = b"" if payload is None else json.dumps(payload).encode()
+        if payload is not None:
+            headers.append("Content-Type: application/json")
+        if gzip_ok and len(content) >= COMPRESS_MIN_SIZE:
+            content = gzip.compress(content, compresslevel=5)
+            headers += ["Content-Encoding: gzip", "Vary: Accept-Encoding"]
+        headers.append(f"Content-Length: {len(content)}")
+        head = "\r\n".join(headers).encode() + b"\r\n"
+        if method == "GET" and status == 200 and len(self._cache) < CACHE_SIZE:
+            self._cache[path, gzip_ok] = head, content
+        return head + self._connection(keep_alive) + content
+
+    @staticmethod
+    def _connection(keep_alive: bool) -> bytes:
+        return b"Connection: keep-alive\r\n\r\n" if keep_alive else b"Connection: close\r\n\r\n"
+
+    @classmethod
+    def _error(cls, status: int, message: str) -> bytes:
+        content = json.dumps({"error": message}).encode()
+        return (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(content)}\r\n").encode() + cls._connection(False) + content
+
+    def _read(self, parts: list[str]):
+        snapshot = self._snapshot
+        if parts[0] not in ENTITIES:
+            raise HttpError(404, "Unknown resource")
+        if len(parts) == 1:
+            return [_public(parts[0], value) for value in snapshot[parts[0]]]
+        entity = next((value for value in snapshot[parts[0]] if value["uuid"] == parts[1]), None)
+        if entity is None:
+            raise HttpError(404, "Entity not found")
+        if len(parts) == 2:
+            return _public(parts[0], entity)
+        if len(parts) == 3 and parts[0] == "stores" and parts[2] in ("workers", "products"):
+            return entity[parts[2]]
+        raise HttpError(404, "Unknown resource")
+
+    async def _dispatch_write(self, method: str, parts: list[str], body: dict):
+        model = self._model
+        key = parts[0]
+        if key not in ENTITIES or len(parts) > 4:
+            raise HttpError(404, "Unknown resource")
+        singular = key[:-1]
+
+        if len(parts) == 1 and method == "POST":
+            entity = _entity(ENTITIES[key], body)
+            if key == "managers":
+                identification = body["identification"]
+                entity_uuid = await self._write(lambda: model.add_manager(identification, entity))
+            else:
+                entity_uuid = await self._write(lambda: getattr(model, f"add_{singular}")(entity))
+            return 201, {"uuid": entity_uuid}
+        if len(parts) == 2 and method == "PUT":
+            entity = _entity(ENTITIES[key], body)
+            await self._write(lambda: getattr(model, f"edit_{singular}")(parts[1], entity))
+            return 204, None
+        if len(parts) == 2 and method == "DELETE":
+            await self._write(lambda: getattr(model, f"delete_{singular}")(parts[1]))
+            return 204, None
+
+        if len(parts) <= 2:
+            raise HttpError(405, "Unsupported operation")
+        if key != "stores" or parts[2] not in ("workers", "products"):
+            raise HttpError(404, "Unknown resource")
+        nested = parts[2][:-1]
+        if len(parts) == 3 and method == "POST":
+            add = getattr(model, f"add_{nested}_to_store")
+            await self._write(lambda: add(parts[1], body["uuid"]))
+            return 201, {"uuid": body["uuid"]}
+        if len(parts) == 4 and method == "PUT":
+            if nested == "product":
+                stock = body["inStock"]
+                await self._write(lambda: model.edit_product_stock(parts[1], parts[3], stock))
+            else:
+                sales = body["saleCount"]
+                await self._write(lambda: model.edit_worker_sales(parts[1], parts[3], sales))
+            return 204, None
+        if len(parts) == 4 and method == "DELETE":
+            delete = getattr(model, f"delete_{nested}_in_store")
+            await self._write(lambda: delete(parts[1], parts[3]))
+            return 204, None
+        raise HttpError(405, "Unsupported operation")
+
+
+def _public(key: str, entity: dict) -> dict:
+    if key != "managers":
+        return entity
+    return {name: value for name, value in entity.items() if name != "password"}
+
+
+def _entity(cls, body: dict):
+    def camel(name: str) -> str:
+        head, *tail = name.split("_")
+        return head + "".join(part.title() for part in tail)
+    return cls(**{field.name: body[camel(field.name)] for field in dataclasses.fields(cls)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TecnoPC HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data", default="data", help="SegmentStorage directory")
+    parser.add_argument("--shared", action="store_true", help="Share the data with other processes")
+    parser.add_argument("--metrics", action="store_true", help="Record metrics, served on /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+    storage = default_storage(args.data, shared=args.shared)
+    try:
+        asyncio.run(Server(Model(storage), args.shared).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
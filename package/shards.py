@@ -0,0 +1,48 @@
+import concurrent.futures
+import functools
+import json
+
+from .storage import SegmentStorage
+
+
+def map_stores(storage: SegmentStorage, function, store_uuids: list[str] | None = None,
+               max_workers: int | None = None) -> dict:
+    """Runs ``function(store)`` over every store shard in a process pool. The
+    function must be picklable (a module level function or a functools.partial of one)."""
+    # Held until every shard is read, a save in another process removes the
+    # shards it replaces
+    with storage.lock():
+        paths = storage.shard_paths()
+        if store_uuids is not None:
+            paths = {key: value for key, value in paths.items() if key in store_uuids}
+        if not paths:
+            return {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            results = executor.map(functools.partial(_apply, function), paths.values())
+            return dict(zip(paths.keys(), results))
+
+
+def stock_by_store(storage: SegmentStorage, product_uuid: str) -> dict[str, int | None]:
+    results = map_stores(storage, functools.partial(_product_stock, product_uuid=product_uuid))
+    return {key: value for key, value in results.items() if value is not False}
+
+
+def stores_of_worker(storage: SegmentStorage, worker_uuid: str) -> list[str]:
+    results = map_stores(storage, functools.partial(_has_worker, worker_uuid=worker_uuid))
+    return [key for key, value in results.items() if value]
+
+
+def _apply(function, path: str):
+    with open(path, encoding="utf-8") as file:
+        return function(json.load(file))
+
+
+def _product_stock(store: dict, product_uuid: str) -> int | None | bool:
+    for product in store["products"]:
+        if product["uuid"] == product_uuid:
+            return product["inStock"]
+    return False
+
+
+def _has_worker(store: dict, worker_uuid: str) -> bool:
+    return any(worker["uuid"] == worker_uuid for worker in store["workers"])
@@ -0,0 +1,161 @@
+"""Typed component specifications, one columnar table per category.
+
+A table is stored as one record ``{"category", "uuid": [...], field: [...]}``
+in the "specs" collection, row i of every column describing product uuid[i].
+SpecCatalog indexes the tables for the filters the shop uses most: equality on
+socket and chipset, ranges on capacity and VRAM.
+"""
+import bisect
+
+# Fields of every category, from the classes of temp/componente.py plus what the
+# compatibility rules need (memoryType of RAM and boards, tdp of processors)
+SPEC_FIELDS: dict[str, dict[str, type]] = {
+    "RAM": {"capacity": int, "speed": int, "memoryType": str},
+    "Procesador": {"cores": int, "speed": float, "socket": str, "tdp": int},
+    "Tarjeta Gráfica": {"vram": int, "memoryType": str},
+    "Placa Madre": {"socket": str, "formFactor": str, "chipset": str, "memoryType": str},
+    "SSD": {"capacity": int, "readSpeed": int, "writeSpeed": int},
+    "Refrigeración": {"coolingType": str, "tdp": int},
+    "Disipador de Calor": {"material": str, "dimensions": str}
+}
+INDEXED = ("socket", "chipset", "capacity", "vram")
+
+
+def validate(category: str, specs: dict) -> dict:
+    """Specs converted to the types of the category, missing fields as None."""
+    fields = SPEC_FIELDS.get(category)
+    if fields is None:
+        raise ValueError("Invalid category")
+    unknown = set(specs) - set(fields)
+    if unknown:
+        raise ValueError(f"Invalid spec field: {', '.join(sorted(unknown))}")
+    try:
+        return {
+            field: kind(specs[field]) if specs.get(field) is not None else None
+            for field, kind in fields.items()
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid spec value: {e}") from e
+
+
+def empty_table(category: str) -> dict:
+    return {"category": category, "uuid": (), **{field: () for field in SPEC_FIELDS[category]}}
+
+
+def column(table: dict, field: str) -> tuple:
+    # Fields added after a table was saved read as None
+    values = table.get(field)
+    return tuple(values) if values is not None else (None,) * len(table["uuid"])
+
+
+def get_row(table: dict, product_uuid: str) -> dict | None:
+    if product_uuid not in table["uuid"]:
+        return None
+    row = table["uuid"].index(product_uuid)
+    return {field: column(table, field)[row] for field in SPEC_FIELDS[table["category"]]}
+
+
+def set_row(table: dict, product_uuid: str, specs: dict | None) -> dict:
+    """Copy of ``table`` with the row of the product replaced, added or, when
+    ``specs`` is None, removed."""
+    uuids = table["uuid"]
+    row = uuids.index(product_uuid) if product_uuid in uuids else None
+    fields = SPEC_FIELDS[table["category"]]
+    if specs is None:
+        if row is None:
+            return table
+        return {
+            "category": table["category"],
+            "uuid": uuids[:row] + uuids[row + 1:],
+            **{field: column(table, field)[:row] + column(table, field)[row + 1:]
+               for field in fields}
+        }
+    if row is None:
+        return {
+            "category": table["category"],
+            "uuid": uuids + (product_uuid,),
+            **{field: column(table, field) + (specs[field],) for field in fields}
+        }
+    return {
+        "category": table["category"],
+        "uuid": uuids,
+        **{field: column(table, field)[:row] + (specs[field],) + column(table, field)[row + 1:]
+           for field in fields}
+    }
+
+
+class SpecTable:
+    def __init__(self, table: dict):
+        self.category = table["category"]
+        self.uuids = table["uuid"]
+        self.columns = {field: column(table, field) for field in SPEC_FIELDS[self.category]}
+        self.rows = {product_uuid: row for row, product_uuid in enumerate(self.uuids)}
+        # Text fields map value -> rows, numeric ones keep (value, row) sorted
+        self._equal: dict[str, dict] = {}
+        self._sorted: dict[str, tuple[list, list]] = {}
+        for field in INDEXED:
+            values = self.columns.get(field)
+            if values is None:
+                continue
+            if SPEC_FIELDS[self.category][field] is str:
+                index: dict[str, list[int]] = {}
+                for row, value in enumerate(values):
+                    index.setdefault(value, []).append(row)
+                self._equal[field] = index
+            else:
+                pairs = sorted((value, row) for row, value in enumerate(values)
+                               if value is not None)
+                self._sorted[field] = ([value for value, _ in pairs], [row for _, row in pairs])
+
+    def specs(self, product_uuid: str) -> dict | None:
+        row = self.rows.get(product_uuid)
+        if row is None:
+            return None
+        return {field: column[row] for field, column in self.columns.items()}
+
+    def find(self, criteria: dict) -> list[str]:
+        """Uuids matching every criterion, a value for equality or a (low, high)
+        tuple for an inclusive range where either end can be None."""
+        rows = None
+        rest = []
+        for field, wanted in criteria.items():
+            if field not in self.columns:
+                raise ValueError(f"Invalid spec field: {field}")
+            if field in self._equal and not isinstance(wanted, tuple):
+                matched = set(self._equal[field].get(wanted, ()))
+            elif field in self._sorted:
+                values, positions = self._sorted[field]
+                low, high = wanted if isinstance(wanted, tuple) else (wanted, wanted)
+                start = 0 if low is None else bisect.bisect_left(values, low)
+                end = len(values) if high is None else bisect.bisect_right(values, high)
+                matched = set(positions[start:end])
+            else:
+                rest.append((field, wanted))
+                continue
+            rows = matched if rows is None else rows & matched
+        candidates = sorted(rows) if rows is not None else range(len(self.uuids))
+        return [self.uuids[row] for row in candidates
+                if all(_matches(self.columns[field][row], wanted) for field, wanted in rest)]
+
+
+class SpecCatalog:
+    def __init__(self, tables: tuple):
+        self.tables = {table["category"]: SpecTable(table) for table in tables}
+
+    def specs(self, category: str, product_uuid: str) -> dict | None:
+        table = self.tables.get(category)
+        return table.specs(product_uuid) if table is not None else None
+
+    def find(self, category: str, criteria: dict) -> list[str]:
+        if category not in SPEC_FIELDS:
+            raise ValueError("Invalid category")
+        table = self.tables.get(category)
+        return table.find(criteria) if table is not None else []
+
+
+def _matches(value, wanted) -> bool:
+    if isinstance(wanted, tuple):
+        low, high = wanted
+        return value is not None and (low is None or value >= low) and (
+            high is None or value <= high)
+    return value == wanted
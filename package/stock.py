@@ -0,0 +1,121 @@
+"""Low stock alerts and reorder suggestions.
+
+Every product of a store can have a threshold (``reorderAt`` of its record in
+the store). LowStockIndex keeps only the (store, product) pairs below their
+threshold, sorted by how far below, so listing them costs O(alerts) and a stock
+change moves at most one entry.
+
+The reorder report, meant to run once a night (``scripts/reorder_report.py``),
+reads the sales of the last days from the ledger and computes the order of every
+stocked product in one pass over columns (``array('q')``) of the stores.
+"""
+import array
+import bisect
+import math
+import time
+
+
+def is_low(item: dict | None) -> bool:
+    return (item is not None and item.get("reorderAt") is not None
+            and (item["inStock"] or 0) < item["reorderAt"])
+
+
+def fires(before: dict | None, after: dict | None) -> bool:
+    """Whether a change of a store's product record starts an alert."""
+    return is_low(after) and not is_low(before)
+
+
+class LowStockIndex:
+    def __init__(self, stores: tuple = ()):
+        # (stock - threshold, store uuid, product uuid), only of the pairs below
+        self._order: list[tuple[int, str, str]] = []
+        self._keys: dict[tuple[str, str], tuple[int, str, str]] = {}
+        for store in stores:
+            for item in store["products"]:
+                if is_low(item):
+                    key = ((item["inStock"] or 0) - item["reorderAt"], store["uuid"], item["uuid"])
+                    self._order.append(key)
+                    self._keys[store["uuid"], item["uuid"]] = key
+        self._order.sort()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def update(self, store_uuid: str, product_uuid: str, item: dict | None):
+        """Sets the record of a store's product, None when it was removed."""
+        previous = self._keys.pop((store_uuid, product_uuid), None)
+        if previous is not None:
+            del self._order[bisect.bisect_left(self._order, previous)]
+        if is_low(item):
+            key = ((item["inStock"] or 0) - item["reorderAt"], store_uuid, product_uuid)
+            bisect.insort(self._order, key)
+            self._keys[store_uuid, product_uuid] = key
+
+    def copy(self) -> "LowStockIndex":
+        """Index to update while readers go on with this one."""
+        index = LowStockIndex()
+        index._order = list(self._order)
+        index._keys = dict(self._keys)
+        return index
+
+    def alerts(self, store_uuid: str | None = None) -> list[dict]:
+        """Pairs below their threshold, the furthest below first."""
+        return [
+            {"storeUuid": store, "productUuid": product, "missing": -difference}
+            for difference, store, product in self._order
+            if store_uuid is None or store == store_uuid
+        ]
+
+
+def reorder_report(stores: tuple, now: int | None = None, window_days: int = 30,
+                   lead_days: int = 7, cover_days: int = 30) -> list[dict]:
+    """What to order of every product of every store, from the units sold per day
+    in the last ``window_days``. A product is ordered when its stock does not last
+    the ``lead_days`` the order takes to arrive or is below its threshold, enough
+    for ``cover_days`` more on top of the threshold."""
+    now = now if now is not None else int(time.time())
+    start = now - window_days * 86400
+    rows: dict[tuple[str, str], int] = {}
+    stock, threshold, sold = array.array("q"), array.array("q"), array.array("q")
+    keys = []
+    for store in stores:
+        for item in store["products"]:
+            rows[store["uuid"], item["uuid"]] = len(keys)
+            keys.append((store["uuid"], item["uuid"]))
+            stock.append(item["inStock"] or 0)
+            threshold.append(item["reorderAt"] if item.get("reorderAt") is not None else -1)
+            sold.append(0)
+        # Sales are appended in date order, only the tail is in the window
+        for sale in reversed(store.get("sales", ())):
+            if int(sale["createdAt"]) < start:
+                break
+            if int(sale["createdAt"]) > now:
+                continue
+            for line in sale["lines"]:
+                row = rows.get((store["uuid"], line["productUuid"]))
+                if row is not None:
+                    sold[row] += line["quantity"]
+
+    report = []
+    for (store_uuid, product_uuid), units, minimum, sold_units in zip(keys, stock, threshold,
+                                                                      sold):
+        daily = sold_units / window_days
+        reserve = max(minimum, 0)
+        if units >= max(reserve, math.ceil(daily * lead_days)):
+            continue
+        quantity = math.ceil(daily * (lead_days + cover_days)) + reserve - units
+        if quantity <= 0:
+            continue
+        report.append({
+            "storeUuid": store_uuid,
+            "productUuid": product_uuid,
+            "inStock": units,
+            "reorderAt": minimum if minimum >= 0 else None,
+            "dailySales": round(daily, 2),
+            "daysLeft": round(units / daily, 1) if daily else None,
+            "quantity": quantity
+        })
+    # Most urgent first, products without sales (below their threshold) last
+    report.sort(key=lambda row: (row["storeUuid"], row["daysLeft"] is None,
+                                 row["daysLeft"] or 0))
+    return report
@@ -0,0 +1,325 @@
+import contextlib
+import json
+import os
+from collections.abc import Iterable, Iterator, Mapping
+
+from . import metrics
+from .locking import FileLock
+
+
+def _stamp(path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _dump_records(records: Iterable[dict], file):
+    # Writes a JSON array one record at a time so the whole collection never has
+    # to be in memory
+    file.write("[")
+    for i, record in enumerate(records):
+        if i:
+            file.write(",")
+        _dump_record(record, file)
+    file.write("]")
+
+
+def _dump_record(record: dict, file):
+    # Values that are iterators (the columns or the ledger of generated data) are
+    # written as arrays one item at a time too
+    if not any(isinstance(value, Iterator) for value in record.values()):
+        file.write(json.dumps(record, separators=(",", ":")))
+        return
+    file.write("{")
+    for i, (key, value) in enumerate(record.items()):
+        file.write(f"{',' if i else ''}{json.dumps(key)}:")
+        if isinstance(value, Iterator):
+            file.write("[")
+            for j, item in enumerate(value):
+                file.write(f"{',' if j else ''}{json.dumps(item, separators=(',', ':'))}")
+            file.write("]")
+        else:
+            file.write(json.dumps(value, separators=(",", ":")))
+    file.write("}")
+
+
+class JsonStorage:
+    def __init__(self, path: str = "data.json", shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._lock = FileLock(f"{path}.lock")
+        self._stamp = None
+
+    def lock(self):
+        return self._lock if self.shared else contextlib.nullcontext()
+
+    def sidecar(self, name: str) -> str:
+        """Path of an auxiliary file kept next to the data."""
+        return f"{self.path}.{name}"
+
+    def load(self) -> dict:
+        with open(self.path, encoding="utf-8") as file:
+            data = json.load(file)
+        self._stamp = _stamp(self.path)
+        return data
+
+    def stream(self) -> dict:
+        """Like load, the single file has to be parsed at once."""
+        return self.load()
+
+    def refresh(self, data: dict) -> set[str]:
+        if not self.shared or _stamp(self.path) == self._stamp:
+            return set()
+        data.clear()
+        data.update(self.load())
+        return set(data)
+
+    def save(self, data: Mapping, dirty: dict[str, set[str]]):  # pylint: disable=W0613
+        # Written aside and renamed, so a reader (or a backup) never sees half a file
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(dict(data), file, separators=(",", ":"))
+            metrics.count("storage.bytes_written", file.tell())
+        os.replace(f"{self.path}.tmp", self.path)
+        self._stamp = _stamp(self.path)
+
+    def bulk_write(self, collections: Mapping[str, Iterable[dict]]):
+        """Replaces all the data, consuming each collection as a stream."""
+        with self.lock(), open(self.path, "w", encoding="utf-8") as file:
+            file.write("{")
+            for i, (key, records) in enumerate(collections.items()):
+                file.write(f"{',' if i else ''}{json.dumps(key)}:")
+                _dump_records(records, file)
+            file.write("}")
+            metrics.count("storage.bytes_written", file.tell())
+        self._stamp = _stamp(self.path)
+
+
+class SegmentStorage:
+    """Stores every top level collection in its own segment file and every store
+    (with its nested workers and products) in its own shard file. The manifest is
+    the only file that is replaced in place, so a crash in the middle of a save
+    leaves the previous state readable.
+
+    With ``shared=True`` several processes can use the same directory: writes are
+    serialized with a lock file and ``refresh`` reloads only the segments and
+    shards another process replaced since the last load."""
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory: str = "data", stores: list[str] | None = None,
+                 shared: bool = False):
+        self.directory = directory
+        self.shared = shared
+        # Store uuids this instance works with, None means every store
+        self._stores = set(stores) if stores is not None else None
+        self._lock = FileLock(os.path.join(directory, "lock"))
+        self._manifest: dict | None = None
+        self._stamp = None
+
+    def lock(self):
+        return self._lock if self.shared else contextlib.nullcontext()
+
+    def sidecar(self, name: str) -> str:
+        """Path of an auxiliary file kept next to the data."""
+        return os.path.join(self.directory, name)
+
+    def load(self) -> dict:
+        self._stamp = _stamp(os.path.join(self.directory, self.MANIFEST))
+        manifest = self._read(self.MANIFEST)
+        data = {key: self._read(name) for key, name in manifest["segments"].items()}
+        data["stores"] = [
+            self._read(entry["file"]) for entry in manifest["stores"] if self._owns(entry["uuid"])
+        ]
+        self._manifest = manifest
+        return data
+
+    def stream(self) -> dict:
+        """Like load, but "stores" is an iterator that reads one shard at a time.
+        Hold the lock while consuming it, a save can remove the shards."""
+        manifest = self._read(self.MANIFEST)
+        data = {key: self._read(name) for key, name in manifest["segments"].items()}
+        data["stores"] = (
+            self._read(entry["file"]) for entry in manifest["stores"] if self._owns(entry["uuid"])
+        )
+        return data
+
+    def refresh(self, data: dict) -> set[str]:
+        stamp = _stamp(os.path.join(self.directory, self.MANIFEST))
+        if not self.shared or stamp == self._stamp:
+            return set()
+        self._stamp = stamp
+        manifest = self._read(self.MANIFEST)
+        if self._manifest is not None and manifest["sequence"] == self._manifest["sequence"]:
+            return set()
+        previous = self._manifest or {"segments": {}, "stores": []}
+        changed = set()
+        for key, name in manifest["segments"].items():
+            if previous["segments"].get(key) != name:
+                data[key] = self._read(name)
+                changed.add(key)
+
+        loaded = {store["uuid"]: store for store in data.get("stores", [])}
+        files = {entry["uuid"]: entry["file"] for entry in previous["stores"]}
+        stores = []
+        for entry in manifest["stores"]:
+            if not self._owns(entry["uuid"]):
+                continue
+            if files.get(entry["uuid"]) != entry["file"] or entry["uuid"] not in loaded:
+                stores.append(self._read(entry["file"]))
+                changed.add("stores")
+            else:
+                stores.append(loaded[entry["uuid"]])
+        if len(stores) != len(loaded):
+            changed.add("stores")
+        data["stores"] = stores
+        self._manifest = manifest
+        return changed
+
+    def shard_paths(self) -> dict[str, str]:
+        manifest = self._read(self.MANIFEST)
+        return {
+            entry["uuid"]: os.path.join(self.directory, entry["file"])
+            for entry in manifest["stores"]
+        }
+
+    def save(self, data: Mapping, dirty: dict[str, set[str]]):
+        manifest = self._manifest or {"version": 1, "sequence": 0, "segments": {}, "stores": []}
+        sequence = manifest["sequence"] + 1
+        written, obsolete = [], []
+
+        segments = dict(manifest["segments"])
+        for key, value in data.items():
+            if key == "stores" or (key in segments and key not in dirty):
+                continue
+            if key in segments:
+                obsolete.append(segments[key])
+            segments[key] = f"{key}.{sequence}.json"
+            self._write(segments[key], value)
+            written.append(segments[key])
+
+        current = {store["uuid"]: store for store in data["stores"]}
+        changed = dirty.get("stores", set())
+        stores = []
+        for entry in manifest["stores"]:
+            store = current.pop(entry["uuid"], None)
+            if store is None:
+                if self._owns(entry["uuid"]):
+                    obsolete.append(entry["file"])
+                else:
+                    stores.append(entry)
+                continue
+            if entry["uuid"] in changed:
+                obsolete.append(entry["file"])
+                entry = {"uuid": entry["uuid"], "file": f"stores/{entry['uuid']}.{sequence}.json"}
+                self._write(entry["file"], store)
+                written.append(entry["file"])
+            stores.append(entry)
+        for store_uuid, store in current.items():
+            if self._stores is not None:
+                self._stores.add(store_uuid)
+            stores.append({"uuid": store_uuid, "file": f"stores/{store_uuid}.{sequence}.json"})
+            self._write(stores[-1]["file"], store)
+            written.append(stores[-1]["file"])
+
+        if self._manifest is not None and not written and not obsolete:
+            return
+        self._manifest = {
+            "version": 1, "sequence": sequence, "segments": segments, "stores": stores
+        }
+        self._write(self.MANIFEST, self._manifest)
+        self._stamp = _stamp(os.path.join(self.directory, self.MANIFEST))
+        for name in obsolete:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def bulk_write(self, collections: Mapping[str, Iterable[dict]]):
+        """Replaces all the data, consuming each collection as a stream. Store
+        records are written one shard at a time."""
+        with self.lock():
+            try:
+                previous = self._read(self.MANIFEST)
+            except FileNotFoundError:
+                previous = {"sequence": 0, "segments": {}, "stores": []}
+            sequence = previous["sequence"] + 1
+            segments, stores = {}, []
+            for key, records in collections.items():
+                if key != "stores":
+                    segments[key] = f"{key}.{sequence}.json"
+                    self._write(segments[key], records, stream=True)
+                    continue
+                for store in records:
+                    name = f"stores/{store['uuid']}.{sequence}.json"
+                    self._write(name, store)
+                    stores.append({"uuid": store["uuid"], "file": name})
+            self._manifest = {
+                "version": 1, "sequence": sequence, "segments": segments, "stores": stores
+            }
+            self._write(self.MANIFEST, self._manifest)
+            self._stamp = _stamp(os.path.join(self.directory, self.MANIFEST))
+            current = set(segments.values()) | {entry["file"] for entry in stores}
+            old = [*previous["segments"].values(), *(entry["file"] for entry in previous["stores"])]
+            for name in old:
+                if name not in current:
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+
+    def _owns(self, store_uuid: str) -> bool:
+        return self._stores is None or store_uuid in self._stores
+
+    def _read(self, name: str):
+        with open(os.path.join(self.directory, name), encoding="utf-8") as file:
+            return json.load(file)
+
+    def _write(self, name: str, value, stream: bool = False):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            if stream:
+                _dump_records(value, file)
+            elif isinstance(value, Mapping):
+                _dump_record(value, file)
+            else:
+                json.dump(value, file, separators=(",", ":"))
+            metrics.count("storage.bytes_written", file.tell())
+            metrics.count("storage.files_written")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+
+def default_storage(directory: str = "data", legacy: str = "data.json",
+                    shared: bool = False) -> "JsonStorage | SegmentStorage":
+    """Storage of ``Model()``: the SegmentStorage in ``directory``, or ``legacy``
+    (the single file used before segments) while it has not been migrated with
+    migrate_json. Never writes, so readers like the report scripts can use it."""
+    if not os.path.exists(os.path.join(directory, SegmentStorage.MANIFEST)) \
+            and os.path.exists(legacy):
+        return JsonStorage(legacy, shared=shared)
+    return SegmentStorage(directory, shared=shared)
+
+
+def migrate_json(legacy: str = "data.json", directory: str = "data") -> bool:
+    """Moves a ``legacy`` single file into a SegmentStorage in ``directory``
+    with its sidecar files, keeping it as ``<legacy>.migrated``. Does nothing,
+    returning False, when there is no file or the directory already has data."""
+    if os.path.exists(os.path.join(directory, SegmentStorage.MANIFEST)) \
+            or not os.path.exists(legacy):
+        return False
+    storage = SegmentStorage(directory)
+    storage.bulk_write(JsonStorage(legacy).load())
+    # data.json.prices.bin, data.json.audit, ... become data/prices.bin, data/audit
+    prefix = f"{os.path.basename(legacy)}."
+    folder = os.path.dirname(legacy) or "."
+    for name in os.listdir(folder):
+        sidecar = name[len(prefix):]
+        if name.startswith(prefix) and sidecar not in ("lock", "tmp", "migrated"):
+            os.replace(os.path.join(folder, name), storage.sidecar(sidecar))
+    os.replace(legacy, f"{legacy}.migrated")
+    return True
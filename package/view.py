@@ -1,6 +1,26 @@
 # pylint: disable=I1101
 import os
-from PySide6 import QtUiTools, QtWidgets
+import threading
+import time
+from PySide6 import QtCore, QtUiTools, QtWidgets
+
+from . import metrics, profiling
+
+# Pausa en la escritura antes de buscar y filas agregadas a la tabla por vuelta
+SEARCH_DEBOUNCE_MS = 250
+SEARCH_PAGE_SIZE = 200
+PRICE_LIMIT = 10_000_000
+# Columnas del historial de ventas que se pueden ordenar (Fecha y Total)
+HISTORY_SORTS = {1: "date", 5: "total"}
+
+class SearchSignals(QtCore.QObject):
+    # (numero de busqueda, filas), emitida desde el hilo de busqueda
+    ready = QtCore.Signal(int, object)
+
+class ChangeSignals(QtCore.QObject):
+    # Lleva la entrega de los cambios acumulados al hilo de la interfaz: como la
+    # conexion es en cola corre en la vuelta siguiente del bucle de eventos
+    tick = QtCore.Signal(object)
 
 class BaseWidget(QtUiTools.QUiLoader):
     def __init__(self, path):
@@ -18,11 +38,23 @@ class View(BaseWidget):
         # vars
         self.tabs = self.widget.tabWidget
         self.tabs.currentChanged.connect(self.handle_dinamic_data)
-        self.data = self.viewmodel.get_data()
-
-        self.shops = self.data["Tiendas"]
-        self.salesmans = self.data["Vendedores"]
-        self.components = self.data["Componentes"]
+        self.cart = None
+        self.search_generation = 0
+        self.search_signals = SearchSignals()
+        self.search_signals.ready.connect(self.mostrar_resultados)
+        self.search_timer = QtCore.QTimer(self.widget)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.buscar_componentes)
+        # Historial de ventas: orden, descendente y cursor de la pagina siguiente
+        self.history_sort = "date"
+        self.history_descending = True
+        self.history_cursor = None
+        # Cambios del modelo, en un lote por vuelta del bucle de eventos
+        self.change_signals = ChangeSignals()
+        self.change_signals.tick.connect(lambda flush: flush(), QtCore.Qt.QueuedConnection)
+        self.viewmodel.schedule_changes(self.change_signals.tick.emit)
+        self.viewmodel.change_listeners.append(self.aplicar_cambios)
 
         self.type = [
             "Todos",
@@ -36,47 +68,59 @@ class View(BaseWidget):
         ]
 
         # adding data
-        for shop in self.shops:
-            self.widget.shopComboBox.addItem(f"{shop['nombre']} - {shop['direccion']}", shop)
+        for shop in self.viewmodel.get_shops():
+            self.widget.shopComboBox.addItem(shop["label"], shop["uuid"])
         for item in self.type:
             self.widget.type_comboBox.addItem(item, item)
         self.widget.inventory_table.setHorizontalHeaderLabels([
             "ID", "Nombre", "Tipo", "Marca", "Precio", "Stock", "Tienda"
         ])
+        # El maximo en su tope significa sin limite
+        self.widget.precio_min.setMaximum(PRICE_LIMIT)
+        self.widget.precio_max.setMaximum(PRICE_LIMIT)
+        self.widget.precio_max.setValue(PRICE_LIMIT)
 
 
         # btns
         # (con los botones tienen que conectar y las funcionalidades)
         # - tab 1
-        # self._ui_widget.buscar_btn
+        self.widget.buscar_btn.clicked.connect(self.buscar_componentes)
+        # Sin lambda el valor de la señal llega a QTimer.start(msec) como intervalo
+        self.widget.marca_edit.textChanged.connect(lambda *_: self.search_timer.start())
+        self.widget.precio_min.valueChanged.connect(lambda *_: self.search_timer.start())
+        self.widget.precio_max.valueChanged.connect(lambda *_: self.search_timer.start())
+        self.widget.type_comboBox.currentIndexChanged.connect(
+            lambda *_: self.search_timer.start())
         # self._ui_widget.add_component_btn
         # self._ui_widget.edit_component_btn
         # self._ui_widget.transfer_btn
         # - tab 2
-        # self._ui_widget.new_sell_btn
-        # self._ui_widget.add_item_btn
-        # self._ui_widget.cancel_btn
-        # self._ui_widget.end_sell_btn
+        self.widget.new_sell_btn.clicked.connect(self.iniciar_nueva_venta)
+        self.widget.add_item_btn.clicked.connect(self.agregar_item_venta)
+        self.widget.cancel_btn.clicked.connect(self.cancelar_venta)
+        self.widget.end_sell_btn.clicked.connect(self.finalizar_venta)
+        self.widget.history_sale_table.verticalScrollBar().valueChanged.connect(
+            self._historial_scroll
+        )
+        self.widget.history_sale_table.horizontalHeader().sectionClicked.connect(
+            self.ordenar_historial
+        )
         # - tab 3
         # self._ui_widget.add_saleman_btn
         # self._ui_widget.edit_saleman_btn
         # self._ui_widget.view_stats_btn
-        # self._ui_widget.calculation_comission
+        self.widget.calculation_comission.clicked.connect(self.calcular_comisiones)
 
+    @profiling.action()
+    @metrics.timed()
     def handle_dinamic_data(self, tab: int): # es para hacer que los datos aparescan en el tab 2,3
 
         if tab == 1:
-            for salesman in self.salesmans:
-                self.widget.seller_comboBox.addItem(
-                    f"{salesman['nombre']} - {salesman['tienda']}",
-                    salesman
-                )
-
-            for component in self.components:
-                self.widget.components_comboBox.addItem(
-                    f"{component['nombre']} - {component['tipo']}",
-                    component
-                )
+            self._cargar_vendedores()
+
+            self.widget.components_comboBox.clear()
+            for component in self.viewmodel.get_components():
+                self.widget.components_comboBox.addItem(component["label"], component["uuid"])
             self.widget.item_sale_table.setHorizontalHeaderLabels([
                 "ID",
                 "Componente",
@@ -92,7 +136,8 @@ class View(BaseWidget):
                 "Items",
                 "Total"
             ])
-        elif tab == 2:
+            self.mostrar_historial_ventas()
+        elif tab == 2 and not self.widget.month_comboBox.count():
             months = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
                  "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
             for i, month in enumerate(months, 1):
@@ -113,58 +158,206 @@ class View(BaseWidget):
                 "Tienda"
             ])
 
+    def _cargar_vendedores(self):
+        self.widget.seller_comboBox.clear()
+        for salesman in self.viewmodel.get_salesmen():
+            self.widget.seller_comboBox.addItem(
+                f"{salesman['name']} - {salesman['store']}",
+                salesman
+            )
+
+    @profiling.action()
+    @metrics.timed()
+    def aplicar_cambios(self, diff: dict):
+        """Actualiza solo lo que cambio segun el lote de cambios del modelo (ver
+        ViewModel._forward_changes), llega una vez por vuelta del bucle de eventos."""
+        if "shops" in diff:
+            _actualizar_combo(self.widget.shopComboBox, diff["shops"])
+        # El combo de componentes se llena al abrir la pestaña de ventas
+        if "components" in diff and self.widget.components_comboBox.count():
+            _actualizar_combo(self.widget.components_comboBox, diff["components"])
+        if "salesmen" in diff and self.tabs.currentIndex() == 1:
+            self._cargar_vendedores()
+        # La tabla de inventario muestra precios y stock: se repite la busqueda
+        if ("components" in diff or "stock" in diff) and self.widget.inventory_table.rowCount():
+            self.search_timer.start()
+        if "sales" in diff and self.tabs.currentIndex() == 1:
+            self.mostrar_historial_ventas()
+
     # Métodos de acción para los distintos eventos (archivo de origen: interfaz_tienda.py)
 
+    @profiling.action()
+    @metrics.timed()
     def buscar_componentes(self):
         """Ejecuta la búsqueda de componentes según los filtros."""
-        # Aquí se implementaría la lógica de búsqueda
-        QtWidgets.QMessageBox.information(
-            self.widget,
-            "Búsqueda",
-            "Función de búsqueda no implementada."
+        self.search_timer.stop()
+        # Una busqueda nueva deja obsoletas las que sigan corriendo
+        self.search_generation += 1
+        generation = self.search_generation
+        max_price = self.widget.precio_max.value()
+        filters = (
+            self.widget.type_comboBox.currentData(),
+            self.widget.marca_edit.text().strip(),
+            int(self.widget.precio_min.value()) or None,
+            None if max_price >= PRICE_LIMIT else int(max_price)
+        )
+        threading.Thread(target=self._buscar, args=(generation, filters), daemon=True).start()
+
+    def _buscar(self, generation: int, filters: tuple):
+        rows = self.viewmodel.search_incremental(
+            *filters, cancelled=lambda: generation != self.search_generation
         )
+        if rows is not None:
+            self.search_signals.ready.emit(generation, rows)
+
+    def mostrar_resultados(self, generation: int, rows: list):
+        """Llena la tabla de inventario por paginas para no congelar la interfaz."""
+        if generation != self.search_generation:
+            return
+        self.widget.inventory_table.setRowCount(0)
+        self._mostrar_pagina(generation, rows, 0)
+
+    def _mostrar_pagina(self, generation: int, rows: list, start: int):
+        if generation != self.search_generation:
+            return
+        table = self.widget.inventory_table
+        page = rows[start:start + SEARCH_PAGE_SIZE]
+        table.setRowCount(start + len(page))
+        for row, item in enumerate(page, start):
+            values = (item["uuid"], item["name"], item["category"], item["brand"],
+                      item["price"], item["stock"], item["store"])
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(str(value)))
+        if start + SEARCH_PAGE_SIZE < len(rows):
+            QtCore.QTimer.singleShot(
+                0, lambda: self._mostrar_pagina(generation, rows, start + SEARCH_PAGE_SIZE)
+            )
 
     def mostrar_form_agregar_componente(self):
         """Muestra el formulario para agregar un nuevo componente."""
         QtWidgets.QMessageBox.information(self.widget, "Agregar Componente",
                                "Función para agregar componente no implementada.")
 
+    @profiling.action()
     def iniciar_nueva_venta(self):
         """Inicia una nueva venta."""
-        if not self.widget.cliente_edit.text():
+        if not self.widget.client_edit.text():
             QtWidgets.QMessageBox.warning(self.widget, "Error", "Debe ingresar un cliente.")
             return
 
-        # Obtener vendedor y tienda seleccionados
+        # El vendedor define la tienda de la venta
         vendedor = self.widget.seller_comboBox.currentData()
-        tienda = self.widget.shopComboBox.currentData()
-
-        # Crear nueva venta
-        # Aquí se implementaría la lógica con el controlador_ventas
+        if vendedor is None:
+            QtWidgets.QMessageBox.warning(self.widget, "Error", "Debe seleccionar un vendedor.")
+            return
+        try:
+            self.cart = self.viewmodel.open_sale(
+                vendedor["storeUuid"], vendedor["uuid"], self.widget.client_edit.text()
+            )
+        except ValueError as error:
+            QtWidgets.QMessageBox.warning(self.widget, "Error", str(error))
+            return
+        self.mostrar_items_venta()
 
-        self.widget.label_6.setText(f"Venta en curso: Cliente {self.widget.cliente_edit.text()}")
+        self.widget.label_6.setText(f"Venta en curso: Cliente {self.widget.client_edit.text()}")
         QtWidgets.QMessageBox.information(
             self.widget,
             "Nueva Venta",
             "Venta iniciada correctamente."
         )
 
+    @profiling.action()
     def agregar_item_venta(self):
         """Agrega un ítem a la venta actual."""
-        QtWidgets.QMessageBox.information(self.widget, "Agregar Ítem",
-                               "Función para agregar ítem no implementada.")
+        if self.cart is None:
+            QtWidgets.QMessageBox.warning(self.widget, "Error", "No hay venta en curso.")
+            return
+        try:
+            self.viewmodel.add_sale_item(
+                self.cart,
+                self.widget.components_comboBox.currentData(),
+                self.widget.spinBox.value()
+            )
+        except ValueError as error:
+            QtWidgets.QMessageBox.warning(self.widget, "Error", str(error))
+            return
+        self.mostrar_items_venta()
 
+    @profiling.action()
+    @metrics.timed()
     def finalizar_venta(self):
         """Finaliza la venta actual."""
+        if self.cart is None:
+            QtWidgets.QMessageBox.warning(self.widget, "Error", "No hay venta en curso.")
+            return
+        try:
+            venta = self.viewmodel.finalize_sale(self.cart)
+        except ValueError as error:
+            QtWidgets.QMessageBox.warning(self.widget, "Error", str(error))
+            return
+        self.cart = None
+        self.mostrar_items_venta()
+        self.mostrar_historial_ventas()
+        self.widget.label_6.setText("No hay venta en curso")
         QtWidgets.QMessageBox.information(self.widget, "Finalizar Venta",
-                               "Función para finalizar venta no implementada.")
+                               f"Venta registrada con la boleta N° {venta['receipt']}.")
 
     def cancelar_venta(self):
         """Cancela la venta actual."""
+        self.cart = None
+        self.mostrar_items_venta()
         self.widget.label_6.setText("No hay venta en curso")
         QtWidgets.QMessageBox.information(self.widget, "Cancelar Venta",
                                "Venta cancelada correctamente.")
 
+    def mostrar_items_venta(self):
+        """Muestra los ítems de la venta actual y su total."""
+        lines = self.cart.lines if self.cart is not None else []
+        table = self.widget.item_sale_table
+        table.setRowCount(len(lines))
+        for row, line in enumerate(lines):
+            values = (line["productUuid"], line["name"], line["price"], line["quantity"],
+                      line["price"] * line["quantity"])
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(str(value)))
+        total = self.cart.total if self.cart is not None else 0
+        self.widget.label_9.setText(f"Total: ${total:,}")
+
+    def mostrar_historial_ventas(self):
+        """Muestra la primera pagina de las ventas registradas, las siguientes se
+        cargan al llegar al final de la tabla."""
+        self.widget.history_sale_table.setRowCount(0)
+        self.history_cursor = None
+        self._cargar_pagina_historial()
+
+    def ordenar_historial(self, column: int):
+        """Ordena el historial por fecha o total, un segundo clic invierte el orden."""
+        sort = HISTORY_SORTS.get(column)
+        if sort is None:
+            return
+        self.history_descending = sort != self.history_sort or not self.history_descending
+        self.history_sort = sort
+        self.mostrar_historial_ventas()
+
+    def _historial_scroll(self, value: int):
+        scrollbar = self.widget.history_sale_table.verticalScrollBar()
+        if self.history_cursor is not None and value >= scrollbar.maximum():
+            self._cargar_pagina_historial()
+
+    def _cargar_pagina_historial(self):
+        sales, self.history_cursor = self.viewmodel.get_sales_page(
+            self.history_sort, self.history_cursor, descending=self.history_descending
+        )
+        table = self.widget.history_sale_table
+        start = table.rowCount()
+        table.setRowCount(start + len(sales))
+        for row, sale in enumerate(sales, start):
+            values = (sale["receipt"],
+                      time.strftime("%d-%m-%Y %H:%M", time.localtime(int(sale["date"]))),
+                      sale["worker"], sale["store"], sale["items"], sale["total"])
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(str(value)))
+
     def mostrar_form_agregar_vendedor(self):
         """Muestra el formulario para agregar un nuevo vendedor."""
         QtWidgets.QMessageBox.information(self.widget, "Agregar Vendedor",
@@ -181,13 +374,41 @@ class View(BaseWidget):
         QtWidgets.QMessageBox.information(self.widget, "Estadísticas",
                                "Función para mostrar estadísticas no implementada.")
 
+    @profiling.action()
+    @metrics.timed()
     def calcular_comisiones(self):
         """Calcula las comisiones de los vendedores."""
         mes = self.widget.month_comboBox.currentData()
         anio = self.widget.year_comboBox.currentData()
+        comisiones = self.viewmodel.get_commissions(mes, anio)
+        table = self.widget.comission_table
+        table.setRowCount(len(comisiones))
+        for row, comision in enumerate(comisiones):
+            values = (comision["name"], comision["total"], comision["saleCount"],
+                      comision["commission"])
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(str(value)))
 
         QtWidgets.QMessageBox.information(
             self.widget,
             "Comisiones",
             f"Comisiones para {self.widget.month_comboBox.currentText()} de {anio} calculadas."
         )
+
+def _actualizar_combo(combo, items: dict):
+    # Agrega, cambia y quita solo los items del lote, "reset" los reemplaza todos
+    if "reset" in items:
+        combo.clear()
+        for item in items["reset"]:
+            combo.addItem(item["label"], item["uuid"])
+        return
+    for uuid in items["removed"]:
+        index = combo.findData(uuid)
+        if index >= 0:
+            combo.removeItem(index)
+    for item in items["changed"]:
+        index = combo.findData(item["uuid"])
+        if index >= 0:
+            combo.setItemText(index, item["label"])
+    for item in items["added"]:
+        combo.addItem(item["label"], item["uuid"])
@@ -1,78 +1,393 @@
-from .model import Model, Store, Worker, Product, Manager
+import time
+
+from . import metrics, reports
+from .auth import Authenticator
+from .cache import LruCache, memoized
+from .events import Change
+from .history import SalesHistory
+from .model import Cart, Model, Store, Worker, Product, Manager
+from .search import IncrementalSearch
+
+# Share of each sale's total paid to the worker who made it
+COMMISSION_RATE = 0.05
+# Products and workers listed as the best of the month
+REPORT_TOP = 10
+# Rows of the sale history fetched at a time
+SALES_PAGE_SIZE = 200
 
 
 class ViewModel:
-    def __init__(self, model: Model):
+    def __init__(self, model: Model, cache_bytes: int = 32 * 2 ** 20):
         self._model = model
+        self.cache = LruCache(cache_bytes)
+        self._search = IncrementalSearch(self)
+        self.auth = Authenticator(model)
+        self.history = SalesHistory(model, model.sale_total)
+        # Called with the diff of every batch of changes, see _forward_changes
+        self.change_listeners: list = []
+        model.events.subscribe(self._forward_changes)
+
+    def schedule_changes(self, schedule):
+        """Batches the changes until ``schedule`` (called with the function that
+        delivers them) runs it, see package/events.py."""
+        self._model.events.schedule = schedule
 
     def add_store(self, store: Store):
-        pass
+        return self._model.add_store(store)
 
     def add_worker(self, worker: Worker):
-        pass
+        return self._model.add_worker(worker)
 
     def add_product(self, product: Product):
-        pass
+        return self._model.add_product(product)
 
-    def get_stores(self) -> list:
-        pass
+    def get_stores(self) -> tuple:
+        return self._model.get_stores()
 
-    def get_workers(self) -> list:
-        pass
+    def get_workers(self) -> tuple:
+        return self._model.get_workers()
 
-    def get_products(self) -> list:
-        pass
+    def get_products(self) -> tuple:
+        return self._model.get_products()
 
     def edit_store(self, store_uuid: str, store: Store):
-        pass
+        self._model.edit_store(store_uuid, store)
 
     def edit_worker(self, worker_uuid: str, worker: Worker):
-        pass
+        self._model.edit_worker(worker_uuid, worker)
 
     def edit_product(self, product_uuid: str, product: Product):
-        pass
+        self._model.edit_product(product_uuid, product)
 
     def delete_store(self, store_uuid: str):
-        pass
+        self._model.delete_store(store_uuid)
 
     def delete_worker(self, worker_uuid: str):
-        pass
+        self._model.delete_worker(worker_uuid)
 
     def delete_product(self, product_uuid: str):
-        pass
+        self._model.delete_product(product_uuid)
 
     def add_product_to_store(self, store_uuid: str, product_uuid: str):
-        pass
+        self._model.add_product_to_store(store_uuid, product_uuid)
 
     def get_products_in_store(self, store_uuid: str):
-        pass
+        return self._model.get_products_in_store(store_uuid)
 
     def edit_product_stock(self, store_uuid: str, product_uuid: str, stock: int):
-        pass
+        self._model.edit_product_stock(store_uuid, product_uuid, stock)
 
     def delete_product_in_store(self, store_uuid: str, product_uuid: str):
-        pass
+        self._model.delete_product_in_store(store_uuid, product_uuid)
+
+    def set_stock_threshold(self, store_uuid: str, product_uuid: str, threshold: int | None):
+        self._model.set_stock_threshold(store_uuid, product_uuid, threshold)
+
+    def get_low_stock(self, store_uuid: str | None = None) -> list[dict]:
+        return self._model.low_stock(store_uuid)
+
+    def get_reorder_report(self, window_days: int = 30, lead_days: int = 7,
+                           cover_days: int = 30) -> list[dict]:
+        return self._model.reorder_report(window_days, lead_days, cover_days)
 
     def add_worker_to_store(self, store_uuid: str, worker_uuid: str):
-        pass
+        self._model.add_worker_to_store(store_uuid, worker_uuid)
 
     def get_workers_in_store(self, store_uuid: str):
-        pass
+        return self._model.get_workers_in_store(store_uuid)
 
     def edit_worker_sales(self, store_uuid: str, worker_uuid: str, sales: int):
-        pass
+        self._model.edit_worker_sales(store_uuid, worker_uuid, sales)
 
     def delete_worker_in_store(self, store_uuid: str, worker_uuid: str):
-        pass
+        self._model.delete_worker_in_store(store_uuid, worker_uuid)
 
     def add_manager(self, identification: str, manager: Manager):
-        pass
+        return self._model.add_manager(identification, manager)
 
-    def get_managers(self) -> list:
-        pass
+    def get_managers(self) -> tuple:
+        return self._model.get_managers()
 
     def edit_manager(self, manager_uuid: str, manager: Manager):
-        pass
+        self._model.edit_manager(manager_uuid, manager)
 
     def delete_manager(self, manager_uuid: str):
-        pass
+        self._model.delete_manager(manager_uuid)
+
+    @metrics.timed()
+    @memoized("products", "stores")
+    def search_products(self, category: str | None = None, brand: str | None = None,
+                        min_price: int | None = None, max_price: int | None = None) -> list[dict]:
+        """Rows of the inventory table: every product in every store matching the filters."""
+        query = self._model.query("stock")
+        if category not in (None, "Todos"):
+            query = query.where(category=category)
+        if min_price is not None or max_price is not None:
+            query = query.where(price=(min_price, max_price))
+        if brand:
+            brand = brand.lower()
+            query = query.filter(lambda row: brand in row["brand"].lower(), "brand contains")
+        return [{
+            "uuid": row["uuid"],
+            "name": f"{row['brand']} {row['model']}",
+            "category": row["category"],
+            "brand": row["brand"],
+            "price": row["price"],
+            "stock": row["inStock"],
+            "store": row["store"]
+        } for row in query.run()]
+
+    @metrics.timed()
+    def search_incremental(self, category: str | None = None, brand: str | None = None,
+                           min_price: int | None = None, max_price: int | None = None,
+                           cancelled=None) -> list[dict] | None:
+        """Same rows as search_products, refined from the previous call when the
+        filters only narrow it. Returns None if ``cancelled()`` became true."""
+        return self._search.run(category, brand, min_price, max_price, cancelled)
+
+    def data_versions(self, *keys: str) -> tuple:
+        versions = self._model.snapshot().versions
+        return tuple(versions.get(key, 0) for key in keys)
+
+    @metrics.timed()
+    @memoized("products", "specs")
+    def search_by_specs(self, category: str, min_price: int | None = None,
+                        max_price: int | None = None, **criteria) -> list[dict]:
+        """Products of a category filtered by their specs, through the spec indexes."""
+        return self._model.find_products(category, min_price, max_price, **criteria)
+
+    def get_compatible(self, product_uuid: str, category: str) -> list[dict]:
+        return self._model.compatible_products(product_uuid, category)
+
+    def complete_build(self, store_uuid: str, budget: int,
+                       chosen: dict[str, str] | None = None) -> dict | None:
+        return self._model.complete_build(store_uuid, budget, chosen)
+
+    @memoized("stores")
+    def get_shops(self) -> list[dict]:
+        """Items of the store combo box."""
+        return [_shop_item(store) for store in self._model.snapshot()["stores"]]
+
+    @memoized("products")
+    def get_components(self) -> list[dict]:
+        """Items of the component combo box."""
+        return [_component_item(product) for product in self._model.snapshot()["products"]]
+
+    @memoized("workers", "stores")
+    def get_salesmen(self) -> list[dict]:
+        """Workers of every store, for the seller combo box and the salesman table."""
+        data = self._model.snapshot()
+        workers = {worker["uuid"]: worker for worker in data["workers"]}
+        rows = []
+        for store in data["stores"]:
+            for item in store["workers"]:
+                worker = workers.get(item["uuid"])
+                if worker is None:
+                    continue
+                rows.append({
+                    "uuid": worker["uuid"],
+                    "name": f"{worker['name']} {worker['lastName']}",
+                    "mail": worker["mail"],
+                    "phone": worker["phone"],
+                    "store": store["name"],
+                    "storeUuid": store["uuid"]
+                })
+        return rows
+
+    @metrics.timed()
+    def get_sales_page(self, sort: str = "date", after: tuple | None = None,
+                       limit: int = SALES_PAGE_SIZE, first: tuple[int, int] | None = None,
+                       last: tuple[int, int] | None = None,
+                       descending: bool = True) -> tuple[list[dict], tuple | None]:
+        """A page of rows of the sale history table, sorted by "date" or "total",
+        and the cursor to pass as ``after`` for the next one (None on the last
+        page). ``first`` and ``last`` limit it to a range of (year, month)."""
+        sales, cursor = self.history.page(sort, after, limit, first, last, descending)
+        workers, stores = self._names()
+        return [{
+            "uuid": sale["uuid"],
+            "receipt": sale["receipt"],
+            "date": sale["createdAt"],
+            "worker": workers.get(sale["workerUuid"], ""),
+            "store": stores.get(store_uuid, ""),
+            "items": sum(line["quantity"] for line in sale["lines"]),
+            "total": self._model.sale_total(sale)
+        } for store_uuid, sale in sales], cursor
+
+    @memoized("workers", "stores")
+    def _names(self) -> tuple[dict[str, str], dict[str, str]]:
+        data = self._model.snapshot()
+        return (
+            {worker["uuid"]: f"{worker['name']} {worker['lastName']}"
+             for worker in data["workers"]},
+            {store["uuid"]: store["name"] for store in data["stores"]}
+        )
+
+    def _forward_changes(self, changes: list[Change]):
+        # Turns a batch of changes into what each widget has to update:
+        #   "shops", "components": {"reset", "added", "changed", "removed"} items of
+        #       the combo box (reset: every item, the collection was reloaded)
+        #   "salesmen": the seller combo box and the salesman table are stale
+        #   "stock", "sales": uuids of the stores whose stock or sales changed (None
+        #       when the stores were reloaded)
+        data = self._model.snapshot()
+        diff: dict = {}
+        for change in changes:
+            if change.entity in ("stores", "products"):
+                name = "shops" if change.entity == "stores" else "components"
+                items = diff.setdefault(name, {"added": [], "changed": [], "removed": []})
+                if change.kind == "reloaded":
+                    items["reset"] = True
+                else:
+                    items[change.kind].append(change.uuid)
+            # A sale only changes the saleCount of the store's worker
+            if change.entity == "workers" or change.entity == "stores.workers" and (
+                    change.kind != "changed") or change.entity == "stores" and (
+                    change.kind in ("reloaded", "removed") or "name" in change.fields):
+                diff["salesmen"] = True
+            if change.entity in ("stores.products", "stores.sales") or (
+                    change.entity == "stores" and change.kind == "reloaded"):
+                key = "sales" if change.entity == "stores.sales" else "stock"
+                stores = diff.setdefault(key, [])
+                if change.parent not in stores:
+                    stores.append(change.parent)
+        for name, key, item in (("shops", "stores", _shop_item),
+                                ("components", "products", _component_item)):
+            items = diff.get(name)
+            if items is None:
+                continue
+            if items.pop("reset", False):
+                diff[name] = {"reset": [item(record) for record in data[key]]}
+                continue
+            # Only the records of the batch are looked up
+            wanted = set(items["added"]) | set(items["changed"])
+            records = {record["uuid"]: record for record in data[key]
+                       if record["uuid"] in wanted} if wanted else {}
+            for kind in ("added", "changed"):
+                items[kind] = [item(records[uuid]) for uuid in items[kind] if uuid in records]
+        for listener in self.change_listeners:
+            listener(diff)
+
+    def get_changes(self, entity_uuid: str | None = None, start: int | None = None,
+                    end: int | None = None) -> list[dict]:
+        return self._model.get_changes(entity_uuid, start, end)
+
+    def get_price_history(self, product_uuid: str, start: int | None = None,
+                          end: int | None = None) -> list[tuple[int, int]]:
+        return self._model.price_history(product_uuid, start, end)
+
+    def login(self, identification: str, password: str) -> str | None:
+        return self.auth.login(identification, password)
+
+    def logout(self, token: str):
+        self.auth.logout(token)
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
+
+    def open_sale(self, store_uuid: str, worker_uuid: str, client: str) -> Cart:
+        return self._model.open_cart(store_uuid, worker_uuid, client)
+
+    def add_sale_item(self, cart: Cart, product_uuid: str, quantity: int):
+        self._model.add_cart_line(cart, product_uuid, quantity)
+
+    def finalize_sale(self, cart: Cart) -> dict:
+        return self._model.finalize_cart(cart)
+
+    @metrics.timed()
+    @memoized("workers", "stores")
+    def get_commissions(self, month: int | None = None, year: int | None = None) -> list[dict]:
+        """Rows of the commission table, one per worker and store, from the sales
+        made in the given month and year."""
+        data = self._model.snapshot()
+        workers = {worker["uuid"]: worker for worker in data["workers"]}
+        query = self._model.query("sales")
+        if year is not None:
+            # The dates of the month (or year) are a range of the ledgers
+            first, last = (month, month) if month is not None else (1, 12)
+            query = query.where(createdAt=(
+                int(time.mktime((year, first, 1, 0, 0, 0, 0, 0, -1))),
+                int(time.mktime((year + last // 12, last % 12 + 1, 1, 0, 0, 0, 0, 0, -1))) - 1
+            ))
+        elif month is not None:
+            query = query.filter(lambda row: time.localtime(row["createdAt"]).tm_mon == month,
+                                 "month")
+        totals: dict[str, dict[str, list[int]]] = {}
+        for row in query.group_by("storeUuid", "workerUuid", total=("sum", "total"),
+                                  saleCount=("count",)).run():
+            totals.setdefault(row["storeUuid"], {})[row["workerUuid"]] = [row["total"],
+                                                                         row["saleCount"]]
+        rows = []
+        for store in data["stores"]:
+            rows += _commission_rows(store, totals.get(store["uuid"], {}), workers)
+        return rows
+
+    @metrics.timed()
+    @memoized("workers", "stores", "products")
+    def get_monthly_report(self, month: int, year: int, max_workers: int | None = None) -> dict:
+        """End of month report: revenue and sales of every store, units sold per
+        category, best selling products and workers and every commission."""
+        start = int(time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1)))
+        end = int(time.mktime((year + month // 12, month % 12 + 1, 1, 0, 0, 0, 0, 0, -1)))
+        summaries = self._model.summarize_sales(start, end, max_workers)
+        merged = reports.merge(summaries)
+        data = self._model.snapshot()
+        workers = {worker["uuid"]: worker for worker in data["workers"]}
+        products = {product["uuid"]: product for product in data["products"]}
+        stores = {store["uuid"]: store for store in data["stores"]}
+        commissions = []
+        for summary in summaries:
+            commissions += _commission_rows(stores[summary["storeUuid"]], summary["workers"],
+                                            workers)
+        best = sorted(merged["products"].items(), key=lambda item: item[1], reverse=True)
+        return {
+            "revenue": merged["revenue"],
+            "saleCount": merged["saleCount"],
+            "stores": [{
+                "uuid": summary["storeUuid"],
+                "name": stores[summary["storeUuid"]]["name"],
+                "revenue": summary["revenue"],
+                "saleCount": summary["saleCount"]
+            } for summary in summaries],
+            "units": merged["units"],
+            "topProducts": [{
+                "uuid": product_uuid,
+                "name": (f"{products[product_uuid]['brand']} {products[product_uuid]['model']}"
+                         if product_uuid in products else ""),
+                "units": units
+            } for product_uuid, units in best[:REPORT_TOP]],
+            "topSellers": sorted(commissions, key=lambda row: row["total"],
+                                 reverse=True)[:REPORT_TOP],
+            "commissions": commissions
+        }
+
+
+def _shop_item(store: dict) -> dict:
+    return {"uuid": store["uuid"], "label": f"{store['name']} - {store['address']}"}
+
+
+def _component_item(product: dict) -> dict:
+    return {
+        "uuid": product["uuid"],
+        "label": f"{product['brand']} {product['model']} - {product['category']}"
+    }
+
+
+def _commission_rows(store: dict, totals: dict[str, list[int]],
+                     workers: dict[str, dict]) -> list[dict]:
+    # One row per worker of the store, from {worker uuid: [total, saleCount]}
+    rows = []
+    for item in store["workers"]:
+        worker = workers.get(item["uuid"])
+        if worker is None:
+            continue
+        total, sale_count = totals.get(item["uuid"], (0, 0))
+        rows.append({
+            "uuid": worker["uuid"],
+            "name": f"{worker['name']} {worker['lastName']}",
+            "store": store["name"],
+            "total": total,
+            "saleCount": sale_count,
+            "commission": round(total * COMMISSION_RATE)
+        })
+    return rows
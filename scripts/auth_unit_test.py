@@ -0,0 +1,77 @@
+# Manager login: hashed storage, sessions and the rehash of plain text passwords.
+#   python -m scripts.auth_unit_test       or with pytest
+
+import os
+import tempfile
+
+from package import JsonStorage, auth
+from package.auth import Authenticator
+from package.model import Manager, Model
+
+
+def _manager(password: str) -> Manager:
+    return Manager("Matias", "Barrientos", "912345678", "matias.barrientos@it.tecnopc.cl", password)
+
+
+def test_login():
+    with tempfile.TemporaryDirectory() as directory:
+        model = Model(JsonStorage(os.path.join(directory, "data.json")))
+        manager_uuid = model.add_manager("12345678", _manager("contraseña123"))
+        stored = model.get_managers()[0]["password"]
+        assert auth.is_hashed(stored) and "contraseña123" not in stored
+
+        authenticator = Authenticator(model)
+        assert authenticator.login("12345678", "otra") is None
+        assert authenticator.login("87654321", "contraseña123") is None
+        token = authenticator.login("12345678", "contraseña123")
+        assert token is not None and authenticator.manager_of(token) == manager_uuid
+        authenticator.logout(token)
+        assert authenticator.manager_of(token) is None
+
+        # A changed password is seen without building a new Authenticator
+        model.set_manager_password(manager_uuid, "nueva")
+        assert authenticator.login("12345678", "contraseña123") is None
+        assert authenticator.login("12345678", "nueva") is not None
+
+
+def test_sessions_expire():
+    with tempfile.TemporaryDirectory() as directory:
+        model = Model(JsonStorage(os.path.join(directory, "data.json")))
+        model.add_manager("12345678", _manager("contraseña123"))
+        authenticator = Authenticator(model, ttl=-1)
+        token = authenticator.login("12345678", "contraseña123")
+        assert authenticator.manager_of(token) is None
+
+
+def test_hashes_are_only_kept_when_imported():
+    with tempfile.TemporaryDirectory() as directory:
+        model = Model(JsonStorage(os.path.join(directory, "data.json")))
+        hashed = auth.hash_password("contraseña123")
+        # Typed in, a string that looks like a hash is still a password
+        typed = model.add_manager("11111111", _manager(hashed))
+        assert model.get_managers()[0]["password"] != hashed
+        assert Authenticator(model).login("11111111", hashed) is not None
+        model.delete_manager(typed)
+
+        model.add_manager("12345678", _manager(hashed), hashed=True)
+        assert model.get_managers()[0]["password"] == hashed
+        assert Authenticator(model).login("12345678", "contraseña123") is not None
+
+
+def test_plain_text_is_rehashed_on_login():
+    with tempfile.TemporaryDirectory() as directory:
+        model = Model(JsonStorage(os.path.join(directory, "data.json")))
+        # As left by the data from before hashing
+        model.add_manager("12345678", _manager("contraseña123"), hashed=True)
+        assert model.get_managers()[0]["password"] == "contraseña123"
+        assert Authenticator(model).login("12345678", "contraseña123") is not None
+        stored = model.get_managers()[0]["password"]
+        assert auth.is_hashed(stored) and auth.verify_password("contraseña123", stored)
+
+
+if __name__ == "__main__":
+    test_login()
+    test_sessions_expire()
+    test_hashes_are_only_kept_when_imported()
+    test_plain_text_is_rehashed_on_login()
+    print("OK")
@@ -0,0 +1,55 @@
+# Incremental backups of the data and verified restores:
+#   python -m scripts.backup backup data.json          changes since the last backup
+#   python -m scripts.backup backup data --full        everything, starts a new chain
+#   python -m scripts.backup list data.json
+#   python -m scripts.backup restore data.json restaurado.json [--number 3]
+# Backups go to data.json.backups (or data/backups for a SegmentStorage directory).
+
+import argparse
+import os
+import time
+
+from package import JsonStorage, SegmentStorage
+from package.backup import BackupSet
+
+
+def open_storage(path: str):
+    return SegmentStorage(path) if os.path.isdir(path) or not path.endswith(".json") \
+        else JsonStorage(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TecnoPC backups")
+    parser.add_argument("command", choices=["backup", "list", "restore"])
+    parser.add_argument("data", help="data.json or a SegmentStorage directory")
+    parser.add_argument("target", nargs="?", help="Where to restore (.json or a directory)")
+    parser.add_argument("--full", action="store_true", help="Back up everything")
+    parser.add_argument("--number", type=int, help="Backup to restore (default: the last)")
+    args = parser.parse_args()
+
+    storage = open_storage(args.data)
+    backups = BackupSet(storage.sidecar("backups"))
+    if args.command == "backup":
+        # The saves replace whole files, so the data read is always a complete version
+        with storage.lock():
+            data = storage.load()
+        entry = backups.backup(data, full=args.full)
+        print(f"Backup {entry['number']}: {entry['changes']} changes, {entry['bytes']} bytes")
+    elif args.command == "list":
+        for entry in backups.backups():
+            created_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["createdAt"]))
+            print(f"{entry['number']:>4} {created_at}"
+                  f" {'full' if entry['full'] else 'incr'} {entry['changes']:>8} changes"
+                  f" {entry['bytes']:>10} bytes")
+    else:
+        if not args.target:
+            parser.error("restore needs a target")
+        if os.path.abspath(args.target) == os.path.abspath(args.data):
+            parser.error("restore to a new location, then replace the data")
+        counts = backups.restore(open_storage(args.target), args.number)
+        print("Restored and verified:",
+              ", ".join(f"{key} {count}" for key, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Round trip of the incremental backups: full backup, changes (the first sale of a
+# store, an edit and a delete), incremental backup and a verified restore.
+#   python -m scripts.backup_unit_test       or with pytest
+
+import json
+import os
+import tempfile
+
+from package import JsonStorage, SegmentStorage
+from package.model import Model, Product, Store, Worker
+
+
+def test_incremental_backup_restores():
+    with tempfile.TemporaryDirectory() as directory:
+        model = Model(SegmentStorage(os.path.join(directory, "data")))
+        store_uuid = model.add_store(Store("Tienda Mirasol", "Calle Mirasol 456", "Santiago",
+                                           "22987654", "mirasol@tecnopc.cl"))
+        worker_uuid = model.add_worker(Worker("Maria", "Gomez", "987654322",
+                                              "maria.gomez@tecnopc.cl"))
+        products = [
+            model.add_product(Product("Kingston", "Fury 16GB", "RAM", "DDR4 3200MHz", 75990)),
+            model.add_product(Product("Samsung", "970 EVO Plus 1TB", "SSD", "NVMe M.2", 129990))
+        ]
+        for product_uuid in products:
+            model.add_product_to_store(store_uuid, product_uuid)
+            model.edit_product_stock(store_uuid, product_uuid, 5)
+        model.add_worker_to_store(store_uuid, worker_uuid)
+        assert model.backup(full=True)["full"]
+
+        cart = model.open_cart(store_uuid, worker_uuid, "Cliente")
+        model.add_cart_line(cart, products[0], 2)
+        model.finalize_cart(cart)
+        model.edit_product(products[1], Product("Samsung", "990 PRO 1TB", "SSD", "NVMe M.2",
+                                                139990))
+        model.delete_product(products[1])
+        entry = model.backup()
+        assert not entry["full"]
+
+        restored = JsonStorage(os.path.join(directory, "restored.json"))
+        counts = model.backups.restore(restored)
+        assert counts == entry["counts"]
+        assert counts["stores.sales"] == 1
+        with restored.lock():
+            data = restored.load()
+        expected = model.snapshot().collections
+        assert [product["uuid"] for product in data["products"]] == [products[0]]
+        # Snapshots hold tuples where the restored file has lists
+        assert json.dumps(data["stores"][0]["sales"], sort_keys=True) == json.dumps(
+            expected["stores"][0]["sales"], sort_keys=True)
+
+
+if __name__ == "__main__":
+    test_incremental_backup_restores()
+    print("OK")
@@ -0,0 +1,97 @@
+# Sale checkout: stock, ledger and sale count written together, stock checked
+# again at finalize and receipt numbers that never repeat between terminals.
+#   python -m scripts.checkout_unit_test       or with pytest
+
+import tempfile
+
+from package import SegmentStorage
+from package.model import Model, Product, Store, Worker
+
+
+def _model(directory: str, terminal: str = "caja-1") -> tuple[Model, str, str, list[str]]:
+    model = Model(SegmentStorage(directory, shared=True), terminal)
+    store_uuid = model.add_store(Store("Tienda Central", "Av. Principal 123", "Santiago",
+                                       "22123456", "central@tecnopc.cl"))
+    worker_uuid = model.add_worker(Worker("Maria", "Gomez", "987654322", "maria.gomez@tecnopc.cl"))
+    model.add_worker_to_store(store_uuid, worker_uuid)
+    product_uuids = [
+        model.add_product(Product("Kingston", "Fury 16GB", "RAM", "DDR4 3200MHz", 75990)),
+        model.add_product(Product("Samsung", "970 EVO Plus 1TB", "SSD", "NVMe M.2", 129990))
+    ]
+    for product_uuid in product_uuids:
+        model.add_product_to_store(store_uuid, product_uuid)
+        model.edit_product_stock(store_uuid, product_uuid, 3)
+    return model, store_uuid, worker_uuid, product_uuids
+
+
+def _raises(call, message: str):
+    try:
+        call()
+    except ValueError as e:
+        assert str(e) == message, e
+    else:
+        raise AssertionError(f"Expected ValueError: {message}")
+
+
+def test_finalize():
+    with tempfile.TemporaryDirectory() as directory:
+        model, store_uuid, worker_uuid, product_uuids = _model(directory)
+        cart = model.open_cart(store_uuid, worker_uuid, "Cliente")
+        model.add_cart_line(cart, product_uuids[0], 2)
+        model.add_cart_line(cart, product_uuids[1], 1)
+        _raises(lambda: model.add_cart_line(cart, product_uuids[0], 2), "Insufficient stock")
+        # The price is the one of when the line was added
+        model.edit_product(product_uuids[0], Product("Kingston", "Fury 16GB", "RAM",
+                                                     "DDR4 3200MHz", 79990))
+        sale = model.finalize_cart(cart)
+        assert sale["total"] == 2 * 75990 + 129990
+
+        # Everything is in the saved shard
+        reloaded = Model(SegmentStorage(directory))
+        store = reloaded.get_stores()[0]
+        assert [item["inStock"] for item in store["products"]] == [1, 2]
+        assert store["workers"][0]["saleCount"] == 1
+        assert [item["uuid"] for item in store["sales"]] == [sale["uuid"]]
+
+        _raises(lambda: model.finalize_cart(model.open_cart(store_uuid, worker_uuid, "")),
+                "Empty cart")
+
+
+def test_stock_is_checked_again_at_finalize():
+    with tempfile.TemporaryDirectory() as directory:
+        model, store_uuid, worker_uuid, product_uuids = _model(directory)
+        first = model.open_cart(store_uuid, worker_uuid, "Cliente")
+        second = model.open_cart(store_uuid, worker_uuid, "Otro cliente")
+        model.add_cart_line(first, product_uuids[0], 2)
+        model.add_cart_line(second, product_uuids[0], 2)
+        model.finalize_cart(first)
+        before = model.snapshot()
+        _raises(lambda: model.finalize_cart(second), "Insufficient stock")
+        # Nothing of the failed sale was written
+        assert model.snapshot().version == before.version
+        assert model.get_stores()[0]["products"][0]["inStock"] == 1
+
+
+def test_receipts_are_unique_between_terminals():
+    with tempfile.TemporaryDirectory() as directory:
+        first, store_uuid, worker_uuid, product_uuids = _model(directory)
+        first.edit_product_stock(store_uuid, product_uuids[0], 1000)
+        second = Model(SegmentStorage(directory, shared=True), "caja-2")
+        receipts = []
+        for i in range(6):
+            model = (first, second)[i % 2]
+            cart = model.open_cart(store_uuid, worker_uuid, "Cliente")
+            model.add_cart_line(cart, product_uuids[0], 1)
+            receipts.append(model.finalize_cart(cart)["receipt"])
+        assert len(set(receipts)) == len(receipts)
+        # Each terminal numbers its sales in order within its block
+        assert receipts[0::2] == sorted(receipts[0::2])
+        assert receipts[1::2] == sorted(receipts[1::2])
+        assert len(Model(SegmentStorage(directory)).get_stores()[0]["sales"]) == 6
+
+
+if __name__ == "__main__":
+    test_finalize()
+    test_stock_is_checked_again_at_finalize()
+    test_receipts_are_unique_between_terminals()
+    print("OK")
@@ -0,0 +1,119 @@
+# PC build compatibility: the rules between parts and complete_build against
+# trying every combination of the store's stock.
+#   python -m scripts.compat_unit_test       or with pytest
+
+import itertools
+import os
+import tempfile
+
+from package import JsonStorage
+from package.compat import BOARD, BUILD, COOLER, CPU, RAM
+from package.model import Model, Product, Store
+
+# (category, model, price, specs), every one in stock but the last
+CATALOG = [
+    (CPU, "Ryzen 5 7600", 219990, {"socket": "AM5", "tdp": 65}),
+    (CPU, "Ryzen 9 7950X", 599990, {"socket": "AM5", "tdp": 170}),
+    (CPU, "Core i5-12400F", 199990, {"socket": "LGA1700", "tdp": 65}),
+    (BOARD, "B650M", 149990, {"socket": "AM5", "memoryType": "DDR5"}),
+    (BOARD, "B760M DDR4", 119990, {"socket": "LGA1700", "memoryType": "DDR4"}),
+    (BOARD, "Z790", 289990, {"socket": "LGA1700", "memoryType": "DDR5"}),
+    (RAM, "Fury 16GB DDR4", 45990, {"memoryType": "DDR4", "capacity": 16}),
+    (RAM, "Fury 32GB DDR5", 109990, {"memoryType": "DDR5", "capacity": 32}),
+    (COOLER, "Hyper 212", 39990, {"tdp": 150}),
+    (COOLER, "Kraken 360", 189990, {"tdp": 250}),
+    ("Tarjeta Gráfica", "RTX 4060", 329990, {"vram": 8}),
+    ("Tarjeta Gráfica", "RX 7800 XT", 549990, {"vram": 16}),
+    ("SSD", "970 EVO Plus 1TB", 129990, {"capacity": 1000}),
+    ("SSD", "NV2 500GB", 34990, {"capacity": 500}),
+    (CPU, "Ryzen 7 7800X3D", 459990, {"socket": "AM5", "tdp": 120}),
+]
+
+
+def _model(directory: str) -> tuple[Model, str, dict[str, str]]:
+    model = Model(JsonStorage(os.path.join(directory, "data.json")))
+    store_uuid = model.add_store(Store("Tienda Central", "Av. Principal 123", "Santiago",
+                                       "22123456", "central@tecnopc.cl"))
+    uuids = {}
+    for i, (category, name, price, specs) in enumerate(CATALOG):
+        product_uuid = model.add_product(Product("Marca", name, category, "", price))
+        model.set_product_specs(product_uuid, specs)
+        model.add_product_to_store(store_uuid, product_uuid)
+        model.edit_product_stock(store_uuid, product_uuid, 0 if i == len(CATALOG) - 1 else 2)
+        uuids[name] = product_uuid
+    return model, store_uuid, uuids
+
+
+def _fits(parts: dict[str, dict]) -> bool:
+    cpu, board, ram, cooler = (parts[category] for category in (CPU, BOARD, RAM, COOLER))
+    return (cpu["socket"] == board["socket"] and ram["memoryType"] == board["memoryType"]
+            and cooler["tdp"] >= cpu["tdp"])
+
+
+def _best_total(budget: int, chosen: dict[str, str], uuids: dict[str, str]) -> int | None:
+    in_stock = CATALOG[:-1]
+    options = [[(name, price, specs) for category, name, price, specs in in_stock
+                if category == wanted and (wanted not in chosen or uuids[name] == chosen[wanted])]
+               for wanted in BUILD]
+    totals = [
+        sum(price for _, price, _ in build) for build in itertools.product(*options)
+        if _fits({category: specs for category, (_, _, specs) in zip(BUILD, build)})
+    ]
+    return max((total for total in totals if total <= budget), default=None)
+
+
+def test_rules():
+    with tempfile.TemporaryDirectory() as directory:
+        model, _, uuids = _model(directory)
+
+        def names(product_uuid, category):
+            return sorted(product["model"] for product in model.compatible_products(
+                product_uuid, category))
+
+        assert names(uuids["Ryzen 5 7600"], BOARD) == ["B650M"]
+        assert names(uuids["Z790"], CPU) == ["Core i5-12400F"]
+        assert names(uuids["Z790"], RAM) == ["Fury 32GB DDR5"]
+        assert names(uuids["Ryzen 9 7950X"], COOLER) == ["Kraken 360"]
+        assert names(uuids["Hyper 212"], CPU) == [
+            "Core i5-12400F", "Ryzen 5 7600", "Ryzen 7 7800X3D"]
+        # No rule between the categories, every product of it
+        assert len(names(uuids["Ryzen 5 7600"], "SSD")) == 2
+
+        # A spec change moves the product to its new class
+        model.set_product_specs(uuids["Z790"], {"socket": "AM5", "memoryType": "DDR5"})
+        assert names(uuids["Ryzen 5 7600"], BOARD) == ["B650M", "Z790"]
+        assert names(uuids["Core i5-12400F"], BOARD) == ["B760M DDR4"]
+
+
+def test_complete_build_is_the_best_that_fits():
+    with tempfile.TemporaryDirectory() as directory:
+        model, store_uuid, uuids = _model(directory)
+        for budget in (800000, 1100000, 1300000, 1600000, 2500000):
+            for chosen in ({}, {CPU: uuids["Core i5-12400F"]}, {RAM: uuids["Fury 32GB DDR5"]}):
+                build = model.complete_build(store_uuid, budget, chosen)
+                expected = _best_total(budget, chosen, uuids)
+                if expected is None:
+                    assert build is None
+                    continue
+                assert build["total"] == expected
+                assert all(build["parts"][category]["uuid"] == part
+                           for category, part in chosen.items())
+                specs = {category: model.get_product_specs(product["uuid"])
+                         for category, product in build["parts"].items()}
+                assert _fits(specs)
+                # The product out of stock is never picked
+                assert uuids["Ryzen 7 7800X3D"] not in {
+                    product["uuid"] for product in build["parts"].values()}
+
+        try:
+            model.complete_build(store_uuid, 2500000, {CPU: "missing"})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Unknown chosen part accepted")
+
+
+if __name__ == "__main__":
+    test_rules()
+    test_complete_build_is_the_best_that_fits()
+    print("OK")
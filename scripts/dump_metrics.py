@@ -0,0 +1,10 @@
+# Prints a metrics file exported with `python main.py --metrics metrics.prom` as a table
+
+import sys
+
+from package import metrics
+
+if len(sys.argv) != 2:
+    sys.exit("usage: python -m scripts.dump_metrics <metrics.prom>")
+metrics.load_prometheus(sys.argv[1])
+print(metrics.dump())
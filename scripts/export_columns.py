@@ -0,0 +1,17 @@
+# Exports the data as columnar .npz partitions for analytics, rewriting only the
+# partitions that changed since the last run:
+# python -m scripts.export_columns export/ [data]
+
+import sys
+
+from package import SegmentStorage, default_storage, export
+
+if len(sys.argv) not in (2, 3):
+    sys.exit("usage: python -m scripts.export_columns <output directory> [SegmentStorage directory]")
+storage = SegmentStorage(sys.argv[2]) if len(sys.argv) == 3 else default_storage()
+with storage.lock():
+    data = storage.stream()
+    stats = export.export(sys.argv[1], data.get("products", []), data.get("workers", []),
+                          data.get("stores", []))
+print(f"{stats['written']} partitions written, {stats['skipped']} unchanged, "
+      f"{stats['removed']} removed")
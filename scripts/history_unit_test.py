@@ -0,0 +1,86 @@
+# Paging of the sale history: every sale exactly once and in order whatever the
+# page size, month ranges and new sales showing up on the next page.
+#   python -m scripts.history_unit_test       or with pytest
+
+import os
+import tempfile
+import time
+from unittest import mock
+
+from package import JsonStorage
+from package.model import Model, Product, Store, Worker
+from package.viewmodel import ViewModel
+
+MONTHS = ((2024, 1), (2024, 2), (2024, 3))
+
+
+def _model(directory: str) -> Model:
+    model = Model(JsonStorage(os.path.join(directory, "data.json")))
+    worker_uuid = model.add_worker(Worker("Maria", "Gomez", "987654322", "maria.gomez@tecnopc.cl"))
+    product_uuid = model.add_product(Product("Kingston", "Fury 16GB", "RAM", "DDR4 3200MHz", 75990))
+    store_uuids = []
+    for i in range(3):
+        store_uuid = model.add_store(Store(f"Tienda {i}", f"Calle {i}", "Santiago", f"2212345{i}",
+                                           f"tienda{i}@tecnopc.cl"))
+        model.add_product_to_store(store_uuid, product_uuid)
+        model.edit_product_stock(store_uuid, product_uuid, 1000)
+        model.add_worker_to_store(store_uuid, worker_uuid)
+        store_uuids.append(store_uuid)
+    # Sales made on given dates, several in the same second to check the ties
+    for year, month in MONTHS:
+        start = time.mktime((year, month, 1, 10, 0, 0, 0, 0, -1))
+        for i in range(17):
+            store_uuid = store_uuids[i % len(store_uuids)]
+            cart = model.open_cart(store_uuid, worker_uuid, "Cliente")
+            model.add_cart_line(cart, product_uuid, 1 + i % 4)
+            with mock.patch("time.time", return_value=start + 3600 * (i // 2)):
+                model.finalize_cart(cart)
+    return model
+
+
+def _all_pages(viewmodel: ViewModel, limit: int, **kwargs) -> list[dict]:
+    rows, cursor = viewmodel.get_sales_page(limit=limit, **kwargs)
+    while cursor is not None:
+        page, cursor = viewmodel.get_sales_page(after=cursor, limit=limit, **kwargs)
+        rows += page
+    return rows
+
+
+def test_pages_cover_every_sale_in_order():
+    with tempfile.TemporaryDirectory() as directory:
+        model = _model(directory)
+        viewmodel = ViewModel(model)
+        sales = [sale for store in model.get_stores() for sale in store["sales"]]
+        by_date = sorted(sales, key=lambda sale: (int(sale["createdAt"]), sale["uuid"]))
+        by_total = sorted(sales, key=lambda sale: (sale["total"], sale["uuid"]))
+
+        for limit in (1, 7, 51, 200):
+            rows = _all_pages(viewmodel, limit)
+            assert [row["uuid"] for row in rows] == [sale["uuid"] for sale in reversed(by_date)]
+            rows = _all_pages(viewmodel, limit, sort="total", descending=False)
+            assert [row["uuid"] for row in rows] == [sale["uuid"] for sale in by_total]
+
+        rows = _all_pages(viewmodel, 5, first=MONTHS[1], last=MONTHS[1], descending=False)
+        assert len(rows) == 17
+        assert all(time.localtime(int(row["date"]))[:2] == MONTHS[1] for row in rows)
+
+
+def test_new_sales_show_up():
+    with tempfile.TemporaryDirectory() as directory:
+        model = _model(directory)
+        viewmodel = ViewModel(model)
+        assert len(_all_pages(viewmodel, 10)) == 51
+
+        store = model.get_stores()[0]
+        cart = model.open_cart(store["uuid"], store["workers"][0]["uuid"], "Cliente")
+        model.add_cart_line(cart, store["products"][0]["uuid"], 1)
+        sale = model.finalize_cart(cart)
+        rows = _all_pages(viewmodel, 10)
+        assert len(rows) == 52 and rows[0]["uuid"] == sale["uuid"]
+        assert len(_all_pages(viewmodel, 10, first=MONTHS[0], last=MONTHS[-1])) == 51
+
+
+if __name__ == "__main__":
+    test_pages_cover_every_sale_in_order()
+    test_new_sales_show_up()
+    print("OK")
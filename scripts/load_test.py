@@ -0,0 +1,55 @@
+# Load test for package.server, start the server first:
+#   python -m package.server --port 8080
+#   python scripts/load_test.py --port 8080 --connections 32 --duration 10 --path /products
+
+import argparse
+import asyncio
+import time
+
+
+async def client(host: str, port: int, path: str, deadline: float, latencies: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: gzip\r\n\r\n".encode()
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    latencies: list[float] = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        client(args.host, args.port, args.path, deadline, latencies)
+        for _ in range(args.connections)
+    ))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"requests:    {len(latencies)}")
+    print(f"requests/s:  {len(latencies) / elapsed:.1f}")
+    print(f"p50 latency: {percentile(0.50):.2f} ms")
+    print(f"p99 latency: {percentile(0.99):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the TecnoPC HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", default="/products")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(run(parser.parse_args()))
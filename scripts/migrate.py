@@ -0,0 +1,39 @@
+# Converts a data file in an old format (json/data.json, with "Tiendas",
+# "Componentes" and "Vendedores") to the current one:
+#   python -m scripts.migrate json/data.json data.json
+#   python -m scripts.migrate json/data.json data            a SegmentStorage directory
+# If it is interrupted, running it again goes on from the last checkpoint.
+
+import argparse
+import os
+
+from package import JsonStorage, SegmentStorage, migration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TecnoPC data migrations")
+    parser.add_argument("source", help="File in an old format")
+    parser.add_argument("target", help="data.json or a SegmentStorage directory")
+    parser.add_argument("--price-scale", type=int, default=1000,
+                        help="Legacy prices, in thousands of pesos, are multiplied by it "
+                             "(default: 1000, pesos)")
+    parser.add_argument("--checkpoint-every", type=int, default=10000)
+    args = parser.parse_args()
+
+    target = SegmentStorage(args.target) if os.path.isdir(args.target) \
+        or not args.target.endswith(".json") else JsonStorage(args.target)
+    work = target.sidecar("migration")
+    if os.path.exists(args.target) and not os.path.exists(work):
+        parser.error("the target already exists")
+    print(f"Version {migration.detect(args.source)} -> {migration.SCHEMA_VERSION}"
+          f"{', resuming' if os.path.exists(work) else ''}")
+    try:
+        counts = migration.migrate(args.source, target, work, args.checkpoint_every,
+                                   args.price_scale)
+    except ValueError as e:
+        parser.error(str(e))
+    print(", ".join(f"{key} {count}" for key, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Migration of the legacy json/data.json: prices in pesos like the ones the model
+# is given for the same products (see model_unit_test.py) and labels without the
+# brand twice.
+#   python -m scripts.migration_unit_test       or with pytest
+
+import os
+import tempfile
+
+from package import SegmentStorage, migration
+from package.model import Model
+
+# Brand, model and price of the products model_unit_test.py adds
+EXPECTED = {
+    "Kingston": ("Fury 16GB", 75990),
+    "Intel": ("Core i5-12400F", 199990),
+    "Samsung": ("970 EVO Plus 1TB", 129990)
+}
+LEGACY = os.path.join(os.path.dirname(__file__), "..", "json", "data.json")
+
+
+def test_legacy_prices_and_names():
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SegmentStorage(os.path.join(directory, "data"))
+        assert migration.detect(LEGACY) == 1
+        counts = migration.migrate(LEGACY, storage)
+        assert counts["products"] == 3 and counts["unlinked"] == 0
+        products = {product["brand"]: product for product in Model(storage).get_products()}
+        for brand, (model, price) in EXPECTED.items():
+            assert products[brand]["model"] == model
+            assert products[brand]["price"] == price
+
+
+def test_current_format_is_rejected():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.json")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write('{"stores": [], "workers": [], "products": [], "managers": []}')
+        assert migration.detect(path) == migration.SCHEMA_VERSION
+        try:
+            migration.migrate(path, SegmentStorage(os.path.join(directory, "data")))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("migrated a file already in the current format")
+
+
+if __name__ == "__main__":
+    test_legacy_prices_and_names()
+    test_current_format_is_rejected()
+    print("OK")
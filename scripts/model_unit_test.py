@@ -1,8 +1,11 @@
-# Warning: Running this script will delete the JSON file stored in the root directory.
+# Warning: Running this script will delete the data directory (and a data.json) in the root directory.
 
 import os
+import shutil
 from package.model import *
-os.remove("data.json")
+shutil.rmtree("data", ignore_errors=True)
+if os.path.exists("data.json"):
+    os.remove("data.json")
 model = Model()
 
 store_uuids = [
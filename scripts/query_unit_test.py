@@ -0,0 +1,98 @@
+# Results of model.query against plain loops over the snapshot, and the access
+# path the planner picks.
+#   python -m scripts.query_unit_test       or with pytest
+
+import os
+import tempfile
+
+from package import JsonStorage
+from package.model import Model, Product, Store, Worker
+
+BRANDS = ("Intel", "AMD", "Kingston", "Samsung")
+CATEGORIES = ("Procesador", "RAM", "SSD")
+
+
+def _model(directory: str) -> Model:
+    model = Model(JsonStorage(os.path.join(directory, "data.json")))
+    store_uuids = [
+        model.add_store(Store(f"Tienda {i}", f"Calle {i}", "Santiago", f"2212345{i}",
+                              f"tienda{i}@tecnopc.cl"))
+        for i in range(3)
+    ]
+    worker_uuid = model.add_worker(Worker("Maria", "Gomez", "987654322", "maria.gomez@tecnopc.cl"))
+    for i in range(90):
+        product_uuid = model.add_product(Product(
+            BRANDS[i % len(BRANDS)], f"Modelo {i}", CATEGORIES[i % len(CATEGORIES)], "",
+            10000 + 1000 * (i * 37 % 90)
+        ))
+        store_uuid = store_uuids[i % len(store_uuids)]
+        model.add_product_to_store(store_uuid, product_uuid)
+        model.edit_product_stock(store_uuid, product_uuid, i % 7)
+    for store_uuid in store_uuids:
+        model.add_worker_to_store(store_uuid, worker_uuid)
+        for product in model.get_products_in_store(store_uuid)[:4]:
+            if product["inStock"]:
+                cart = model.open_cart(store_uuid, worker_uuid, "Cliente")
+                model.add_cart_line(cart, product["uuid"], 1)
+                model.finalize_cart(cart)
+    return model
+
+
+def _uuids(rows) -> list[str]:
+    return sorted(row["uuid"] for row in rows)
+
+
+def test_results_match_loops():
+    with tempfile.TemporaryDirectory() as directory:
+        model = _model(directory)
+        products = model.get_products()
+
+        rows = model.query("products").where(category="RAM", price=(20000, 60000)).run()
+        assert _uuids(rows) == _uuids(
+            product for product in products
+            if product["category"] == "RAM" and 20000 <= product["price"] <= 60000)
+
+        rows = model.query("products").where(brand="AMD").order_by("-price").limit(5).run()
+        expected = sorted((product for product in products if product["brand"] == "AMD"),
+                          key=lambda product: -product["price"])[:5]
+        assert [row["uuid"] for row in rows] == [product["uuid"] for product in expected]
+
+        rows = model.query("stock").where(category="SSD").filter(
+            lambda row: row["inStock"] > 2).run()
+        assert sorted((row["storeUuid"], row["uuid"]) for row in rows) == sorted(
+            (store["uuid"], item["uuid"]) for store in model.get_stores()
+            for item in store["products"] if item["inStock"] > 2
+            and next(p for p in products if p["uuid"] == item["uuid"])["category"] == "SSD")
+
+        rows = model.query("sales").group_by("storeUuid", saleCount=("count",)).run()
+        assert {row["storeUuid"]: row["saleCount"] for row in rows} == {
+            store["uuid"]: len(store["sales"]) for store in model.get_stores() if store["sales"]}
+
+
+def test_plans():
+    with tempfile.TemporaryDirectory() as directory:
+        model = _model(directory)
+
+        # The most selective index is read and the other criterion checked
+        plan = model.query("products").where(category="RAM", brand="AMD").explain()
+        assert plan.splitlines()[0].split()[:2] == ["IndexScan", "products.brand"]
+        assert plan.splitlines()[1].split()[0] == "Filter"
+
+        # No index on the field: a scan
+        plan = model.query("products").where(model="Modelo 3").explain()
+        assert plan.split()[0] == "Scan"
+
+        # Ordered by an indexed field with a small limit, the index is read in
+        # order and the read stops at the limit
+        query = model.query("products").order_by("price").limit(3)
+        assert query.explain().split()[0] == "IndexOrder"
+        assert [row["price"] for row in query.run()] == sorted(
+            product["price"] for product in model.get_products())[:3]
+        # Without a limit every row is sorted
+        assert model.query("products").order_by("price").explain().split()[0] == "Scan"
+
+
+if __name__ == "__main__":
+    test_results_match_loops()
+    test_plans()
+    print("OK")
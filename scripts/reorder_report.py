@@ -0,0 +1,19 @@
+# Prints the reorder report of every store as CSV, meant for a nightly job:
+# python -m scripts.reorder_report [data] > reposicion.csv
+
+import csv
+import sys
+
+from package import SegmentStorage, default_storage
+from package.stock import reorder_report
+
+FIELDS = ("storeUuid", "productUuid", "inStock", "reorderAt", "dailySales", "daysLeft", "quantity")
+
+if len(sys.argv) > 2:
+    sys.exit("usage: python -m scripts.reorder_report [SegmentStorage directory]")
+storage = SegmentStorage(sys.argv[1]) if len(sys.argv) == 2 else default_storage()
+with storage.lock():
+    stores = storage.load().get("stores", [])
+writer = csv.DictWriter(sys.stdout, FIELDS)
+writer.writeheader()
+writer.writerows(reorder_report(stores))
@@ -0,0 +1,79 @@
+# Monthly sale summaries: the process pool gives the same summaries as this
+# process, both match the ledgers and a catalog change reaches the pool.
+#   python -m scripts.reports_unit_test       or with pytest
+
+import tempfile
+import time
+from unittest import mock
+
+from package import SegmentStorage, reports
+from package.model import Model, Product, Store, Worker
+
+JANUARY = int(time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1)))
+FEBRUARY = int(time.mktime((2024, 2, 1, 0, 0, 0, 0, 0, -1)))
+NEXT_YEAR = int(time.mktime((2025, 1, 1, 0, 0, 0, 0, 0, -1)))
+
+
+def _model(directory: str) -> Model:
+    model = Model(SegmentStorage(directory))
+    workers = [model.add_worker(Worker("Maria", "Gomez", "987654322", "maria.gomez@tecnopc.cl")),
+               model.add_worker(Worker("Juan", "Perez", "987654321", "juan.perez@tecnopc.cl"))]
+    products = [
+        model.add_product(Product("Kingston", "Fury 16GB", "RAM", "DDR4 3200MHz", 75990)),
+        model.add_product(Product("Samsung", "970 EVO Plus 1TB", "SSD", "NVMe M.2", 129990))
+    ]
+    for i in range(3):
+        store_uuid = model.add_store(Store(f"Tienda {i}", f"Calle {i}", "Santiago", f"2212345{i}",
+                                           f"tienda{i}@tecnopc.cl"))
+        for product_uuid in products:
+            model.add_product_to_store(store_uuid, product_uuid)
+            model.edit_product_stock(store_uuid, product_uuid, 100)
+        for worker_uuid in workers:
+            model.add_worker_to_store(store_uuid, worker_uuid)
+        # Sales every ten days from January, none in the first store
+        for j in range(6 * i):
+            cart = model.open_cart(store_uuid, workers[j % 2], "Cliente")
+            model.add_cart_line(cart, products[j % 2], 1 + j % 3)
+            with mock.patch("time.time", return_value=JANUARY + 86400 * (10 * j + i)):
+                model.finalize_cart(cart)
+    return model
+
+
+def _expected(model: Model, start: int, end: int) -> dict[str, tuple[int, int]]:
+    expected = {}
+    for store in model.get_stores():
+        sales = [sale for sale in store.get("sales", ()) if start <= int(sale["createdAt"]) < end]
+        expected[store["uuid"]] = (sum(sale["total"] for sale in sales), len(sales))
+    return expected
+
+
+def test_pool_matches_this_process():
+    with tempfile.TemporaryDirectory() as directory:
+        model = _model(directory)
+        try:
+            for start, end in ((JANUARY, FEBRUARY), (FEBRUARY, NEXT_YEAR), (JANUARY, NEXT_YEAR)):
+                local = model.summarize_sales(start, end, max_workers=0)
+                pooled = model.summarize_sales(start, end, max_workers=2)
+                assert pooled == local
+                assert {summary["storeUuid"]: (summary["revenue"], summary["saleCount"])
+                        for summary in local} == _expected(model, start, end)
+            merged = reports.merge(local)
+            assert merged["units"]["RAM"] + merged["units"]["SSD"] == sum(
+                line["quantity"] for store in model.get_stores()
+                for sale in store.get("sales", ()) for line in sale["lines"])
+
+            # A new category is seen by the processes started for the last report
+            product = model.get_products()[0]
+            model.edit_product(product["uuid"], Product(
+                product["brand"], product["model"], "Memoria", product["description"],
+                product["price"]))
+            pooled = model.summarize_sales(JANUARY, NEXT_YEAR, max_workers=2)
+            assert "RAM" not in reports.merge(pooled)["units"]
+            assert pooled == model.summarize_sales(JANUARY, NEXT_YEAR, max_workers=0)
+        finally:
+            model._summary_pool.close()
+
+
+if __name__ == "__main__":
+    test_pool_matches_this_process()
+    print("OK")
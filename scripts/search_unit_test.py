@@ -0,0 +1,65 @@
+# Search-as-you-type: refining the previous rows gives the same rows as a search
+# from scratch, data changes are seen and a cancelled search stops.
+#   python -m scripts.search_unit_test       or with pytest
+
+import os
+import tempfile
+
+from package import JsonStorage
+from package.model import Model, Product, Store
+from package.viewmodel import ViewModel
+
+BRANDS = ("Kingston", "Kingdian", "Samsung", "Intel")
+
+
+def _viewmodel(directory: str) -> tuple[ViewModel, Model, str]:
+    model = Model(JsonStorage(os.path.join(directory, "data.json")))
+    store_uuid = model.add_store(Store("Tienda Central", "Av. Principal 123", "Santiago",
+                                       "22123456", "central@tecnopc.cl"))
+    for i in range(60):
+        product_uuid = model.add_product(Product(BRANDS[i % len(BRANDS)], f"Modelo {i}",
+                                                 ("RAM", "SSD")[i % 2], "", 20000 + 1500 * i))
+        model.add_product_to_store(store_uuid, product_uuid)
+        model.edit_product_stock(store_uuid, product_uuid, i % 5)
+    return ViewModel(model), model, store_uuid
+
+
+def _uuids(rows: list[dict]) -> list[str]:
+    return sorted(row["uuid"] for row in rows)
+
+
+def test_typing_matches_full_searches():
+    with tempfile.TemporaryDirectory() as directory:
+        viewmodel, _, _ = _viewmodel(directory)
+        # Narrowing, widening and switching filters as a user typing would
+        steps = [
+            ("RAM", "", None, None), ("RAM", "k", None, None), ("RAM", "kin", None, None),
+            ("RAM", "king", 30000, None), ("RAM", "kings", 30000, 90000),
+            ("RAM", "king", 30000, 90000), ("Todos", "s", None, None),
+            ("Todos", "sam", None, 50000), (None, "", None, None), ("SSD", "INTEL", 50000, None)
+        ]
+        for category, brand, min_price, max_price in steps:
+            rows = viewmodel.search_incremental(category, brand, min_price, max_price)
+            expected = viewmodel.search_products(category, brand, min_price, max_price)
+            assert _uuids(rows) == _uuids(expected), (category, brand, min_price, max_price)
+
+
+def test_changes_and_cancel():
+    with tempfile.TemporaryDirectory() as directory:
+        viewmodel, model, store_uuid = _viewmodel(directory)
+        before = viewmodel.search_incremental("RAM", "king")
+        product_uuid = model.add_product(Product("Kingston", "Fury Beast", "RAM", "", 59990))
+        model.add_product_to_store(store_uuid, product_uuid)
+        rows = viewmodel.search_incremental("RAM", "kings")
+        assert product_uuid in _uuids(rows) and product_uuid not in _uuids(before)
+
+        assert viewmodel.search_incremental("RAM", "king", cancelled=lambda: True) is None
+        # A cancelled search is not refined from
+        assert _uuids(viewmodel.search_incremental("RAM", "kingst")) == _uuids(
+            viewmodel.search_products("RAM", "kingst"))
+
+
+if __name__ == "__main__":
+    test_typing_matches_full_searches()
+    test_changes_and_cancel()
+    print("OK")
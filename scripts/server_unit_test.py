@@ -0,0 +1,75 @@
+# Statuses of the HTTP/JSON API: Model errors mapped to 404/409/400 and the
+# malformed or oversized requests answered before reaching the Model.
+#   python -m scripts.server_unit_test       or with pytest
+
+import asyncio
+import json
+import os
+import tempfile
+
+from package import JsonStorage
+from package.model import Model
+from package.server import MAX_BODY_SIZE, Server
+
+PRODUCT = {"brand": "Kingston", "model": "Fury 16GB", "category": "RAM",
+           "description": "DDR4 3200MHz", "price": 75990}
+MANAGER = {"identification": "12345678", "name": "Matias", "lastName": "Barrientos",
+           "phone": "912345678", "mail": "matias.barrientos@it.tecnopc.cl",
+           "password": "contraseña123"}
+
+
+async def _request(port: int, raw: bytes) -> tuple[int, dict | None]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    head, _, content = (await reader.read()).partition(b"\r\n\r\n")
+    writer.close()
+    return int(head.split()[1]), json.loads(content) if content else None
+
+
+def _http(method: str, path: str, body=None) -> bytes:
+    content = b"" if body is None else json.dumps(body).encode()
+    return (f"{method} {path} HTTP/1.1\r\nConnection: close\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n").encode() + content
+
+
+async def _statuses(directory: str) -> list[tuple[int, dict | None]]:
+    server = Server(Model(JsonStorage(os.path.join(directory, "data.json"))))
+    server._writes = asyncio.Queue()
+    writer = asyncio.create_task(server._writer())
+    listener = await asyncio.start_server(server._handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        created = await _request(port, _http("POST", "/products", PRODUCT))
+        return [
+            created,
+            await _request(port, _http("GET", f"/products/{created[1]['uuid']}")),
+            await _request(port, _http("GET", "/products/missing")),
+            await _request(port, _http("PUT", "/products/missing", PRODUCT)),
+            await _request(port, _http("POST", "/products", {"brand": "Kingston"})),
+            await _request(port, _http("POST", "/managers", MANAGER)),
+            await _request(port, _http("POST", "/managers", MANAGER)),
+            await _request(port, _http("PATCH", f"/products/{created[1]['uuid']}")),
+            await _request(port, b"garbage\r\n\r\n"),
+            await _request(port, b"POST /products HTTP/1.1\r\nContent-Length: -1\r\n\r\n"),
+            await _request(port, (f"POST /products HTTP/1.1\r\n"
+                                  f"Content-Length: {MAX_BODY_SIZE + 1}\r\n\r\n").encode()),
+        ]
+    finally:
+        listener.close()
+        writer.cancel()
+
+
+def test_statuses():
+    with tempfile.TemporaryDirectory() as directory:
+        responses = asyncio.run(_statuses(directory))
+    assert [status for status, _ in responses] == [
+        201, 200, 404, 404, 400, 201, 409, 405, 400, 400, 413]
+    assert responses[1][1]["model"] == "Fury 16GB"
+    assert responses[6][1] == {"error": "Identification already registered"}
+    assert responses[8][1] == {"error": "Malformed request line"}
+
+
+if __name__ == "__main__":
+    test_statuses()
+    print("OK")
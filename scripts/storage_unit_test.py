@@ -0,0 +1,90 @@
+# Round trips of both storages, the dirty tracking of SegmentStorage and the
+# data.json migration.
+#   python -m scripts.storage_unit_test       or with pytest
+
+import json
+import os
+import tempfile
+
+from package import JsonStorage, SegmentStorage, default_storage, migrate_json
+from package.model import Model, Product, Store, Worker
+
+
+def _fill(model: Model) -> list[str]:
+    store_uuids = [
+        model.add_store(Store("Tienda Central", "Av. Principal 123", "Santiago", "22123456",
+                              "central@tecnopc.cl")),
+        model.add_store(Store("Tienda Mirasol", "Calle Mirasol 456", "Santiago", "22987654",
+                              "mirasol@tecnopc.cl"))
+    ]
+    worker_uuid = model.add_worker(Worker("Maria", "Gomez", "987654322", "maria.gomez@tecnopc.cl"))
+    product_uuid = model.add_product(Product("Kingston", "Fury 16GB", "RAM", "DDR4 3200MHz", 75990))
+    for store_uuid in store_uuids:
+        model.add_product_to_store(store_uuid, product_uuid)
+        model.edit_product_stock(store_uuid, product_uuid, 4)
+        model.add_worker_to_store(store_uuid, worker_uuid)
+    return store_uuids
+
+
+def _dump(model: Model) -> str:
+    # Snapshots hold tuples where a loaded file has lists
+    return json.dumps(dict(model.snapshot().collections), sort_keys=True)
+
+
+def _shards(directory: str) -> dict[str, str]:
+    with open(os.path.join(directory, SegmentStorage.MANIFEST), encoding="utf-8") as file:
+        return {entry["uuid"]: entry["file"] for entry in json.load(file)["stores"]}
+
+
+def test_json_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.json")
+        model = Model(JsonStorage(path))
+        _fill(model)
+        assert _dump(Model(JsonStorage(path))) == _dump(model)
+
+
+def test_segment_round_trip_rewrites_only_dirty_shards():
+    with tempfile.TemporaryDirectory() as directory:
+        model = Model(SegmentStorage(directory))
+        store_uuids = _fill(model)
+        assert _dump(Model(SegmentStorage(directory))) == _dump(model)
+
+        before = _shards(directory)
+        product_uuid = model.get_products()[0]["uuid"]
+        model.edit_product_stock(store_uuids[0], product_uuid, 9)
+        after = _shards(directory)
+        assert after[store_uuids[0]] != before[store_uuids[0]]
+        assert after[store_uuids[1]] == before[store_uuids[1]]
+
+        reloaded = Model(SegmentStorage(directory, stores=[store_uuids[0]]))
+        assert [store["uuid"] for store in reloaded.get_stores()] == [store_uuids[0]]
+        assert reloaded.get_products_in_store(store_uuids[0])[0]["inStock"] == 9
+
+
+def test_migration_is_explicit():
+    with tempfile.TemporaryDirectory() as directory:
+        legacy, data = os.path.join(directory, "data.json"), os.path.join(directory, "data")
+        model = Model(JsonStorage(legacy))
+        _fill(model)
+        expected = _dump(model)
+
+        # Opening it never writes, the legacy file is used as it is
+        storage = default_storage(data, legacy)
+        assert isinstance(storage, JsonStorage)
+        assert not os.path.exists(data)
+
+        assert migrate_json(legacy, data)
+        assert not migrate_json(legacy, data)
+        assert os.path.exists(f"{legacy}.migrated") and not os.path.exists(legacy)
+        assert os.path.exists(os.path.join(data, "prices.bin"))
+        storage = default_storage(data, legacy)
+        assert isinstance(storage, SegmentStorage)
+        assert _dump(Model(storage)) == expected
+
+
+if __name__ == "__main__":
+    test_json_round_trip()
+    test_segment_round_trip_rewrites_only_dirty_shards()
+    test_migration_is_explicit()
+    print("OK")